@@ -0,0 +1 @@
+# This package will contain the custom Scrapy commands of your project.
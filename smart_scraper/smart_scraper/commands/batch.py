@@ -0,0 +1,115 @@
+import os
+import glob
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.conf import arglist_to_dict
+from smart_scraper.utils.config_loader import CONFIGS_DIR, load_config
+
+
+class Command(ScrapyCommand):
+    """
+    Runs MainSpider for several config files at once, in one process.
+    Each config gets its own crawler (delay, headers, Playwright settings and
+    per-domain concurrency) while all of them share a single browser.
+    """
+    requires_project = True
+
+    def syntax(self):
+        return "[options] [config_file ...]"
+
+    def short_desc(self):
+        return "Crawl several (default: all) config files concurrently"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "-a",
+            dest="spargs",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="set spider argument for every config (may be repeated)",
+        )
+        parser.add_argument(
+            "-d",
+            "--output-dir",
+            default="outputs",
+            help="directory of the per-brand feeds (default: outputs)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="emit every product, not only new or changed ones",
+        )
+        parser.add_argument(
+            "--merge",
+            action="store_true",
+            help="also merge every brand into <output-dir>/merged_output.jsonl",
+        )
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        try:
+            opts.spargs = arglist_to_dict(opts.spargs)
+        except ValueError:
+            raise UsageError("Invalid -a value, use -a NAME=VALUE", print_help=False)
+        if opts.full:
+            opts.spargs["full"] = "true"
+        # The configs of a batch share the reactor thread (and tracemalloc): each report would hold them all.
+        if opts.spargs.get("profile") and len(args) != 1:
+            raise UsageError("-a profile profiles one config at a time, give a single config file", print_help=False)
+
+    def run(self, args, opts):
+        config_files = args or sorted(
+            os.path.basename(path) for path in glob.glob(os.path.join(CONFIGS_DIR, "config_*.json"))
+        )
+        self.settings.set("SMART_SHARE_BROWSER", True, priority="cmdline")
+        feed_format = "jsonlines" if opts.merge else "json"
+        feed_extension = "jsonl" if opts.merge else "json"
+
+        feeds = []
+        for config_file in config_files:
+            try:
+                config = load_config(config_file)
+            except ValueError as e:
+                print(f"Skipping {config_file}: {e}")
+                continue
+            # Chained crawls ("-a discover=true") find the URLs of the configs with a discovery block.
+            discover = str(opts.spargs.get("discover", "")).lower() in ("1", "true", "yes")
+            if discover and not config.discovery:
+                print(f"Skipping {config_file}: no discovery block.")
+                continue
+            if not config.base_urls and not discover:
+                print(f"Skipping {config_file}: no base_urls.")
+                continue
+
+            name = os.path.splitext(config_file)[0].removeprefix("config_")
+            feed_path = os.path.join(opts.output_dir, f"{name}_output.{feed_extension}")
+            crawler = self.crawler_process.create_crawler("main_spider")
+            crawler.settings.set("FEEDS", {feed_path: {"format": feed_format, "overwrite": True}}, priority="cmdline")
+            self.crawler_process.crawl(crawler, config_file=config_file, **opts.spargs)
+            feeds.append(feed_path)
+
+        if not feeds:
+            raise UsageError("No config file to crawl.", print_help=False)
+
+        self.crawler_process.start()
+        if self.crawler_process.bootstrap_failed:
+            self.exitcode = 1
+
+        if opts.merge:
+            self.merge_feeds(feeds, os.path.join(opts.output_dir, "merged_output.jsonl"))
+
+    def merge_feeds(self, feeds, merged_path):
+        """Concatenates the per-brand JSON lines feeds into one file."""
+        count = 0
+        with open(merged_path, "w", encoding="utf-8") as merged:
+            for feed_path in feeds:
+                if not os.path.exists(feed_path):
+                    continue
+                with open(feed_path, "r", encoding="utf-8") as feed:
+                    for line in feed:
+                        if line.strip():
+                            merged.write(line)
+                            count += 1
+        print(f"Merge finished. {count} item(s) recorded in '{merged_path}'.")
@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import logging
+import tracemalloc
+from html import unescape
+from bs4 import BeautifulSoup
+from scrapy.commands import ScrapyCommand
+from scrapy.crawler import Crawler
+from scrapy.exceptions import UsageError
+from scrapy.statscollectors import MemoryStatsCollector
+from smart_scraper.items import ProductItem, clean_html_tags
+from smart_scraper.spiders import main_spider
+from smart_scraper.spiders.main_spider import MainSpider
+from smart_scraper.utils.extraction_plan import to_text
+from smart_scraper.utils.jsonld_getter import extract_jsonld_data
+from smart_scraper.utils.page_store import FIXTURES_DIR, PageStore, page_response
+
+# Headline metrics compared with the baseline, True when higher is better.
+HEADLINE_METRICS = {
+    "pages_per_sec": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_memory_kib": False,
+}
+
+# Module functions of main_spider timed as processors.
+TIMED_FUNCTIONS = {
+    "extract_jsonld_data": "jsonld",
+    "fetch_jsonld_data": "jsonld",
+    "is_bot_wall": "is_bot_wall",
+    "compute_discount_percentage": "compute_discount_percentage",
+}
+
+
+# Former clean_html_tags, reference of the --html-cleaner comparison.
+def soup_clean_html_tags(value):
+    if value:
+        value = unescape(unescape(value))
+        soup = BeautifulSoup(value, "html.parser")
+        text = soup.get_text(separator=" ")
+        return " ".join(text.split())
+    return value
+
+
+# Returns the value at quantile q (0..1) of a sorted list.
+def percentile(values, q):
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Timer:
+    """Cumulated time and number of calls per name."""
+
+    def __init__(self):
+        self.totals = {}
+        self.calls = {}
+
+    def add(self, name, elapsed):
+        self.totals[name] = self.totals.get(name, 0.0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def wrap(self, name, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return timed
+
+
+class TimedRule:
+    """Extraction plan rule proxy timing the collection of its field."""
+
+    def __init__(self, rule, timer):
+        self.rule = rule
+        self.name = rule.name
+        self.xpath = rule.xpath
+        self.timer = timer
+
+    def collect(self, response, root):
+        start = time.perf_counter()
+        try:
+            return self.rule.collect(response, root)
+        finally:
+            self.timer.add(self.name, time.perf_counter() - start)
+
+
+class Command(ScrapyCommand):
+    """
+    Replays the HTML pages of the page store of a config (configs/fixtures/<config>.pages.db)
+    through MainSpider.parse, without network nor browser, and reports throughput,
+    per-page latency, time per field and per processor and peak memory.
+    Results are compared with the stored baseline of the config.
+    """
+    requires_project = True
+
+    def syntax(self):
+        return "[options] <config_file>"
+
+    def short_desc(self):
+        return "Benchmark MainSpider.parse on the recorded pages of a config"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--record", action="store_true", help="crawl the config and record its pages (-a pages=record)")
+        parser.add_argument("--pages", type=int, default=0, help="maximum number of pages to record or to replay")
+        parser.add_argument("-n", "--rounds", type=int, default=5, help="number of timed passes over the corpus (default: 5)")
+        parser.add_argument(
+            "--html-cleaner",
+            action="store_true",
+            help="compare clean_html_tags with the BeautifulSoup cleaner on the descriptions of the corpus",
+        )
+        parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.15,
+            help="relative change of a headline metric reported as a regression (default: 0.15)",
+        )
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        config_file = args[0]
+        name = os.path.splitext(os.path.basename(config_file))[0]
+        store_path = os.path.join(self.settings.get("PAGE_STORE_DIR") or FIXTURES_DIR, f"{name}.pages.db")
+        baseline_path = os.path.join(FIXTURES_DIR, f"{name}.baseline.json")
+
+        if opts.record:
+            self.record(config_file, store_path, opts.pages)
+            return
+
+        if not os.path.exists(store_path):
+            raise UsageError(
+                f"No recorded pages for {config_file}, run with --record first (see configs/fixtures/README.md).",
+                print_help=False,
+            )
+        store = PageStore(store_path)
+        records = store.records(opts.pages)
+        store.close()
+        if not records:
+            raise UsageError(f"{store_path} holds no HTML page.", print_help=False)
+
+        if opts.html_cleaner:
+            if not self.bench_html_cleaner(config_file, records, max(opts.rounds, 1)):
+                self.exitcode = 1
+            return
+
+        results = self.benchmark(config_file, records, max(opts.rounds, 1))
+        self.report(results)
+
+        if os.path.exists(baseline_path):
+            with open(baseline_path, "r", encoding="utf-8") as file:
+                baseline = json.load(file)
+            if self.compare(results, baseline, opts.threshold):
+                self.exitcode = 1
+        elif not opts.save_baseline:
+            print(f"No baseline for {config_file}, run with --save-baseline to compare the next runs.")
+        if opts.save_baseline:
+            with open(baseline_path, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=4, sort_keys=True)
+            print(f"Baseline saved in '{baseline_path}'.")
+
+    def record(self, config_file, store_path, max_pages):
+        """Crawls the config with "-a pages=record", which stores every response in its page store."""
+        # Conditional requests would give 304s instead of pages, and recorded items are not emitted.
+        self.settings.set("RECRAWL_ENABLED", False, priority="cmdline")
+        self.settings.set("DEDUP_ENABLED", False, priority="cmdline")
+        if max_pages:
+            self.settings.set("CLOSESPIDER_PAGECOUNT", max_pages, priority="cmdline")
+        self.crawler_process.crawl(MainSpider, config_file=config_file, pages="record")
+        self.crawler_process.start()
+        store = PageStore(store_path)
+        print(f"{len(store)} page(s) recorded in '{store_path}'.")
+        store.close()
+
+    def create_spider(self, config_file):
+        """Creates a MainSpider outside of any crawl (no recrawl store, in-memory stats)."""
+        crawler = Crawler(MainSpider, self.settings)
+        crawler.settings.set("RECRAWL_ENABLED", False, priority="cmdline")
+        crawler.stats = MemoryStatsCollector(crawler)
+        return MainSpider.from_crawler(crawler, config_file=config_file, full="true")
+
+    def replay(self, spider, records, latencies=None):
+        """Runs parse on a fresh response of every record, returns the number of items yielded."""
+        items = 0
+        for record in records:
+            # A response caches its parsed tree, so each pass builds new ones.
+            response = page_response(record)
+            start = time.perf_counter()
+            outputs = list(spider.parse(response))
+            if latencies is not None:
+                latencies.append(time.perf_counter() - start)
+            items += sum(1 for output in outputs if isinstance(output, ProductItem))
+        return items
+
+    def benchmark(self, config_file, records, rounds):
+        spider = self.create_spider(config_file)
+        # Log handling is not part of the parse cost measured here.
+        logging.disable(logging.INFO)
+        try:
+            items = self.replay(spider, records)
+
+            latencies = []
+            for _ in range(rounds):
+                self.replay(spider, records, latencies)
+
+            fields, processors = self.breakdown(spider, records)
+
+            tracemalloc.start()
+            self.replay(spider, records)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        finally:
+            logging.disable(logging.NOTSET)
+
+        latencies.sort()
+        return {
+            "config": config_file,
+            "pages": len(records),
+            "items": items,
+            "rounds": rounds,
+            "pages_per_sec": round(len(latencies) / sum(latencies), 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "peak_memory_kib": round(peak / 1024, 1),
+            "fields_ms": fields,
+            "processors": processors,
+        }
+
+    def breakdown(self, spider, records):
+        """Times each field and processor on one instrumented pass (ms per page)."""
+        plan = spider.extraction_plan
+        field_timer, processor_timer = Timer(), Timer()
+        rules = plan.rules
+        functions = {id(rule): list(rule.functions) for rule in rules}
+        originals = {name: getattr(main_spider, name) for name in TIMED_FUNCTIONS}
+        try:
+            for rule in rules:
+                rule.functions[:] = [processor_timer.wrap(function.__name__, function) for function in rule.functions]
+            plan.rules = [TimedRule(rule, field_timer) for rule in rules]
+            for name, label in TIMED_FUNCTIONS.items():
+                setattr(main_spider, name, processor_timer.wrap(label, originals[name]))
+            self.replay(spider, records)
+        finally:
+            plan.rules = rules
+            for rule in rules:
+                rule.functions[:] = functions[id(rule)]
+            for name, function in originals.items():
+                setattr(main_spider, name, function)
+
+        pages = len(records)
+        fields = {name: round(total * 1000 / pages, 4) for name, total in field_timer.totals.items()}
+        processors = {
+            name: {
+                "ms": round(total * 1000 / pages, 4),
+                "calls": round(processor_timer.calls[name] / pages, 2),
+            }
+            for name, total in processor_timer.totals.items()
+        }
+        return fields, processors
+
+    def bench_html_cleaner(self, config_file, records, rounds):
+        """Times clean_html_tags against the BeautifulSoup cleaner, returns False if their outputs differ."""
+        spider = self.create_spider(config_file)
+        # Raw description fragments, as given to clean_html_tags by the selectors and JSON-LD.
+        fragments = []
+        for record in records:
+            response = page_response(record)
+            for rule in spider.extraction_plan.rules:
+                if rule.name == "product_description" and rule.xpath is not None:
+                    result = rule.xpath(response.selector.root)
+                    fragments += [to_text(node) for node in (result if isinstance(result, list) else [result])]
+            description = extract_jsonld_data(response).get("description")
+            if isinstance(description, str):
+                fragments.append(description)
+        if not fragments:
+            print(f"{config_file}: no description in the corpus.")
+            return True
+
+        timings = {}
+        for name, cleaner in (("beautifulsoup", soup_clean_html_tags), ("clean_html_tags", clean_html_tags)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for fragment in fragments:
+                    cleaner(fragment)
+            timings[name] = (time.perf_counter() - start) / (rounds * len(fragments))
+        mismatches = [f for f in fragments if clean_html_tags(f) != soup_clean_html_tags(f)]
+
+        markup = sum(1 for fragment in fragments if "<" in unescape(unescape(fragment)))
+        print(f"{config_file}: {len(fragments)} description fragment(s), {markup} with markup, {rounds} round(s)")
+        for name, seconds in timings.items():
+            print(f"  {name:<20} {seconds * 1e6:.1f} us/fragment")
+        print(f"  speedup              x{timings['beautifulsoup'] / timings['clean_html_tags']:.1f}")
+        print(f"  mismatches           {len(mismatches)}")
+        for fragment in mismatches[:5]:
+            print(f"    {fragment[:80]!r}: {soup_clean_html_tags(fragment)[:60]!r} != {clean_html_tags(fragment)[:60]!r}")
+        return not mismatches
+
+    def report(self, results):
+        print(f"{results['config']}: {results['pages']} page(s), {results['items']} item(s), {results['rounds']} round(s)")
+        for metric in HEADLINE_METRICS:
+            print(f"  {metric:<20} {results[metric]}")
+        print("  time per field (ms/page):")
+        for name, value in sorted(results["fields_ms"].items(), key=lambda entry: -entry[1]):
+            print(f"    {name:<22} {value}")
+        print("  time per processor (ms/page, calls/page):")
+        for name, value in sorted(results["processors"].items(), key=lambda entry: -entry[1]["ms"]):
+            print(f"    {name:<22} {value['ms']:<10} {value['calls']}")
+
+    def compare(self, results, baseline, threshold):
+        """Prints the changes against the baseline, returns True on a regression."""
+        regression = False
+        print("  compared with baseline:")
+        if results["pages"] != baseline.get("pages"):
+            print(f"    corpus changed ({baseline.get('pages')} -> {results['pages']} pages), save a new baseline.")
+        elif results["items"] != baseline.get("items"):
+            print(f"    REGRESSION items: {baseline.get('items')} -> {results['items']}")
+            regression = True
+        for metric, higher_is_better in HEADLINE_METRICS.items():
+            old, new = baseline.get(metric), results[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION " if worse > threshold else ""
+            print(f"    {flag}{metric:<20} {old} -> {new} ({change:+.1%})")
+            regression = regression or worse > threshold
+        return regression
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import subprocess
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.conf import arglist_to_dict
+from smart_scraper.utils.config_loader import load_config
+from smart_scraper.utils.crawl_metrics import write_metrics
+
+
+class Command(ScrapyCommand):
+    """
+    Splits the base_urls of one config across several worker processes, each one
+    running its own reactor and browser, then merges their feeds and stats.
+    URLs left unfinished by a crashed worker are given to the next round.
+    """
+    requires_project = True
+    requires_crawler_process = False
+
+    def syntax(self):
+        return "[options] <config_file>"
+
+    def short_desc(self):
+        return "Crawl the URLs of one config with several worker processes"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "-a",
+            dest="spargs",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="set spider argument for every worker (may be repeated)",
+        )
+        parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 2, help="number of worker processes")
+        parser.add_argument("-d", "--output-dir", default="outputs", help="output directory (default: outputs)")
+        parser.add_argument("--full", action="store_true", help="emit every product, not only new or changed ones")
+        parser.add_argument("--rounds", type=int, default=3, help="maximum number of rounds re-assigning unfinished URLs")
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        try:
+            opts.spargs = arglist_to_dict(opts.spargs)
+        except ValueError:
+            raise UsageError("Invalid -a value, use -a NAME=VALUE", print_help=False)
+        if opts.full:
+            opts.spargs["full"] = "true"
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        config_file = args[0]
+        name = os.path.splitext(config_file)[0].removeprefix("config_")
+        work_dir = os.path.join(opts.output_dir, f".shards_{name}")
+        os.makedirs(work_dir, exist_ok=True)
+
+        config = load_config(config_file)
+        pending = list(config.iter_urls())
+        if config.removed_urls:
+            print(f"{config.removed_urls} duplicate URL(s) removed from {config_file} (canonical URLs).")
+        if config.invalid_urls:
+            print(f"{config.invalid_urls} invalid URL(s) skipped in {config.manifest_path}.")
+        workers = []
+        for round_number in range(1, opts.rounds + 1):
+            if not pending:
+                break
+            print(f"Round {round_number}: {len(pending)} URL(s) on {min(opts.workers, len(pending))} worker(s).")
+            round_workers = self.start_workers(config_file, pending, opts, work_dir, round_number)
+            for worker in round_workers:
+                worker["process"].wait()
+            workers.extend(round_workers)
+            pending = self.unfinished_urls(round_workers)
+
+        if pending:
+            print(f"{len(pending)} URL(s) still unfinished after {opts.rounds} round(s).")
+            self.exitcode = 1
+
+        feed_path = os.path.join(opts.output_dir, f"{name}_output.jsonl")
+        self.merge_feeds(workers, feed_path)
+        stats = self.merge_stats(workers, os.path.join(opts.output_dir, f"{name}_stats.json"))
+        # Workers do not export metrics, the merged stats are.
+        if self.settings.getbool("METRICS_ENABLED"):
+            write_metrics(self.settings.get("METRICS_DIR"), stats, os.path.splitext(os.path.basename(config_file))[0])
+
+    def start_workers(self, config_file, urls, opts, work_dir, round_number):
+        """Splits the URLs in balanced shards and starts one scrapy process per shard."""
+        count = max(1, min(opts.workers, len(urls)))
+        workers = []
+        for index in range(count):
+            prefix = os.path.join(work_dir, f"round{round_number}_shard{index}")
+            worker = {
+                "urls": urls[index::count],
+                "urls_file": f"{prefix}_urls.txt",
+                "progress_file": f"{prefix}_done.txt",
+                "stats_file": f"{prefix}_stats.json",
+                "feed": f"{prefix}_items.jsonl",
+            }
+            with open(worker["urls_file"], "w", encoding="utf-8") as file:
+                file.write("\n".join(worker["urls"]) + "\n")
+            # A previous attempt of the same shard must not count as progress.
+            for path in (worker["progress_file"], worker["stats_file"]):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            command = [
+                sys.executable, "-m", "scrapy", "crawl", "main_spider",
+                "-a", f"config_file={config_file}",
+                "-a", f"urls_file={worker['urls_file']}",
+                "-a", f"progress_file={worker['progress_file']}",
+                "-a", f"stats_file={worker['stats_file']}",
+                "-O", f"{worker['feed']}:jsonlines",
+            ]
+            for key, value in opts.spargs.items():
+                command += ["-a", f"{key}={value}"]
+            # Workers log like this process (-s LOG_MODE=..., -L ...), from their first line.
+            for name in ("LOG_MODE", "LOG_LEVEL", "LOG_JSON_FILE", "LOG_SAMPLE_RATE"):
+                command += ["-s", f"{name}={self.settings.get(name)}"]
+            command += ["-s", f"LOG_SAMPLE_RATES={json.dumps(self.settings.getdict('LOG_SAMPLE_RATES'))}"]
+            env = dict(
+                os.environ,
+                SMART_SCRAPER_LOG_MODE=self.settings.get("LOG_MODE"),
+                SMART_SCRAPER_LOG_LEVEL=str(self.settings.get("LOG_LEVEL")),
+            )
+            worker["process"] = subprocess.Popen(command, env=env)
+            workers.append(worker)
+        return workers
+
+    def unfinished_urls(self, workers):
+        """Returns the URLs of crashed workers that were not handled."""
+        unfinished = []
+        for worker in workers:
+            if worker["process"].returncode == 0 and os.path.exists(worker["stats_file"]):
+                continue
+            done = set()
+            if os.path.exists(worker["progress_file"]):
+                with open(worker["progress_file"], "r", encoding="utf-8") as file:
+                    done = {line.strip() for line in file}
+            missing = [url for url in worker["urls"] if url not in done]
+            print(f"Worker {worker['urls_file']} exited with {worker['process'].returncode}, {len(missing)} URL(s) re-assigned.")
+            unfinished.extend(missing)
+        return unfinished
+
+    def merge_feeds(self, workers, feed_path):
+        """Concatenates the worker feeds, keeping one item per offer_url."""
+        seen = set()
+        with open(feed_path, "w", encoding="utf-8") as merged:
+            for worker in workers:
+                if not os.path.exists(worker["feed"]):
+                    continue
+                with open(worker["feed"], "r", encoding="utf-8") as feed:
+                    for line in feed:
+                        try:
+                            item = json.loads(line)
+                        except ValueError:
+                            # Last line of a crashed worker may be truncated.
+                            continue
+                        if item.get("offer_url") in seen:
+                            continue
+                        seen.add(item.get("offer_url"))
+                        merged.write(line if line.endswith("\n") else line + "\n")
+        print(f"Merge finished. {len(seen)} item(s) recorded in '{feed_path}'.")
+
+    def merge_stats(self, workers, stats_path):
+        """Sums the numeric stats of every worker (min/max for start and finish times)."""
+        merged = {}
+        for worker in workers:
+            if not os.path.exists(worker["stats_file"]):
+                continue
+            with open(worker["stats_file"], "r", encoding="utf-8") as file:
+                stats = json.load(file)
+            for key, value in stats.items():
+                if key.endswith("/max") and isinstance(value, (int, float)):
+                    merged[key] = max(merged.get(key, value), value)
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    merged[key] = merged.get(key, 0) + value
+                elif key == "start_time":
+                    merged[key] = min(merged.get(key, value), value)
+                elif key == "finish_time":
+                    merged[key] = max(merged.get(key, value), value)
+                else:
+                    merged.setdefault(key, value)
+        merged["shard/workers"] = len(workers)
+        with open(stats_path, "w", encoding="utf-8") as file:
+            json.dump(merged, file, indent=4, sort_keys=True)
+        return merged
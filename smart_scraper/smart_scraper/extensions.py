@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from smart_scraper.utils.crawl_metrics import observe, write_metrics
+from smart_scraper.utils.log_setup import apply_level, sampled_out, setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Page methods that wait (their result is the time waited in ms, or their argument for fixed waits).
+WAIT_METHODS = ("wait_for_timeout", "wait_for_product")
+SCROLL_METHODS = ("scroll_until_stable",)
+
+
+class LogSetup:
+    """
+    Applies the logging settings of the run (LOG_MODE, LOG_LEVEL, LOG_JSON_FILE and
+    LOG_SAMPLE_RATE(S), -s and -L options included) to the root logger handler.
+    """
+
+    def __init__(self, settings):
+        self.level = settings.get("LOG_LEVEL")
+        setup_logging(
+            settings.get("LOG_MODE"),
+            self.level,
+            settings.get("LOG_JSON_FILE") or None,
+            settings.getint("LOG_SAMPLE_RATE"),
+            settings.getdict("LOG_SAMPLE_RATES"),
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler.settings)
+        extension.stats = crawler.stats
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        # Scrapy resets the root logger level once the extensions are loaded.
+        apply_level(self.level)
+
+    def spider_closed(self, spider):
+        dropped = sampled_out()
+        if dropped:
+            self.stats.set_value("log/sampled_out", dropped)
+            logger.info("Log sampling: %s message(s) not written", dropped)
+
+
+class CrawlMetrics:
+    """
+    Records the time each request spends per stage in the crawl stats (see
+    utils/crawl_metrics.py): queueing, HTTP or Playwright download, Playwright waits
+    and scrolls, and item processing (the spider and pipelines record parsing,
+    JSON-LD and HEAD verification). Exports them with the field hit rates to
+    METRICS_DIR/<config>.json and .prom when the spider closes, the .prom file
+    being refreshed every METRICS_INTERVAL seconds during the crawl.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.directory = crawler.settings.get("METRICS_DIR")
+        self.interval = crawler.settings.getfloat("METRICS_INTERVAL")
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        extension = cls(crawler)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(extension.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(extension.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(extension.item_processed, signal=signals.item_scraped)
+        crawler.signals.connect(extension.item_processed, signal=signals.item_dropped)
+        return extension
+
+    def config_name(self, spider):
+        return getattr(spider, "config_name", None) or spider.name
+
+    def exported(self, spider):
+        # Shard workers: the shard command exports the merged stats.
+        return not getattr(spider, "urls_file", None)
+
+    def spider_opened(self, spider):
+        if self.interval and self.exported(spider):
+            self.loop = task.LoopingCall(self.write, spider, True)
+            self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        if self.exported(spider):
+            self.write(spider, False)
+            logger.info("Crawl metrics written to %s.json/.prom", os.path.join(self.directory, self.config_name(spider)))
+
+    def write(self, spider, prometheus_only):
+        try:
+            write_metrics(self.directory, self.stats.get_stats(), self.config_name(spider), prometheus_only)
+        except OSError as e:
+            logger.warning("Cannot write the crawl metrics to %s: %s", self.directory, e)
+
+    def request_scheduled(self, request, spider):
+        request.meta["metrics_scheduled_at"] = time.monotonic()
+
+    def request_reached_downloader(self, request, spider):
+        now = time.monotonic()
+        scheduled_at = request.meta.get("metrics_scheduled_at")
+        if scheduled_at is not None:
+            observe(self.stats, "queue", (now - scheduled_at) * 1000)
+        request.meta["metrics_downloader_at"] = now
+
+    def response_downloaded(self, response, request, spider):
+        """Download time (slot delay included), then the Playwright waits and scrolls it contains."""
+        started_at = request.meta.get("metrics_downloader_at")
+        playwright = request.meta.get("playwright")
+        if started_at is not None:
+            observe(self.stats, "download/playwright" if playwright else "download/http", (time.monotonic() - started_at) * 1000)
+        if playwright:
+            self.observe_page_methods(request.meta.get("playwright_page_methods") or [])
+
+    def observe_page_methods(self, page_methods):
+        waited, scrolled, after_scroll = 0, 0, False
+        for pm in page_methods:
+            name = pm.method if isinstance(pm.method, str) else getattr(pm.method, "__name__", "")
+            if name == "evaluate" and "scroll" in str(pm.args[:1]):
+                after_scroll = True
+                continue
+            if name == "wait_for_timeout" and pm.args:
+                # Fixed wait: the one following a scroll is part of the scrolling.
+                if after_scroll:
+                    scrolled += pm.args[0]
+                else:
+                    waited += pm.args[0]
+            elif name in WAIT_METHODS and isinstance(pm.result, float):
+                waited += pm.result
+            elif name in SCROLL_METHODS and isinstance(pm.result, float):
+                scrolled += pm.result
+            after_scroll = False
+        if waited:
+            observe(self.stats, "playwright/wait", waited)
+        if scrolled:
+            observe(self.stats, "playwright/scroll", scrolled)
+
+    def item_processed(self, item, response, spider, **kwargs):
+        """Time from the item yielded by the spider to the end of the pipelines (scraped or dropped)."""
+        request = getattr(response, "request", None)
+        yielded_at = request.meta.get("metrics_item_at") if request is not None else None
+        if yielded_at is not None:
+            observe(self.stats, "items", (time.monotonic() - yielded_at) * 1000)
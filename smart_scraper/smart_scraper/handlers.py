@@ -0,0 +1,127 @@
+# Define here the download handlers of your Scrapy project
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/download-handlers.html
+
+import asyncio
+from contextvars import ContextVar
+from twisted.internet.defer import DeferredList, maybeDeferred, succeed
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import build_from_crawler, load_object
+from scrapy_playwright.handler import ScrapyPlaywrightDownloadHandler
+
+
+# Scrapy builds one handler per scheme, the Playwright side is shared by crawler
+# so "http" and "https" requests do not launch two browsers. With SMART_SHARE_BROWSER
+# the crawlers of the process with the same PLAYWRIGHT_* settings share the same one (batch runs).
+_playwright_handlers = {}
+
+# Stats of the crawler whose request the shared Playwright handler is downloading.
+_download_stats = ContextVar("download_stats", default=None)
+
+
+class CrawlerStats:
+    """
+    Stats of a shared Playwright handler: the values are counted on the crawler whose
+    request is being downloaded. Browser and page events (playwright/request_count, ...)
+    fire outside of any download and are counted on the crawler that started the browser.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(_download_stats.get() or self.stats, name)
+
+
+class SmartDownloadHandler:
+    """
+    Routes each request to the right downloader.
+    Requests with meta["playwright"] set go through scrapy-playwright, every other
+    request goes through Scrapy's native handler (HTTP/1.1 or HTTP/2, see the
+    SMART_HTTP_HANDLERS setting). Replayed crawls are served from the page store.
+    scrapy-playwright (and Chromium) is only started on the first request that
+    actually needs it, static and replayed crawls never start it.
+    """
+    lazy = False
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.http_handlers = {}
+
+        playwright_settings = tuple(sorted(
+            (name, repr(value)) for name, value in crawler.settings.copy_to_dict().items() if name.startswith("PLAYWRIGHT_")
+        ))
+        owner = "process" if crawler.settings.getbool("SMART_SHARE_BROWSER") else id(crawler)
+        self.shared_key = (owner, playwright_settings)
+        shared = _playwright_handlers.setdefault(self.shared_key, {"handler": None, "launch": None, "users": 0})
+        shared["users"] += 1
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def download_request(self, request, spider):
+        if getattr(spider, "pages", None) == "replay":
+            return self._replay(request, spider)
+        if request.meta.get("playwright"):
+            self.stats.inc_value("smart_download/playwright", spider=spider)
+            # Pooled pages go to the requests being downloaded, not to the queued ones.
+            if getattr(spider, "browser_pool", None):
+                spider.browser_pool.checkout(request.meta)
+            return deferred_from_coro(self._download_with_playwright(request, spider))
+
+        self.stats.inc_value("smart_download/http", spider=spider)
+        return self._get_http_handler(request).download_request(request, spider)
+
+    # Serves a request from the page store of the spider ("-a pages=replay"): no network, no browser.
+    def _replay(self, request, spider):
+        response = spider.page_store.response(request)
+        if response is None:
+            self.stats.inc_value("page_store/missing", spider=spider)
+            raise IgnoreRequest(f"Not in the page store: {request.url}")
+        self.stats.inc_value("page_store/replayed", spider=spider)
+        return succeed(response)
+
+    # Loads the native handler of the request scheme on first use.
+    def _get_http_handler(self, request):
+        scheme = urlparse_cached(request).scheme
+        if scheme not in self.http_handlers:
+            handlers = self.crawler.settings.getdict("SMART_HTTP_HANDLERS")
+            path = handlers.get(scheme, "scrapy.core.downloader.handlers.http11.HTTP11DownloadHandler")
+            self.http_handlers[scheme] = build_from_crawler(load_object(path), self.crawler)
+        return self.http_handlers[scheme]
+
+    async def _download_with_playwright(self, request, spider):
+        handler = await self._get_playwright_handler()
+        _download_stats.set(self.stats)
+        return await maybe_deferred_to_future(handler.download_request(request, spider))
+
+    # Returns the shared Playwright handler, created and launched by the first Playwright request.
+    async def _get_playwright_handler(self):
+        shared = _playwright_handlers[self.shared_key]
+        if shared["launch"] is None:
+            handler = ScrapyPlaywrightDownloadHandler.from_crawler(self.crawler)
+            handler.stats = CrawlerStats(self.crawler.stats)
+            # engine_started is over: its launch handler runs now (the browser itself on the first page).
+            self.crawler.signals.disconnect(handler._engine_started, signal=signals.engine_started)
+            shared["handler"] = handler
+            shared["launch"] = asyncio.ensure_future(maybe_deferred_to_future(handler._engine_started()))
+        # A cancelled download must not cancel the launch the other requests wait for.
+        await asyncio.shield(shared["launch"])
+        return shared["handler"]
+
+    def close(self):
+        closing = [maybeDeferred(handler.close) for handler in self.http_handlers.values() if hasattr(handler, "close")]
+        shared = _playwright_handlers[self.shared_key]
+        shared["users"] -= 1
+        # The last handler using the browser closes it.
+        if shared["users"] <= 0:
+            del _playwright_handlers[self.shared_key]
+            if shared["handler"] is not None:
+                closing.append(maybeDeferred(shared["handler"].close))
+        return DeferredList(closing)
@@ -4,11 +4,10 @@
 # https://docs.scrapy.org/en/latest/topics/items.html
 
 import scrapy
-import requests
 from scrapy.loader import ItemLoader
 from itemloaders.processors import Join, MapCompose, TakeFirst, Identity, Compose
-from bs4 import BeautifulSoup
 from html import unescape
+from smart_scraper.utils.html_text import html_to_text
 
 
 class ProductItem(scrapy.Item):
@@ -98,17 +97,6 @@ def find_gender(str_val):
         return "Unspecified"
     return str_val
 
-# Checks if url is valid and provides an image.
-def verify_vendor_icon(url):
-    try:
-        response = requests.head(url, timeout=5)
-        if response.status_code == 200:
-            return url
-        else:
-            return None
-    except Exception:
-        return None
-
 # Ensure that a field contains only urls.
 def filter_valid_urls(value):
     if value and (value.startswith("http://") or value.startswith("https://")):
@@ -127,9 +115,7 @@ def remove_duplicates(urls):
 def clean_html_tags(value):
     if value:
         value = unescape(unescape(value))
-        soup = BeautifulSoup(value, "html.parser")
-        text = soup.get_text(separator=" ")
-        return " ".join(text.split())
+        return html_to_text(value)
     return value
 
 
@@ -150,7 +136,7 @@ class ProductLoader(ItemLoader):
     product_name_in = MapCompose(clean_text)
     tags_in = MapCompose(clean_text, ensure_list)
     tags_out = Identity()
-    vendor_icon_url_in = MapCompose(clean_text, verify_vendor_icon)
+    vendor_icon_url_in = MapCompose(clean_text)
     vendor_name_in = MapCompose(clean_text)
     vendor_url_in = MapCompose(clean_text)
 
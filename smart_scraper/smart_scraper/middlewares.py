@@ -3,7 +3,10 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import time
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from smart_scraper.utils.domain_throttle import DomainThrottle, parse_retry_after
 
 
 # useful for handling different item types with a single interface
@@ -57,48 +60,152 @@ class SmartScraperSpiderMiddleware:
         spider.logger.info("Spider opened: %s" % spider.name)
 
 
+class ProfilingSpiderMiddleware:
+    """
+    Profiling ("-a profile=cpu|alloc"): runs each step of a callback (up to the next
+    request or item it yields) as a profiler step named after the callback, so that
+    the pipelines processing its items are left out.
+    """
+
+    def process_spider_output(self, response, result, spider):
+        profiler = getattr(spider, "profiler", None)
+        if profiler is None:
+            return result
+        callback = response.request.callback or spider._parse
+        return self.profiled(result, profiler, f"callback/{getattr(callback, '__name__', 'parse')}")
+
+    def profiled(self, result, profiler, name):
+        iterator = iter(result)
+        call = True
+        while True:
+            with profiler.step(name, call):
+                call = False
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    return
+            yield output
+
+
 class SmartScraperDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """
+    Adaptive per-domain throttle (see SMART_THROTTLE_* settings). Blocked responses
+    (403/429/503) lower the concurrency and raise the delay of their downloader slot,
+    at least to Retry-After or an exponential backoff, and the URL goes back to the
+    scheduler to be retried at that pace.
+    Clean responses ramp the slot back up to its configured concurrency and delay.
+    The throttle state outlives the slot: Scrapy drops idle slots and creates them
+    again with the default settings, the state is then applied to the new slot.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.block_codes = set(settings.getlist("SMART_THROTTLE_BLOCK_CODES"))
+        self.max_delay = settings.getfloat("SMART_THROTTLE_MAX_DELAY")
+        self.ramp_up_after = settings.getint("SMART_THROTTLE_RAMP_UP_AFTER")
+        self.max_retries = settings.getint("SMART_THROTTLE_MAX_RETRIES")
+        self.backoff = settings.getfloat("SMART_THROTTLE_BACKOFF")
+        self.priority_adjust = settings.getint("RETRY_PRIORITY_ADJUST")
+        self.domains = {}
+        # Downloader slot holding the throttle values of each domain.
+        self.slots = {}
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        if not crawler.settings.getbool("SMART_THROTTLE_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
+    def get_slot(self, request):
+        """Returns the downloader slot key of a request and its throttle (created with the slot settings)."""
+        downloader = self.crawler.engine.downloader
+        key = downloader.get_slot_key(request)
+        slot = downloader.slots.get(key)
+        if slot is None:
+            return key, None, None
+        if key not in self.domains:
+            self.domains[key] = DomainThrottle(slot.concurrency, slot.delay, self.max_delay, self.ramp_up_after)
+            self.slots[key] = slot
+        return key, slot, self.domains[key]
+
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
+        key, slot, throttle = self.get_slot(request)
+        # The slot was garbage-collected while idle and created again since the last request.
+        if slot is not None and self.slots.get(key) is not slot:
+            self.slots[key] = slot
+            slot.concurrency = throttle.concurrency
+            slot.delay = throttle.delay
+            self.crawler.stats.inc_value("throttle/restored")
+            spider.logger.debug("Throttle %s restored on a new downloader slot", key)
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
-        return response
-
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
-
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
-
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        key, slot, throttle = self.get_slot(request)
+        if slot is None:
+            return response
+        stats = self.crawler.stats
+
+        if response.status not in self.block_codes:
+            if throttle.on_success(request.meta.get("download_latency")):
+                self.apply(key, slot, throttle, spider)
+                stats.inc_value("throttle/ramp_up")
+            return response
+
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        stats.inc_value(f"throttle/blocked/{response.status}")
+        # Static responses the spider re-fetches with Playwright (playwright_fallback).
+        fallback = not request.meta.get("playwright") and response.status in request.meta.get("handle_httpstatus_list", ())
+        retries = request.meta.get("throttle_retries", 0)
+        retrying = not fallback and retries < self.max_retries
+        # The retry goes back to the scheduler and waits in the slot delay: it holds no download slot meanwhile.
+        wait = min(max(self.backoff * 2 ** retries, retry_after or 0), self.max_delay) if retrying else retry_after
+        latency = request.meta.get("download_latency")
+        if throttle.on_block(wait, time.time() - latency if latency is not None else None):
+            self.apply(key, slot, throttle, spider)
+            stats.inc_value("throttle/slow_down")
+
+        if fallback:
+            return response
+        if not retrying:
+            stats.inc_value("throttle/gave_up")
+            spider.logger.warning("Still blocked (%s) after %s retries: %s", response.status, retries, request.url)
+            # RetryMiddleware would retry it again without waiting.
+            request.meta["dont_retry"] = True
+            return response
+
+        stats.inc_value("throttle/retries")
+        spider.logger.info("Blocked (%s), retrying with a %.1f s delay: %s", response.status, throttle.delay, request.url)
+        return self.retry_request(request, spider, retries + 1)
+
+    def retry_request(self, request, spider, retries):
+        """Copy of a blocked request, rendered again from scratch if it used Playwright."""
+        meta = dict(request.meta)
+        meta["throttle_retries"] = retries
+        meta.pop("download_latency", None)
+        if meta.get("playwright") and hasattr(spider, "playwright_meta"):
+            if getattr(spider, "browser_pool", None):
+                spider.browser_pool.release(meta)
+            for name in [name for name in meta if name.startswith("playwright_") and name != "playwright_escalated"]:
+                del meta[name]
+            meta.update(spider.playwright_meta())
+        return request.replace(meta=meta, dont_filter=True, priority=request.priority + self.priority_adjust)
+
+    def apply(self, key, slot, throttle, spider):
+        """Sets the throttle values on the downloader slot."""
+        self.slots[key] = slot
+        slot.concurrency = throttle.concurrency
+        slot.delay = throttle.delay
+        spider.logger.info(
+            "Throttle %s: %s concurrent request(s), %.2f s delay (block rate %.0f%%)",
+            key, throttle.concurrency, throttle.delay, throttle.block_rate * 100,
+        )
+
+    def spider_closed(self, spider):
+        for key, throttle in self.domains.items():
+            if throttle.concurrency != throttle.max_concurrency or throttle.delay != throttle.min_delay:
+                spider.logger.info(
+                    "Throttle %s at close: %s/%s concurrent request(s), %.2f s delay (block rate %.0f%%)",
+                    key, throttle.concurrency, throttle.max_concurrency, throttle.delay, throttle.block_rate * 100,
+                )
@@ -5,9 +5,306 @@
 
 
 # useful for handling different item types with a single interface
+import os
+import time
+import logging
+from collections import OrderedDict, deque
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.pipelines import ItemPipelineManager
+from scrapy.utils.defer import deferred_f_from_coro_f
+from scrapy.utils.project import data_path
+from smart_scraper.items import ProductItem
+from smart_scraper.utils.url_verifier import UrlVerifier
+from smart_scraper.utils.dedup_store import DedupStore, DuplicateItem, dedup_key
+from smart_scraper.utils.crawl_metrics import observe
+from smart_scraper.utils.output_writers import (
+    OUTPUT_FORMATS,
+    JsonLinesWriter,
+    ParquetWriter,
+    SqliteWriter,
+    partition_name,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class SmartScraperPipeline:
+    """
+    Streams the products to OUTPUT_DIR/<config name>/ in batches of OUTPUT_BATCH_SIZE
+    items: rotating JSON lines files (gzip or zstd), Parquet files or one SQLite
+    table. File outputs are partitioned in <OUTPUT_PARTITION_BY>=<value>/
+    directories (brand_name by default). At most 4 batches are buffered and
+    OUTPUT_MAX_OPEN_PARTITIONS files are open, whatever the catalogue size.
+    Disabled unless OUTPUT_FORMAT is set.
+    """
+
+    def __init__(self, settings, stats):
+        self.format = settings.get("OUTPUT_FORMAT").lower()
+        if self.format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown OUTPUT_FORMAT: {self.format} (expected one of {', '.join(OUTPUT_FORMATS)})")
+        self.output_dir = settings.get("OUTPUT_DIR", "outputs")
+        self.compression = settings.get("OUTPUT_COMPRESSION") or None
+        self.batch_size = max(settings.getint("OUTPUT_BATCH_SIZE", 500), 1)
+        self.max_file_items = max(settings.getint("OUTPUT_FILE_MAX_ITEMS", 100000), 1)
+        self.max_open = max(settings.getint("OUTPUT_MAX_OPEN_PARTITIONS", 32), 1)
+        # SQLite outputs are a single table, indexed by brand_name.
+        self.partition_by = settings.get("OUTPUT_PARTITION_BY") if self.format != "sqlite" else None
+        self.fields = settings.getlist("FEED_EXPORT_FIELDS") or list(ProductItem.fields)
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get("OUTPUT_FORMAT"):
+            # Bare, so the default crawl does not log the pipeline as disabled.
+            raise NotConfigured
+        return cls(crawler.settings, crawler.stats)
+
+    def open_spider(self, spider):
+        self.name = getattr(spider, "config_name", spider.name)
+        # Unique per process, so that the workers of "scrapy shard" never write the same file.
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self.buffers = {}
+        self.buffered = 0
+        self.writers = OrderedDict()
+        self.file_numbers = {}
+        self.files = []
+
     def process_item(self, item, spider):
+        if not isinstance(item, ProductItem):
+            return item
+        row = ItemAdapter(item).asdict()
+        key = partition_name(row.get(self.partition_by)) if self.partition_by else ""
+        buffer = self.buffers.setdefault(key, [])
+        buffer.append(row)
+        self.buffered += 1
+        if len(buffer) >= self.batch_size:
+            self.flush(key)
+        elif self.buffered >= 4 * self.batch_size:
+            for key in list(self.buffers):
+                self.flush(key)
         return item
+
+    def flush(self, key):
+        """Writes the buffered items of a partition."""
+        rows = self.buffers.pop(key, None)
+        if not rows:
+            return
+        self.writer(key).write_batch(rows)
+        self.buffered -= len(rows)
+        self.stats.inc_value("output/items", len(rows))
+        self.stats.inc_value("output/batches")
+
+    def writer(self, key):
+        """Returns the writer of a partition, closing the least recently used one if too many are open."""
+        if key in self.writers:
+            self.writers.move_to_end(key)
+            return self.writers[key]
+        if len(self.writers) >= self.max_open:
+            self.close_writer(next(iter(self.writers)))
+
+        if self.format == "sqlite":
+            writer = SqliteWriter(os.path.join(self.output_dir, f"{self.name}.db"), self.fields)
+        else:
+            directory = os.path.join(self.output_dir, self.name)
+            if key:
+                directory = os.path.join(directory, f"{self.partition_by}={key}")
+            args = (directory, self.run_id, self.fields, self.max_file_items, self.file_numbers.get(key, 0))
+            if self.format == "parquet":
+                writer = ParquetWriter(*args)
+            else:
+                writer = JsonLinesWriter(*args, compression=self.compression)
+        self.writers[key] = writer
+        return writer
+
+    def close_writer(self, key):
+        writer = self.writers.pop(key)
+        writer.close()
+        self.file_numbers[key] = getattr(writer, "file_number", 0)
+        self.files += writer.files
+
+    def close_spider(self, spider):
+        for key in list(self.buffers):
+            self.flush(key)
+        for key in list(self.writers):
+            self.close_writer(key)
+        files = sorted(set(self.files))
+        self.stats.set_value("output/files", len(files))
+        logger.info(
+            "Output (%s): %s item(s) written to %s %s file(s) in %s",
+            self.name, self.stats.get_value("output/items", 0), len(files), self.format, self.output_dir,
+        )
+
+
+class UrlVerificationPipeline:
+    """
+    Checks the JSON-LD image URLs and the favicon without blocking the crawl (images
+    found by the selectors are kept as is). Invalid images are removed from
+    offer_image_url and the item is dropped when none is left, as an incomplete
+    product (URL_VERIFICATION_KEEP_UNVERIFIED_IMAGES keeps its images instead). An
+    invalid vendor_icon_url is set to None. Results are cached, so the site favicon
+    is only checked once per crawl. Must run before the pipelines that may drop items.
+    """
+
+    def __init__(self, verifier, stats=None, keep_unverified_images=False):
+        self.verifier = verifier
+        self.stats = stats
+        self.keep_unverified_images = keep_unverified_images
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        verifier = UrlVerifier(
+            cache_path=settings.get("URL_VERIFICATION_CACHE") or data_path("url_verification.json"),
+            ttl=settings.getint("URL_VERIFICATION_TTL", 86400),
+            negative_ttl=settings.getint("URL_VERIFICATION_NEGATIVE_TTL", 3600),
+            concurrency_per_host=settings.getint("URL_VERIFICATION_CONCURRENCY_PER_HOST", 4),
+            timeout=settings.getfloat("URL_VERIFICATION_TIMEOUT", 5),
+            user_agent=settings.get("USER_AGENT"),
+            stats=crawler.stats,
+        )
+        return cls(verifier, crawler.stats, settings.getbool("URL_VERIFICATION_KEEP_UNVERIFIED_IMAGES"))
+
+    def open_spider(self, spider):
+        self.verifier.load()
+
+    def close_spider(self, spider):
+        return self.verifier.save()
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        images = []
+        jsonld_image_items = getattr(spider, "jsonld_image_items", set())
+        if adapter.get("offer_url") in jsonld_image_items:
+            jsonld_image_items.discard(adapter.get("offer_url"))
+            images = adapter.get("offer_image_url")
+            images = images if isinstance(images, list) else []
+        icon = adapter.get("vendor_icon_url")
+
+        urls = [url for url in images if isinstance(url, str) and url.startswith(("http://", "https://"))]
+        if icon:
+            urls.append(icon)
+        if not urls:
+            return item
+        # Replayed crawls stay offline: only the cached results apply.
+        if getattr(spider, "pages", None) == "replay":
+            results = {url: self.verifier.cache.get(url, [True])[0] for url in urls}
+            return self._apply_results(results, item, images, icon)
+
+        started_at = time.monotonic()
+        d = self.verifier.verify_many(urls)
+        if self.stats is not None:
+            d.addCallback(self._observe, started_at)
+        d.addCallback(self._apply_results, item, images, icon)
+        return d
+
+    def _observe(self, results, started_at):
+        """Time spent checking the URLs of one item (cached results included)."""
+        observe(self.stats, "verify", (time.monotonic() - started_at) * 1000)
+        return results
+
+    def _apply_results(self, results, item, images, icon):
+        adapter = ItemAdapter(item)
+        if icon and not results.get(icon):
+            adapter["vendor_icon_url"] = None
+
+        if images:
+            valid_images = [url for url in images if results.get(url, True)]
+            if valid_images:
+                adapter["offer_image_url"] = valid_images
+            elif self.keep_unverified_images:
+                if self.stats is not None:
+                    self.stats.inc_value("url_verification/unverified_items")
+            else:
+                if self.stats is not None:
+                    self.stats.inc_value("incomplete/items")
+                    self.stats.inc_value("incomplete/fields/offer_image_url")
+                raise DropItem(f"No valid image for {adapter.get('offer_url')}")
+        return item
+
+
+class DedupPipeline:
+    """
+    Drops the products already emitted, keyed by normalised offer_url and a hash of
+    their other fields: within a run (duplicate URLs, variants sharing a page,
+    pagination loops) and, unless DEDUP_ACROSS_RUNS is False or the spider runs
+    with "-a full=true", when the last run emitted the same version. The last
+    version of each URL is kept in a SQLite store behind an in-memory Bloom filter.
+    """
+
+    def __init__(self, store, stats, across_runs=True):
+        self.store = store
+        self.stats = stats
+        self.across_runs = across_runs
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("DEDUP_ENABLED", True):
+            raise NotConfigured("DEDUP_ENABLED is False")
+        store = DedupStore(
+            settings.get("DEDUP_STORE") or data_path("dedup.db"),
+            capacity=settings.getint("DEDUP_CAPACITY", 1000000),
+            error_rate=settings.getfloat("DEDUP_ERROR_RATE", 0.001),
+        )
+        return cls(store, crawler.stats, settings.getbool("DEDUP_ACROSS_RUNS", True))
+
+    def close_spider(self, spider):
+        self.store.close()
+        duplicates = self.stats.get_value("dedup/duplicate", 0)
+        if duplicates:
+            logger.info("Dedup (%s): %s duplicate item(s) dropped", getattr(spider, "config_name", spider.name), duplicates)
+
+    def process_item(self, item, spider):
+        if not isinstance(item, ProductItem):
+            return item
+        key = dedup_key(item)
+        seen = self.store.check(key, getattr(spider, "config_name", spider.name))
+        if seen == "previous_run" and (not self.across_runs or getattr(spider, "full", False)):
+            self.store.claim(key)
+            seen = None
+        if seen is None:
+            self.stats.inc_value("dedup/unique")
+            return item
+        self.stats.inc_value("dedup/duplicate")
+        self.stats.inc_value(f"dedup/duplicate/{seen}")
+        raise DuplicateItem(f"Duplicate item ({seen.replace('_', ' ')}): {ItemAdapter(item).get('offer_url')}")
+
+
+class RecrawlPipeline:
+    """
+    Saves the content hash and HTTP validators of every emitted item in the
+    spider's recrawl store, so the next run only emits new or changed products.
+    Must run after the pipelines that may drop items.
+    """
+
+    def process_item(self, item, spider):
+        store = getattr(spider, "recrawl_store", None)
+        if store is None:
+            return item
+        record = spider.pending_records.pop(ItemAdapter(item).get("offer_url"), None)
+        if record:
+            url, fingerprint, etag, last_modified = record
+            store.record(url, fingerprint, etag, last_modified)
+            spider.crawler.stats.inc_value("recrawl/recorded")
+        return item
+
+
+class ProfilingItemPipelineManager(ItemPipelineManager):
+    """
+    ITEM_PROCESSOR running the process_item() of each enabled pipeline as a profiler
+    step ("pipeline/<class name>") when the spider is profiled ("-a profile=cpu|alloc").
+    Pipelines returning a deferred are timed until they return it.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        manager = super().from_crawler(crawler)
+        profiler = getattr(crawler.spider, "profiler", None)
+        if profiler is not None:
+            manager.methods["process_item"] = deque(
+                deferred_f_from_coro_f(profiler.wrap(f"pipeline/{type(pipe).__name__}", pipe.process_item))
+                for pipe in manager.middlewares
+                if hasattr(pipe, "process_item")
+            )
+        return manager
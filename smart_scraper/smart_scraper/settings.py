@@ -1,12 +1,13 @@
 # Scrapy settings for smart_scraper project
 
-import logging
-import colorlog
+import os
+from smart_scraper.utils.log_setup import setup_logging
 
 BOT_NAME = "smart_scraper"
 
 SPIDER_MODULES = ["smart_scraper.spiders"]
 NEWSPIDER_MODULE = "smart_scraper.spiders"
+COMMANDS_MODULE = "smart_scraper.commands"
 
 
 # Obey robots.txt rules
@@ -34,16 +35,102 @@ DEFAULT_REQUEST_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
 }
 
+# Enable or disable spider middlewares
+# See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+# Closest to the spider, so that the profiled steps only contain the callbacks.
+SPIDER_MIDDLEWARES = {
+    "smart_scraper.middlewares.ProfilingSpiderMiddleware": 1000,
+}
+
+# Profiling ("-a profile=cpu|alloc"): reports written to PROFILE_DIR/<config>.<mode>.json and
+# .collapsed (flame graph input). Stack sampling interval (ms) and frames kept per allocation.
+PROFILE_DIR = "outputs/profiles"
+PROFILE_INTERVAL = 5
+PROFILE_FRAMES = 25
+
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-# }
+# The throttle sees the responses before RetryMiddleware (550).
+DOWNLOADER_MIDDLEWARES = {
+    "smart_scraper.middlewares.SmartScraperDownloaderMiddleware": 560,
+}
+
+# Adaptive per-domain throttle (SmartScraperDownloaderMiddleware): each block halves the concurrency
+# and doubles the delay of the domain (up to SMART_THROTTLE_MAX_DELAY seconds, or Retry-After),
+# SMART_THROTTLE_RAMP_UP_AFTER clean responses in a row bring them back towards the configured values.
+SMART_THROTTLE_ENABLED = True
+SMART_THROTTLE_BLOCK_CODES = [403, 429, 503]
+SMART_THROTTLE_MAX_DELAY = 60
+SMART_THROTTLE_RAMP_UP_AFTER = 20
+# Blocked URLs are retried after SMART_THROTTLE_BACKOFF * 2^n seconds (or Retry-After).
+SMART_THROTTLE_MAX_RETRIES = 3
+SMART_THROTTLE_BACKOFF = 2
+
+# Configure item pipelines
+# See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+ITEM_PIPELINES = {
+    "smart_scraper.pipelines.UrlVerificationPipeline": 100,
+    "smart_scraper.pipelines.DedupPipeline": 700,
+    "smart_scraper.pipelines.SmartScraperPipeline": 800,
+    "smart_scraper.pipelines.RecrawlPipeline": 900,
+}
+
+# Times each pipeline when the spider is profiled ("-a profile=cpu|alloc").
+ITEM_PROCESSOR = "smart_scraper.pipelines.ProfilingItemPipelineManager"
+
+# Batched output (SmartScraperPipeline), written to OUTPUT_DIR/<config name>/.
+# "jsonl", "parquet" (requires pyarrow) or "sqlite", disabled if empty (use -O feeds instead).
+OUTPUT_FORMAT = ""
+OUTPUT_DIR = "outputs"
+# JSON lines compression: "gzip", "zstd" (requires zstandard) or "" for plain files.
+OUTPUT_COMPRESSION = "gzip"
+OUTPUT_BATCH_SIZE = 500
+# Items per file before rotation (JSON lines and Parquet).
+OUTPUT_FILE_MAX_ITEMS = 100000
+# Item field used to split file outputs in <field>=<value>/ directories, "" for no partitioning.
+OUTPUT_PARTITION_BY = "brand_name"
+OUTPUT_MAX_OPEN_PARTITIONS = 32
+
+# Incremental recrawl: only new or changed products are emitted ("-a full=true" to emit everything).
+RECRAWL_ENABLED = True
+# Defaults to .scrapy/recrawl.db
+#RECRAWL_STORE = ""
+
+# Products already emitted (same normalised offer_url and fields as the last version emitted)
+# are dropped by DedupPipeline, within a run and across runs (unless "-a full=true").
+DEDUP_ENABLED = True
+DEDUP_ACROSS_RUNS = True
+# Defaults to .scrapy/dedup.db
+#DEDUP_STORE = ""
+# Expected number of products, sizes the in-memory Bloom filter (about 1.8 MB per million at 0.1%).
+DEDUP_CAPACITY = 1000000
+DEDUP_ERROR_RATE = 0.001
+
+# Image and favicon checks (HEAD requests run by UrlVerificationPipeline)
+URL_VERIFICATION_TTL = 86400
+# Invalid URLs are checked again sooner (timeouts and connection errors are never cached).
+URL_VERIFICATION_NEGATIVE_TTL = 3600
+URL_VERIFICATION_CONCURRENCY_PER_HOST = 4
+URL_VERIFICATION_TIMEOUT = 5
+# Defaults to .scrapy/url_verification.json, set to share the cache between projects.
+#URL_VERIFICATION_CACHE = ""
+# Products whose JSON-LD images all fail the check are dropped as incomplete,
+# True keeps them with the unverified images (url_verification/unverified_items stat).
+URL_VERIFICATION_KEEP_UNVERIFIED_IMAGES = False
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "smart_scraper.extensions.LogSetup": 0,
+    "smart_scraper.extensions.CrawlMetrics": 500,
+}
+
+# Per-stage timings and field hit rates (CrawlMetrics), written to METRICS_DIR/<config>.json
+# and <config>.prom (Prometheus text format, e.g. for the node_exporter textfile collector).
+METRICS_ENABLED = True
+METRICS_DIR = "outputs/metrics"
+# Refresh period of the .prom file during the crawl (seconds), 0 to write it only at the end.
+METRICS_INTERVAL = 30
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -70,12 +157,26 @@ DEFAULT_REQUEST_HEADERS = {
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 
-# Activate Scrapy-Playwright
+# Activate Scrapy-Playwright only for requests that need it (meta["playwright"]),
+# every other request is downloaded with Scrapy's native handlers below.
 DOWNLOAD_HANDLERS = {
-    "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
-    "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
+    "http": "smart_scraper.handlers.SmartDownloadHandler",
+    "https": "smart_scraper.handlers.SmartDownloadHandler",
 }
 
+# Page stores ("-a pages=record|replay"): <config>.pages.db files, configs/fixtures by default.
+#PAGE_STORE_DIR = ""
+
+# Native handlers used for non-Playwright requests.
+# Use "scrapy.core.downloader.handlers.http2.H2DownloadHandler" for "https" to enable HTTP/2.
+SMART_HTTP_HANDLERS = {
+    "http": "scrapy.core.downloader.handlers.http11.HTTP11DownloadHandler",
+    "https": "scrapy.core.downloader.handlers.http11.HTTP11DownloadHandler",
+}
+
+# Share one browser between the crawlers of the process with the same PLAYWRIGHT_* settings (set by "scrapy batch").
+SMART_SHARE_BROWSER = False
+
 # Max wait time for Playwright pages (in seconds)
 PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT = 30000
 
@@ -99,23 +200,21 @@ FEED_EXPORT_FIELDS = [
 ]
 
 
-"""COLORLOG config - Scrapy will use this colored logs."""
-LOG_COLORS = {
-    'DEBUG': 'cyan',
-    'INFO': 'green',
-    'WARNING': 'yellow',
-    'ERROR': 'red',
-    'CRITICAL': 'bold_red',
-}
-
-log_formatter = colorlog.ColoredFormatter(
-    "%(log_color)s[%(levelname)s]%(reset)s %(asctime)s - %(message)s",
-    log_colors=LOG_COLORS
-)
-
-handler = logging.StreamHandler()
-handler.setFormatter(log_formatter)
-
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-logger.handlers = [handler]
+"""Logging - the handler of the root logger is set by utils/log_setup.py (LogSetup extension)."""
+# "dev": coloured console, every message. "production": JSON lines, sampled per message type
+# and written by a background thread. Per run: -s LOG_MODE=production -L INFO.
+# The SMART_SCRAPER_LOG_MODE and SMART_SCRAPER_LOG_LEVEL environment variables also cover
+# the lines logged before the crawler settings apply.
+LOG_MODE = os.environ.get("SMART_SCRAPER_LOG_MODE", "dev")
+LOG_LEVEL = "DEBUG"
+# Scrapy's own root handler would print every message twice.
+LOG_ENABLED = False
+# JSON lines file of the production mode (stderr when empty).
+LOG_JSON_FILE = ""
+# Production mode: first message of each type, then 1 out of LOG_SAMPLE_RATE (warnings and errors are all kept).
+LOG_SAMPLE_RATE = 100
+# Rate per message template or logger name, e.g. {"Page processing: %s": 1000, "scrapy.core.scraper": 1}.
+LOG_SAMPLE_RATES = {}
+
+# Until the LogSetup extension applies the crawler settings, only the environment is known.
+setup_logging(LOG_MODE, os.environ.get("SMART_SCRAPER_LOG_LEVEL", "INFO"), None, LOG_SAMPLE_RATE)
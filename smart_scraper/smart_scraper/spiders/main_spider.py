@@ -1,15 +1,47 @@
 import scrapy
+import copy
 import json
+import math
 import os
-from scrapy.loader import ItemLoader
-from smart_scraper.items import ProductItem, ProductLoader
+import time
+import logging
 from smart_scraper.items import compute_discount_percentage
-from itemloaders.processors import MapCompose
 from scrapy_playwright.page import PageMethod
-from smart_scraper.utils.config_loader import load_config
+from scrapy import signals
+from scrapy.utils.project import data_path
+from smart_scraper.utils.config_loader import load_config, read_manifest, BrowserPoolConfig
 from smart_scraper.utils.jsonld_getter import extract_jsonld_data
 from smart_scraper.utils.jsonld_getter import check_for_default_value
 from smart_scraper.utils.jsonld_getter import fetch_jsonld_data
+from smart_scraper.utils.botwall_detector import is_bot_wall
+from smart_scraper.utils.page_actions import to_page_selectors, wait_for_product, scroll_until_stable
+from smart_scraper.utils.resource_blocker import ResourceBlocker
+from smart_scraper.utils.browser_pool import BrowserPool
+from smart_scraper.utils.recrawl_store import RecrawlStore, item_fingerprint
+from smart_scraper.utils.dedup_store import DuplicateItem
+from smart_scraper.utils.extraction_plan import ExtractionPlan
+from smart_scraper.utils.url_discovery import UrlDiscovery
+from smart_scraper.utils.api_capture import ApiCapture
+from smart_scraper.utils.crawl_metrics import timed
+from smart_scraper.utils.profiler import Profiler
+from smart_scraper.utils.page_store import FIXTURES_DIR, PageStore
+
+# Fields and default values checked before yielding an item (excluding vendor_icon_url and tags).
+REQUIRED_FIELDS = {
+    "brand_name": "Unknown brand",
+    "brand_url": "Unknown brand URL",
+    "currency": "Unknown currency",
+    "discount_percentage": "No discount",
+    "discount_price": "No discount",
+    "gender": "Unspecified",
+    "offer_image_url": "No image available",
+    "offer_price": "Price not available",
+    "offer_url": "No URL available",
+    "product_description": "Description not found",
+    "product_name": "Product name not found",
+    "vendor_name": "Unknown vendor",
+    "vendor_url": "Unknown vendor URL",
+}
 
 class MainSpider(scrapy.Spider):
     name = "main_spider"
@@ -18,9 +50,55 @@ class MainSpider(scrapy.Spider):
         super(MainSpider, self).__init__(*args, **kwargs)
 
         # Load JSON config
+        self.config_file = config_file
+        self.config_name = os.path.splitext(os.path.basename(config_file))[0]
         self.config = load_config(config_file)
-        self.logger.info(f"Config json file loaded : {self.config}")
-        self.start_urls = [str(url) for url in self.config.base_urls]
+        self.logger.info("Config json file loaded : %s", self.config)
+        # A worker of "scrapy shard" only crawls its share of the URLs.
+        self.urls_file = kwargs.get("urls_file")
+        # URL files and manifests are streamed while the requests are scheduled.
+        if self.urls_file:
+            self.start_urls = read_manifest(self.urls_file)
+        elif self.config.manifest_path:
+            self.start_urls = self.config.iter_urls()
+        else:
+            self.start_urls = list(self.config.iter_urls())
+
+        # Chained crawl ("-a discover=true"): the product URLs found by the discovery
+        # (sitemaps, then listing pages) are crawled as they come, on top of base_urls.
+        self.discover = str(kwargs.get("discover", "")).lower() in ("1", "true", "yes") and not self.urls_file
+        if self.discover and not self.config.discovery:
+            raise ValueError(f"{config_file} has no discovery block, it cannot be crawled with discover=true")
+        self.discovery = UrlDiscovery(
+            self, self.config, self.discovered_url, self.request_headers, self.listing_meta
+        ) if self.discover else None
+
+        # Optional files recording the URLs already handled and the final stats.
+        self.progress_file = kwargs.get("progress_file")
+        self.stats_file = kwargs.get("stats_file")
+        self.progress = open(self.progress_file, "a", encoding="utf-8", buffering=1) if self.progress_file else None
+
+        # Profiling ("-a profile=cpu" or "-a profile=alloc"), see ProfilingSpiderMiddleware.
+        self.profile = kwargs.get("profile")
+        self.profiler = None
+
+        # Incremental recrawl: only new or changed products are emitted, unless "-a full=true".
+        self.full = str(kwargs.get("full", "")).lower() in ("1", "true", "yes")
+
+        # Pages recorded ("-a pages=record") to be replayed without browser nor network ("-a pages=replay").
+        # Both emit every product.
+        self.pages = kwargs.get("pages")
+        if self.pages not in (None, "record", "replay"):
+            raise ValueError(f"Unknown pages mode: {self.pages!r} (expected record or replay)")
+        self.page_store = None
+        if self.pages:
+            self.full = True
+        self.recrawl_store = None
+        self.incremental = False
+        # offer_url -> requested URL, content hash and validators of yielded items, saved by RecrawlPipeline.
+        self.pending_records = {}
+        # offer_url of the yielded items whose images come from JSON-LD, checked by UrlVerificationPipeline.
+        self.jsonld_image_items = set()
 
         #Fetch fixed values.
         self.brand_url = self.config.brand_url or None
@@ -43,6 +121,10 @@ class MainSpider(scrapy.Spider):
         self.brand_name_selector = self.config.selectors.brand_name if hasattr(self.config.selectors, "brand_name") else None
         self.brand_name = self.config.brand_name if hasattr(self.config, "brand_name") else None
 
+        # Selectors and fixed values compiled once for every response (see utils/extraction_plan.py).
+        self.extraction_plan = ExtractionPlan(self.config)
+        self.jsonld_first = self.config.jsonld_first
+
         # Fetch pagination settings
         self.pagination_enabled = self.config.pagination.enabled or False
         self.pagination_selector = self.config.pagination.selector or None
@@ -50,239 +132,500 @@ class MainSpider(scrapy.Spider):
         # Fetch playwright settings
         self.use_playwright = self.config.anti_bot.use_playwright or False
         self.delay = self.config.anti_bot.delay or 0
+        self.playwright_fallback = self.config.anti_bot.playwright_fallback or False
+        self.smart_wait = self.config.anti_bot.smart_wait or False
 
         # Fetch scroll settings
         self.scroll_enabled = self.config.scroll.enabled or False
         self.scroll_times = self.config.scroll.times or 3
         self.scroll_delay = self.config.scroll.delay or 2
 
+        # Selectors the smart wait expects on a rendered product page.
+        self.wait_selectors = to_page_selectors(
+            [self.product_name_selector, self.offer_price_selector, self.offer_image_url_selector]
+        )
+        # Page methods built once, shared by the rendered requests (see playwright_meta).
+        self.page_methods = self.smart_wait_methods() if self.smart_wait else self.fixed_wait_methods()
+        # JSON responses recorded while rendering (set in from_crawler, it needs the crawler stats).
+        self.api_capture = None
+
+        # Fetch browser pool settings (spider arguments override the config)
+        pool_args = {key: kwargs[key] for key in BrowserPoolConfig.model_fields if key in kwargs}
+        self.pool_config = None
+        if self.config.anti_bot.pool or pool_args:
+            pool_config = self.config.anti_bot.pool.model_dump() if self.config.anti_bot.pool else {}
+            self.pool_config = BrowserPoolConfig(**{**pool_config, **pool_args})
+        self.browser_pool = BrowserPool(
+            name=self.config_name, **self.pool_config.model_dump()
+        ) if self.pool_config else None
+
         # Add debug mode with a default value
         self.debug_mode = self.config.debug_mode if hasattr(self.config, "debug_mode") else False
         self.logger.info("Spider __init__ completed.")
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+
+        # Open the recrawl store (see RECRAWL_* settings), replayed crawls leave it untouched.
+        if crawler.settings.getbool("RECRAWL_ENABLED") and spider.pages != "replay":
+            store_path = crawler.settings.get("RECRAWL_STORE") or data_path("recrawl.db")
+            spider.recrawl_store = RecrawlStore(store_path)
+            spider.incremental = not spider.full
+            crawler.signals.connect(spider.item_dropped, signal=signals.item_dropped)
+
+        # Profiled from the spider opening, reports written in PROFILE_DIR when it closes.
+        if spider.profile:
+            settings = crawler.settings
+            spider.profiler = Profiler(spider.profile, settings.getfloat("PROFILE_INTERVAL") / 1000, settings.getint("PROFILE_FRAMES"))
+            spider.extraction_plan.extract = spider.profiler.wrap("item_loader", spider.extraction_plan.extract)
+            crawler.signals.connect(spider.profiler.start, signal=signals.spider_opened)
+
+        # Page store of the config (see PAGE_STORE_DIR).
+        if spider.pages:
+            store_dir = crawler.settings.get("PAGE_STORE_DIR") or FIXTURES_DIR
+            store_path = os.path.join(store_dir, f"{spider.config_name}.pages.db")
+            # No page store is shipped (see configs/fixtures/README.md): replaying without one would only skip every URL.
+            if spider.pages == "replay" and not os.path.exists(store_path):
+                raise ValueError(f"No recorded pages in {store_path}, crawl with -a pages=record first")
+            spider.page_store = PageStore(store_path)
+            if spider.pages == "record":
+                crawler.signals.connect(spider.page_store.record, signal=signals.response_received)
+            else:
+                # Stored pages are not throttled, and the dedup store is left untouched too.
+                crawler.settings.set("SMART_THROTTLE_ENABLED", False, priority="spider")
+                crawler.settings.set("DEDUP_ENABLED", False, priority="spider")
+
+        # Listing pages are only scrolled once the sitemaps are done.
+        if spider.discovery:
+            crawler.signals.connect(spider.discovery.spider_idle, signal=signals.spider_idle)
+
+        # Resource blocking needs the crawler stats.
+        blocking_config = spider.config.anti_bot.block_resources
+        spider.resource_blocker = ResourceBlocker(blocking_config, crawler) if blocking_config else None
+
+        # API capture: rendered pages only wait for the product JSON, no delay nor scroll.
+        if spider.config.api_capture:
+            spider.api_capture = ApiCapture(spider.config.api_capture, crawler)
+            spider.page_methods = [PageMethod(spider.api_capture.wait_for_payload, spider.config.api_capture.timeout)]
+
+        # Bound the number of pages rendered at the same time for this config.
+        if spider.pool_config:
+            pool = spider.pool_config
+            crawler.settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", pool.max_pages, priority="spider")
+            crawler.settings.set("PLAYWRIGHT_MAX_PAGES_PER_CONTEXT", math.ceil(pool.max_pages / pool.contexts), priority="spider")
+            # Recycled contexts are closed once idle, so a context and its replacement may coexist.
+            # A browser shared by several configs is not limited by one of them.
+            if not crawler.settings.getbool("SMART_SHARE_BROWSER"):
+                crawler.settings.set("PLAYWRIGHT_MAX_CONTEXTS", pool.contexts * 2, priority="spider")
+        return spider
+
     def start_requests(self):
         """Starts requests with headers and Playwright if enabled."""
-        self.logger.info(f"Spider starts with {len(self.start_urls)} URL(s)")
+        if isinstance(self.start_urls, list):
+            self.logger.info("Spider starts with %s URL(s)", len(self.start_urls))
+        else:
+            self.logger.info("Spider starts with the URLs of %s", self.urls_file or self.config.manifest_path)
 
+        # Discovery first: its product pages are downloaded while it goes on.
+        if self.discovery:
+            self.logger.info("Discovering the product URLs of %s", self.config_file)
+            yield from self.discovery.start_requests()
+
+        # Scrapy pulls the next start request only when the downloader has free slots,
+        # so URL sources are read as the crawl goes.
         for url in self.start_urls:
-            # Get a random user-agent
-            headers = {
-                "User-Agent": self.config.headers.get_random_user_agent(),
-                "Accept-Language": self.config.headers.Accept_Language or "fr-FR,fr;q=0.9",
-                "Referer": self.config.headers.Referer or None,
-            }
-
-            self.logger.info(f"Sending the request : {url}")
-            self.logger.info(f"User-Agent used : {headers['User-Agent']}")
-
-            request_params = {
-                "url": url,
-                "callback": self.parse,
-                "errback": self.handle_error,  # error handler
-                "headers": headers,
-            }
-
-            # Adding Playwright mode if enabled
-            if self.use_playwright:
-                self.logger.info(f"Playwright activated with a delay of {self.delay} sec.")
-
-                request_params["meta"] = {
-                    "playwright": True,
-                    "playwright_page_methods": [
-                        PageMethod("wait_for_timeout", self.delay * 1000)
-                    ],
-
-                }
-
-                # Adding Scroll if enabled
-                if self.scroll_enabled:
-                    for _ in range(self.scroll_times):
-                        request_params["meta"]["playwright_page_methods"].append(
-                            PageMethod(
-                                "evaluate",
-                                "window.scrollTo(0, document.body.scrollHeight)",
-                            )
-                        )
-                        request_params["meta"]["playwright_page_methods"].append(
-                            PageMethod("wait_for_timeout", self.scroll_delay * 1000)
-                        )
-
-            yield scrapy.Request(**request_params)
+            # Start URLs are already canonical and unique, the dupefilter would only keep
+            # one fingerprint per URL in memory.
+            yield self.detail_request(url, dont_filter=True)
+
+        # Shard workers: the command already reported the URLs of the config.
+        if not self.urls_file:
+            self.report_removed_urls()
+
+    def request_headers(self):
+        """Returns the request headers, with a random User-Agent for each query."""
+        return {
+            "User-Agent": self.config.headers.get_random_user_agent(),
+            "Accept-Language": self.config.headers.Accept_Language or "fr-FR,fr;q=0.9",
+            "Referer": self.config.headers.Referer or None,
+        }
+
+    def detail_request(self, url, **kwargs):
+        """Builds the request of a product page."""
+        headers = self.request_headers()
+        self.logger.info("Sending the request : %s", url)
+        self.logger.info("User-Agent used : %s", headers['User-Agent'])
+
+        request_params = {
+            "url": url,
+            "callback": self.parse,
+            "errback": self.handle_error,  # error handler
+            "headers": headers,
+            **kwargs,
+        }
+
+        # Adding Playwright mode if enabled
+        if self.use_playwright:
+            self.logger.info("Playwright activated with a delay of %s sec.", self.delay)
+            request_params["meta"] = self.playwright_meta()
+
+        # Static request: let bot walls reach parse() so they can be re-fetched with Playwright.
+        elif self.playwright_fallback:
+            request_params["meta"] = {"handle_httpstatus_list": [403, 429, 503]}
+
+        # Incremental recrawl: ask the server whether the page changed since the last run.
+        if self.incremental and not self.use_playwright:
+            conditional_headers = self.recrawl_store.conditional_headers(url)
+            if conditional_headers:
+                headers.update(conditional_headers)
+                meta = request_params.setdefault("meta", {})
+                meta["handle_httpstatus_list"] = meta.get("handle_httpstatus_list", []) + [304]
+
+        return scrapy.Request(**request_params)
+
+    def discovered_url(self, url, source):
+        """Product URL found by the discovery: its page is fetched before the next sitemaps and listing pages."""
+        yield self.detail_request(url, priority=1)
+
+    def listing_meta(self):
+        """Listing pages are rendered in the browser context of the config."""
+        return {"playwright_context": self.config_name}
+
+    def report_removed_urls(self):
+        """Logs the duplicate (and invalid manifest) start URLs that were dropped."""
+        removed, invalid = self.config.removed_urls, self.config.invalid_urls
+        self.crawler.stats.set_value("config/removed_urls", removed)
+        if removed:
+            self.logger.info("%s duplicate URL(s) removed from %s (canonical URLs).", removed, self.config_file)
+        if invalid:
+            self.crawler.stats.set_value("config/invalid_urls", invalid)
+            self.logger.warning("%s invalid URL(s) skipped in %s.", invalid, self.config.manifest_path)
+
+    def playwright_meta(self):
+        """Builds the request meta rendering a page with Playwright (waits, scrolls, blocking)."""
+        # scrapy-playwright stores each method result on the PageMethod: smart waits (whose
+        # results are the times waited) and API captures need their own copies, fixed waits are shared.
+        if self.smart_wait or self.api_capture:
+            page_methods = [copy.copy(pm) for pm in self.page_methods]
+        else:
+            page_methods = self.page_methods
+        meta = {
+            "playwright": True,
+            "playwright_page_methods": page_methods,
+            # One browser context per config, configs never share cookies.
+            "playwright_context": self.config_name,
+        }
+
+        # API capture: the payload is awaited from the navigation commit. scrapy-playwright still
+        # waits for the load event after the page methods, see ApiCapture.
+        if self.api_capture:
+            meta["playwright_page_goto_kwargs"] = {"wait_until": "commit"}
+
+        # Adding resource blocking if enabled
+        if self.resource_blocker:
+            meta["playwright_page_event_handlers"] = {"response": self.resource_blocker.on_response}
+        if self.resource_blocker or self.browser_pool or self.api_capture:
+            meta["playwright_page_init_callback"] = self.init_page
+
+        # Adding context and page from the pool if enabled
+        if self.browser_pool:
+            self.browser_pool.assign(meta)
+        return meta
+
+    async def init_page(self, page, request):
+        """Page init callback, called before each Playwright navigation."""
+        if self.browser_pool:
+            self.browser_pool.register_page(page, request)
+        if self.resource_blocker:
+            await self.resource_blocker.init_page(page, request)
+        if self.api_capture:
+            await self.api_capture.init_page(page, request)
+
+    def fixed_wait_methods(self):
+        """Waits for anti_bot.delay, then scrolls with a fixed scroll.delay."""
+        page_methods = [
+            PageMethod("wait_for_timeout", self.delay * 1000)
+        ]
+
+        # Adding Scroll if enabled
+        if self.scroll_enabled:
+            for _ in range(self.scroll_times):
+                page_methods.append(
+                    PageMethod(
+                        "evaluate",
+                        "window.scrollTo(0, document.body.scrollHeight)",
+                    )
+                )
+                page_methods.append(
+                    PageMethod("wait_for_timeout", self.scroll_delay * 1000)
+                )
+        return page_methods
+
+    def smart_wait_methods(self):
+        """Waits for the product instead of fixed delays (which become upper bounds)."""
+        page_methods = [PageMethod(wait_for_product, self.wait_selectors, self.delay * 1000)]
+        if self.scroll_enabled:
+            page_methods.append(PageMethod(scroll_until_stable, self.scroll_times, self.scroll_delay * 1000))
+        return page_methods
+
+    def record_wait_time(self, response):
+        """Adds the time spent in smart waits and the former fixed budget to the crawl stats."""
+        page_methods = response.meta.get("playwright_page_methods") or []
+        waited = sum(pm.result for pm in page_methods if isinstance(pm.result, float))
+        budget = self.delay * 1000
+        if self.scroll_enabled:
+            budget += self.scroll_times * self.scroll_delay * 1000
+
+        stats = self.crawler.stats
+        stats.inc_value("smart_wait/pages")
+        stats.inc_value("smart_wait/waited_ms", int(waited))
+        stats.inc_value("smart_wait/budget_ms", int(budget))
+
+    def jsonld_item(self, response, jsonld_data):
+        """Builds the item from the fixed values and JSON-LD only, returns None if it is incomplete."""
+        item = fetch_jsonld_data(jsonld_data, self.extraction_plan.extract(response, use_selectors=False))
+        item["discount_percentage"] = compute_discount_percentage(item.get("offer_price"), item.get("discount_price"))
+        if self.is_complete(item):
+            self.crawler.stats.inc_value("jsonld_first/complete")
+            return item
+        self.crawler.stats.inc_value("jsonld_first/selectors_fallback")
+        return None
+
+    def api_item(self, response):
+        """Builds the item from the fixed values and the captured JSON only, returns None if it is incomplete."""
+        page_methods = response.meta.get("playwright_page_methods") or []
+        payloads = next((pm.result for pm in page_methods if isinstance(pm.result, list)), None)
+        stats = self.crawler.stats
+        if not payloads:
+            stats.inc_value("api_capture/no_payload")
+            self.logger.info("No API response captured, using the selectors: %s", response.url)
+            return None
+
+        item = self.api_capture.fill(self.extraction_plan.extract(response, use_selectors=False), payloads, response)
+        if "discount_percentage" not in self.config.api_capture.fields:
+            item["discount_percentage"] = compute_discount_percentage(item.get("offer_price"), item.get("discount_price"))
+        if self.is_complete(item):
+            stats.inc_value("api_capture/complete")
+            return item
+        stats.inc_value("api_capture/selectors_fallback")
+        return None
+
+    def is_unchanged(self, item, response):
+        """Checks the item against the recrawl store, keeping its hash and validators for RecrawlPipeline."""
+        if not self.recrawl_store:
+            return False
+        # Keyed like the conditional headers of detail_request(), whatever the redirects.
+        url = self.requested_url(response.request)
+        fingerprint = item_fingerprint(item)
+        etag, last_modified = None, None
+        # Validators are only reused by static requests.
+        if not response.meta.get("playwright"):
+            etag = response.headers.get("ETag")
+            etag = etag.decode("latin-1") if etag else None
+            last_modified = response.headers.get("Last-Modified")
+            last_modified = last_modified.decode("latin-1") if last_modified else None
+
+        if self.incremental and self.recrawl_store.is_unchanged(url, fingerprint):
+            # Same content: refresh the validators so the next run can get a 304.
+            self.recrawl_store.record(url, fingerprint, etag, last_modified)
+            self.crawler.stats.inc_value("recrawl/unchanged")
+            self.logger.info("Unchanged since last run, item skipped: %s", url)
+            return True
+
+        self.pending_records[item.get("offer_url")] = (url, fingerprint, etag, last_modified)
+        return False
+
+    def item_dropped(self, item, response, exception, spider):
+        """
+        Forgets the recrawl record of an item dropped by a pipeline. Duplicates are
+        recorded like RecrawlPipeline does: this version was emitted, by this run or
+        an earlier one.
+        """
+        record = self.pending_records.pop(item.get("offer_url"), None)
+        if record and isinstance(exception, DuplicateItem):
+            self.recrawl_store.record(*record)
+            self.crawler.stats.inc_value("recrawl/recorded")
+
+    @staticmethod
+    def requested_url(request):
+        """URL a request was built for, before redirects."""
+        redirect_urls = request.meta.get("redirect_urls")
+        return redirect_urls[0] if redirect_urls else request.url
+
+    def mark_done(self, request):
+        """Records the start URL of a handled request in the progress file (if any)."""
+        if self.progress:
+            self.progress.write(f"{self.requested_url(request)}\n")
+
+    def closed(self, reason):
+        """Logs the smart wait and resource blocking summaries of this config."""
+        if self.browser_pool:
+            self.browser_pool.close()
+        if self.recrawl_store:
+            self.recrawl_store.close()
+        if self.progress:
+            self.progress.close()
+        if self.page_store:
+            self.logger.info("Page store (%s): %s page(s) in %s", self.pages, len(self.page_store), self.page_store.path)
+            self.page_store.close()
+        if self.stats_file:
+            with open(self.stats_file, "w", encoding="utf-8") as file:
+                json.dump(self.crawler.stats.get_stats(), file, default=str)
+        if self.profiler:
+            # Shard workers profile the same config: one report each.
+            name = f"{self.config_name}.{os.getpid()}" if self.urls_file else self.config_name
+            prefix = self.profiler.write(self.crawler.settings.get("PROFILE_DIR"), name)
+            self.logger.info("Profile (%s) written to %s.json/.collapsed", self.profile, prefix)
+
+        stats = self.crawler.stats
+        aborted = stats.get_value("resource_blocking/aborted")
+        if aborted:
+            saved = stats.get_value("resource_blocking/estimated_bytes_saved", 0) / 1e6
+            received = stats.get_value("resource_blocking/bytes_received", 0) / 1e6
+            self.logger.info(
+                "Resource blocking (%s): %s request(s) aborted, ~%.1f MB saved, %.1f MB downloaded.",
+                self.config_file, aborted, saved, received,
+            )
+
+        pages = stats.get_value("smart_wait/pages")
+        budget = stats.get_value("smart_wait/budget_ms", 0) / 1000
+        if pages and budget:
+            waited = stats.get_value("smart_wait/waited_ms", 0) / 1000
+            self.logger.info(
+                "Smart wait (%s): %s page(s), %.1f s waited instead of %.1f s fixed (%.0f%% of the budget).",
+                self.config_file, pages, waited, budget, waited / budget * 100,
+            )
+
+    def can_escalate(self, response):
+        """A static response can be re-fetched once with Playwright if the fallback is enabled."""
+        return self.playwright_fallback and not response.meta.get("playwright")
+
+    def escalate(self, response, reason):
+        """Re-fetches a static response's URL with Playwright."""
+        self.logger.info("Escalating to Playwright (%s): %s", reason, response.url)
+        self.crawler.stats.inc_value(f"smart_scraper/escalated/{reason}")
+        meta = self.playwright_meta()
+        meta["playwright_escalated"] = True
+        # Its request is marked done once the Playwright response is handled.
+        response.meta["escalated"] = True
+        # Still recorded under the requested URL.
+        if "redirect_urls" in response.request.meta:
+            meta["redirect_urls"] = list(response.request.meta["redirect_urls"])
+        headers = response.request.headers.copy()
+        for header in ("If-None-Match", "If-Modified-Since"):
+            headers.pop(header, None)
+        return response.request.replace(meta=meta, headers=headers, dont_filter=True)
 
     def handle_error(self, failure):
         """Log errors during requests."""
-        self.logger.error(f"Error during query : {failure.request.url}")
-        self.logger.error(f"Error details : {repr(failure)}")
+        self.logger.error("Error during query : %s", failure.request.url)
+        self.mark_done(failure.request)
+        if self.browser_pool:
+            self.browser_pool.release(failure.request.meta)
+        self.logger.error("Error details : %r", failure)
 
         if failure.check(scrapy.spidermiddlewares.httperror.HttpError):
             response = failure.value.response
-            self.logger.error(f"HTTP error {response.status} on {response.url}")
+            self.logger.error("HTTP error %s on %s", response.status, response.url)
 
         elif failure.check(scrapy.downloadermiddlewares.retry.RetryMiddleware):
-            self.logger.warning(f"Attempt to retry for {failure.request.url}")
+            self.logger.warning("Attempt to retry for %s", failure.request.url)
 
         elif failure.check(scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware):
-            self.logger.warning(f"Proxy problem {failure.request.url}")
+            self.logger.warning("Proxy problem %s", failure.request.url)
 
 
     def parse(self, response):
-        """Extracting data based on selectors defined in the config using ProductLoader."""
-        self.logger.info(f"Page processing: {response.url}")
+        """Handles a product page, then records its request as done unless it is re-fetched with Playwright."""
+        try:
+            yield from self.parse_page(response)
+        finally:
+            if not response.meta.get("escalated"):
+                self.mark_done(response.request)
+
+    def parse_page(self, response):
+        """Extracting data based on selectors defined in the config using the compiled extraction plan."""
+        self.logger.info("Page processing: %s", response.url)
+        if self.browser_pool:
+            self.browser_pool.release(response.meta)
+        if self.can_escalate(response) and is_bot_wall(response):
+            yield self.escalate(response, "bot_wall")
+            return
+        if response.status == 304:
+            self.crawler.stats.inc_value("recrawl/not_modified")
+            self.logger.info("Not modified since last run: %s", response.url)
+            return
         if response.status in [403, 429]:
-            self.logger.warning(f"Acces denied ({response.status}) - Anti-bot protection detected.")
+            self.logger.warning("Acces denied (%s) - Anti-bot protection detected.", response.status)
             return
         if response.status != 200:
-            self.logger.error(f"HTTP error {response.status} on {response.url}")
+            self.logger.error("HTTP error %s on %s", response.status, response.url)
             return
-        if hasattr(self, "debug_mode") and self.debug_mode:
-            self.logger.debug(f"HTML sample : \n{response.text[:1000]}")
-
-
-        loader = ProductLoader(item=ProductItem(), response=response)
-
-        # Checks the selector type (css ou Xpath).
-        def is_xpath(selector):
-            xpath_patterns = ("/", ".//", "./")
-            sel =  selector.strip()
-            for p in xpath_patterns:
-                if sel.startswith(p):
-                    return True
-            return False
-
-
-        # Extracts the value of a selector (supports css or Xpath).
-        def safe_add(field_name, selector):
-            if selector:
-                if is_xpath(selector):
-                    loader.add_xpath(field_name, selector)
-                    extracted = loader.get_output_value(field_name)
-                    self.logger.debug(f"Xpath - Extracted value for {field_name}: {extracted}")
-                else:
-                    loader.add_css(field_name, selector)
-                    extracted = loader.get_output_value(field_name)
-                    self.logger.debug(f"CSS - Extracted value for {field_name}: {extracted}")
-
-
-        # For 'brand_name': Uses the selector if defined, otherwise the fixed value (defined in items.py)
-        if self.brand_name_selector:
-            safe_add("brand_name", self.brand_name_selector)
-        elif self.brand_name:
-            loader.add_value("brand_name", self.brand_name)
-
-        # We check if we can get the percentage with a selector, otherwise we'll compute it once all items loaded.
-        if self.discount_percentage_selector:
-            safe_add("discount_percentage", self.discount_percentage_selector)
-
-        # For other fields extracted by selectors
-        safe_add("product_name", self.product_name_selector)
-        safe_add("offer_price", self.offer_price_selector)
-        safe_add("discount_price", self.discount_price_selector)
-        safe_add("product_description", self.product_description_selector)
-        safe_add("tags", self.tags_selector)
-
-        # For fields with fixed values
-        loader.add_value("brand_url", self.brand_url)
-        loader.add_value("currency", self.currency)
-        loader.add_value("vendor_name", self.vendor_name)
-        loader.add_value("vendor_url", self.vendor_url)
-
-        # For fields requiring processing via MapCompose
-        if self.offer_image_url_selector:
-            if is_xpath(self.offer_image_url_selector):
-                loader.add_xpath("offer_image_url", self.offer_image_url_selector,
-                        MapCompose(lambda x: response.urljoin(x)))
-            else:
-                loader.add_css("offer_image_url", self.offer_image_url_selector,
-                            MapCompose(lambda x: response.urljoin(x)))
-        else:
-            loader.add_value("offer_image_url", "No image available")
-
-        if self.vendor_icon_url_selector:
-            loader.add_css("vendor_icon_url", self.vendor_icon_url_selector,
-                        MapCompose(lambda x: response.urljoin(x)))
-        else:
-            # If vendor_url is set, vendor_url + "/favicon.ico" is used to get favicon
-            if self.vendor_url:
-                loader.add_value("vendor_icon_url", f"{self.vendor_url.rstrip('/')}/favicon.ico")
-
-        loader.add_value("offer_url", response.url)
-
-        # Checks if hard value has been passed to "gender" in JSON config, otherwise, process it in items.py.
-        if self.gender:
-            loader.add_value("gender", self.gender)
-        else:
-            loader.add_value("gender", self.config.headers.Referer)
-
-        item = loader.load_item()
-
-        # Compute discount_percentage
-        if self.discount_percentage_selector is None:
-            computed = compute_discount_percentage(item.get("offer_price"), item.get("discount_price"))
-            item["discount_percentage"] = computed
-
-
-        # =================== FETCH JSON‑LD ========================
-        missing_val = check_for_default_value(item)
-        jsonld_data = extract_jsonld_data(response)
-
-        if missing_val and jsonld_data:
-            item = fetch_jsonld_data(jsonld_data, item)
-        # ==========================================================
+        if hasattr(self, "debug_mode") and self.debug_mode and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("HTML sample : \n%s", response.text[:1000])
+        if self.smart_wait and not self.api_capture and response.meta.get("playwright"):
+            self.record_wait_time(response)
+
+
+        stats = self.crawler.stats
+        # Where the item values come from: "api", "jsonld" (jsonld_first) or "selectors" (completed
+        # with JSON-LD), plus the fields the selectors found.
+        source, selector_fields = None, set()
+        item = None
+        if self.api_capture and response.meta.get("playwright"):
+            with timed(stats, "parse/api"):
+                item = self.api_item(response)
+            source = "api"
+        with timed(stats, "parse/jsonld"):
+            jsonld_data = extract_jsonld_data(response)
+            if item is None and self.jsonld_first and jsonld_data:
+                item = self.jsonld_item(response, jsonld_data)
+                source = "jsonld"
+
+        if item is None:
+            source = "selectors"
+            with timed(stats, "parse/selectors"):
+                item = self.extraction_plan.extract(response)
+            selector_fields = set(REQUIRED_FIELDS) - set(self.missing_fields(item))
+
+            # =================== FETCH JSON‑LD ========================
+            missing_val = check_for_default_value(item)
+
+            if missing_val and jsonld_data:
+                with timed(stats, "parse/jsonld_fill"):
+                    item = fetch_jsonld_data(jsonld_data, item)
+            # ==========================================================
+
+            # Compute discount_percentage
+            if self.discount_percentage_selector is None:
+                computed = compute_discount_percentage(item.get("offer_price"), item.get("discount_price"))
+                item["discount_percentage"] = computed
 
 
         """Filtering incomplete products before yield."""
-        # Defines the fields and their default values ​​to check (excluding vendor_icon_url and tags).
         # =================== TO DEBUG, COMMENT THIS SECTION ========================
-        required_fields = {
-            "brand_name": "Unknown brand",
-            "brand_url": "Unknown brand URL",
-            "currency": "Unknown currency",
-            "discount_percentage": "No discount",
-            "discount_price": "No discount",
-            "gender": "Unspecified",
-            "offer_image_url": "No image available",
-            "offer_price": "Price not available",
-            "offer_url": "No URL available",
-            "product_description": "Description not found",
-            "product_name": "Product name not found",
-            "vendor_name": "Unknown vendor",
-            "vendor_url": "Unknown vendor URL",
-        }
-
-        complete = True
-        for field, default in required_fields.items():
-            value = item.get(field)
-            if isinstance(default, list):
-                if not value or value == default:
-                    complete = False
-                    self.logger.debug(f"Field '{field}' is incomplete (value: {value})")
-                    break
-            elif isinstance(default, str):
-                if isinstance(value, str):
-                    if not value or value.strip() == default:
-                        complete = False
-                        self.logger.debug(f"Field '{field}' is incomplete (value: '{value}')")
-                        break
-                else:
-                    if not value or str(value).strip() == default:
-                        complete = False
-                        self.logger.debug(f"Field '{field}' is incomplete (value: {value})")
-                        break
-            else:
-                if value == default:
-                    complete = False
-                    self.logger.debug(f"Field '{field}' is incomplete (value: {value})")
-                    break
-
-        if complete:
-            self.logger.info("Item is complete. Yielding item.")
-            self.logger.info(f"Product's data extracted: {item}")
-            yield item
+        if self.is_complete(item):
+            self.record_field_sources(item, source, selector_fields)
+            # Unchanged products are not yielded, the page pagination is still followed.
+            if not self.is_unchanged(item, response):
+                self.logger.info("Item is complete. Yielding item: %s", response.url)
+                self.logger.debug("Product's data extracted: %s", item)
+                if source != "api" and "offer_image_url" not in selector_fields:
+                    self.jsonld_image_items.add(item.get("offer_url"))
+                response.meta["metrics_item_at"] = time.monotonic()
+                yield item
+        elif self.can_escalate(response):
+            yield self.escalate(response, "incomplete")
         else:
+            missing = self.record_field_sources(item, source, selector_fields)
+            stats.inc_value("incomplete/items")
+            for field in missing:
+                stats.inc_value(f"incomplete/fields/{field}")
             self.logger.info("Incomplete item skipped.")
         # ===========================================================================
         # --------------------AND UNCOMMENT THIS ONE---------------------------------
-        # self.logger.info(f"Product's data extracted: {item}")
+        # self.logger.info("Product's data extracted: %s", item)
         # yield item
         # ---------------------------------------------------------------------------
 
@@ -291,5 +634,58 @@ class MainSpider(scrapy.Spider):
         if self.pagination_enabled:
             next_page = response.css(self.pagination_selector).get()
             if next_page:
-                self.logger.info(f"Following pagination to: {next_page}")
-                yield response.follow(next_page, callback=self.parse, headers=self.headers)
+                self.logger.info("Following pagination to: %s", next_page)
+                yield response.follow(next_page, callback=self.parse, headers=self.request_headers())
+
+    def record_field_sources(self, item, source, selector_fields):
+        """
+        Counts where each required field value comes from (fields/<field>/<source> stats):
+        the config, the selectors, the captured API or JSON-LD, computed or default.
+        Returns the missing fields.
+        """
+        stats = self.crawler.stats
+        missing = self.missing_fields(item)
+        api_fields = self.config.api_capture.fields if source == "api" else ()
+        for field in REQUIRED_FIELDS:
+            if field in missing:
+                origin = "default"
+            elif field in self.extraction_plan.config_fields:
+                origin = "config"
+            elif field in selector_fields:
+                origin = "selector"
+            elif field == "discount_percentage" and field not in api_fields:
+                origin = "computed"
+            else:
+                # The fields the selectors missed are filled from JSON-LD.
+                origin = "jsonld" if source == "selectors" else source
+            stats.inc_value(f"fields/{field}/{origin}")
+        stats.inc_value("fields/items")
+        return missing
+
+    def missing_fields(self, item):
+        """Returns the required fields still holding their default value."""
+        missing = []
+        for field, default in REQUIRED_FIELDS.items():
+            value = item.get(field)
+            if isinstance(default, list):
+                if not value or value == default:
+                    missing.append(field)
+            elif isinstance(default, str):
+                if isinstance(value, str):
+                    if not value or value.strip() == default:
+                        missing.append(field)
+                else:
+                    if not value or str(value).strip() == default:
+                        missing.append(field)
+            else:
+                if value == default:
+                    missing.append(field)
+        return missing
+
+    def is_complete(self, item):
+        """Checks that every required field holds an extracted value, not its default."""
+        missing = self.missing_fields(item)
+        if missing:
+            self.logger.debug("Field '%s' is incomplete (value: %s)", missing[0], item.get(missing[0]))
+            return False
+        return True
@@ -0,0 +1,175 @@
+import re
+import time
+import asyncio
+import logging
+import weakref
+from itemloaders.utils import arg_to_iter
+from smart_scraper.items import ProductItem, ProductLoader
+from smart_scraper.utils.crawl_metrics import observe
+
+logger = logging.getLogger(__name__)
+
+# JSONPath steps: .key, ..key, .*, [n], [*], ['key'] or ["key"].
+json_path_regex = re.compile(r"""(\.\.|\.)?(?:([A-Za-z_$@][\w$@-]*)|\*|\[(?:(-?\d+)|\*|'([^']*)'|"([^"]*)")\])""")
+
+
+# Compiles a JSONPath-style expression ("$.product.images[*].url", "$..price") into a list of steps.
+def compile_json_path(path):
+    path = path.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    steps, position = [], 0
+    while position < len(path):
+        match = json_path_regex.match(path, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Invalid JSON path: {path!r} (at {path[position:]!r})")
+        dots, name, index, quoted, double_quoted = match.groups()
+        key = name if name is not None else quoted if quoted is not None else double_quoted
+        if key is not None:
+            step = ("key", key)
+        elif index is not None:
+            step = ("index", int(index))
+        else:
+            step = ("all", None)
+        steps.append((dots == "..", step))
+        position = match.end()
+    return steps
+
+
+# Yields a node and all its descendants (dicts and lists).
+def descendants(node):
+    yield node
+    children = node.values() if isinstance(node, dict) else node if isinstance(node, list) else ()
+    for child in children:
+        yield from descendants(child)
+
+
+# Applies one step to a node, returns the matched values.
+def apply_step(node, step):
+    kind, value = step
+    if kind == "key":
+        return [node[value]] if isinstance(node, dict) and value in node else []
+    if kind == "index":
+        return [node[value]] if isinstance(node, list) and -len(node) <= value < len(node) else []
+    if isinstance(node, dict):
+        return list(node.values())
+    return list(node) if isinstance(node, list) else []
+
+
+# Returns the values matched by compiled steps in a JSON document (lists are flattened at the end).
+def json_path_values(data, steps):
+    nodes = [data]
+    for recursive, step in steps:
+        matched = []
+        for node in nodes:
+            for candidate in (descendants(node) if recursive else (node,)):
+                matched += apply_step(candidate, step)
+        nodes = matched
+    values = []
+    for node in nodes:
+        values += node if isinstance(node, list) else [node]
+    return [value for value in values if value is not None and not isinstance(value, (dict, list))]
+
+
+# Runs a field input processor on captured values, like ItemLoader.add_value() does.
+def process_values(input_processor, values):
+    return list(arg_to_iter(input_processor(values)))
+
+
+class ApiCapture:
+    """
+    Records the JSON responses of a Playwright page whose URL and content type match
+    the "api_capture" block of a config, and fills the item fields from them with
+    JSONPath-style paths (run through the same input processors as the selectors).
+
+    init_page() listens to the page responses before the navigation, wait_for_payload()
+    (a page method, run from the navigation commit) returns the payloads as soon as
+    they arrived. scrapy-playwright still waits for the page load event after its page
+    methods, so a page with a slow load event is only returned once it fired (or after
+    PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT).
+    """
+
+    def __init__(self, config, crawler):
+        self.config = config
+        self.crawler = crawler
+        self.url_patterns = [re.compile(pattern) for pattern in config.url_patterns]
+        loader = ProductLoader(item=ProductItem())
+        self.input_processors = {}
+        self.output_processors = {}
+        self.fields = []
+        for field_name, path in config.fields.items():
+            if field_name not in ProductItem.fields:
+                raise ValueError(f"Unknown api_capture field: {field_name}")
+            try:
+                steps = compile_json_path(path)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON path for '{field_name}': {e}")
+            self.fields.append((field_name, steps))
+            self.input_processors[field_name] = loader.get_input_processor(field_name)
+            self.output_processors[field_name] = loader.get_output_processor(field_name)
+        # Payloads (and their arrival event) of the pages being rendered.
+        self.pages = weakref.WeakKeyDictionary()
+
+    def matches(self, response):
+        """A page response is captured if its URL and content type match the config."""
+        if response.status != 200 or response.request.method == "OPTIONS":
+            return False
+        if self.url_patterns and not any(p.search(response.url) for p in self.url_patterns):
+            return False
+        content_type = response.headers.get("content-type", "")
+        return any(expected in content_type for expected in self.config.content_types)
+
+    async def init_page(self, page, request):
+        """Page init callback: records the matching JSON responses of the page."""
+        payloads, arrived = [], asyncio.Event()
+
+        async def on_response(response):
+            if not self.matches(response):
+                return
+            try:
+                payloads.append(await response.json())
+            except Exception as e:
+                self.crawler.stats.inc_value("api_capture/invalid_json")
+                logger.debug("Invalid JSON captured from %s: %r", response.url, e)
+                return
+            self.crawler.stats.inc_value("api_capture/payloads")
+            if len(payloads) >= self.config.min_payloads:
+                arrived.set()
+
+        # A pooled page is reused: its listener is removed once the payloads are read.
+        self.pages[page] = (payloads, arrived, on_response)
+        page.on("response", on_response)
+
+    async def wait_for_payload(self, page, timeout):
+        """
+        Page method: waits until min_payloads JSON responses were captured, but no
+        longer than `timeout` ms. Returns the captured payloads (may be empty).
+        """
+        if page not in self.pages:
+            return []
+        payloads, arrived, on_response = self.pages.pop(page)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(arrived.wait(), timeout / 1000)
+        except asyncio.TimeoutError:
+            pass
+        page.remove_listener("response", on_response)
+        waited = (time.monotonic() - start) * 1000
+        self.crawler.stats.inc_value("api_capture/waited_ms", int(waited))
+        observe(self.crawler.stats, "playwright/wait", waited)
+        return list(payloads)
+
+    def fill(self, item, payloads, response):
+        """Sets the item fields found in the payloads (first payload holding a value wins)."""
+        for field_name, steps in self.fields:
+            for payload in payloads:
+                values = [value if isinstance(value, str) else str(value) for value in json_path_values(payload, steps)]
+                if field_name in ("offer_image_url", "vendor_icon_url"):
+                    values = [response.urljoin(value) for value in values]
+                values = process_values(self.input_processors[field_name], values)
+                if values:
+                    value = self.output_processors[field_name](values)
+                    if value is not None:
+                        item[field_name] = value
+                    break
+        return item
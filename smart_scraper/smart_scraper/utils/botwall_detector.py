@@ -0,0 +1,48 @@
+import re
+
+
+# Statuses returned by anti-bot solutions instead of the product page.
+BOT_WALL_STATUSES = (403, 429, 503)
+
+# Markers found in the <title> of challenge pages (Cloudflare, Akamai, Imperva, ...).
+TITLE_MARKERS = (
+    "just a moment",
+    "attention required",
+    "access denied",
+    "pardon our interruption",
+    "are you a robot",
+    "captcha",
+)
+
+# Markers only trusted on small pages, real product pages can embed them too.
+BODY_MARKERS = (
+    "cf-browser-verification",
+    "cf_chl_opt",
+    "captcha-delivery.com",
+    "px-captcha",
+    "_incapsula_resource",
+    "verify you are human",
+    "enable javascript and cookies to continue",
+)
+
+SMALL_PAGE_SIZE = 20000
+
+title_regex = re.compile(rb"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+# Checks if a response looks like an anti-bot wall instead of the expected page.
+def is_bot_wall(response):
+    if response.status in BOT_WALL_STATUSES:
+        return True
+
+    body = response.body or b""
+    title = title_regex.search(body[:SMALL_PAGE_SIZE])
+    if title:
+        title_text = title.group(1).decode("utf-8", "ignore").lower()
+        if any(marker in title_text for marker in TITLE_MARKERS):
+            return True
+
+    if len(body) < SMALL_PAGE_SIZE:
+        text = body.decode("utf-8", "ignore").lower()
+        return any(marker in text for marker in BODY_MARKERS)
+    return False
@@ -0,0 +1,137 @@
+import math
+import logging
+from scrapy.utils.defer import deferred_from_coro
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPool:
+    """
+    Spreads the Playwright requests of a config over a fixed number of browser
+    contexts, optionally keeps pages open to reuse them for the next requests, and
+    recycles each context (new context, old one closed once idle) after a number of
+    navigations to keep Chromium memory bounded.
+    Requests are only counted (in flight, navigations) once they reach the download
+    handler (checkout()): requests filtered or dropped before their download never
+    hold a context open. Free pages are handed out there too, and are closed instead
+    of kept while a request of their context waits for a new page: open pages hold
+    scrapy-playwright's per-context page slots.
+    """
+
+    def __init__(self, name, contexts=1, max_pages=4, recycle_after=0, reuse_pages=False):
+        self.name = name
+        self.contexts = max(contexts, 1)
+        self.max_pages = max(max_pages, 1)
+        self.recycle_after = recycle_after
+        self.reuse_pages = reuse_pages
+        # PLAYWRIGHT_MAX_PAGES_PER_CONTEXT, set by the spider.
+        self.pages_per_context = math.ceil(self.max_pages / self.contexts)
+
+        self.next_slot = 0
+        self.generations = [0] * self.contexts
+        self.navigations = [0] * self.contexts
+        self.in_flight = {}
+        self.free_pages = {}
+        # Requests checked out without a free page, until their new page is created.
+        self.waiting = {}
+        self.browser_contexts = {}
+        self.retiring = set()
+
+    def context_name(self, slot):
+        return f"{self.name}-{slot}-{self.generations[slot]}"
+
+    def assign(self, meta):
+        """Adds the context slot to the meta of a Playwright request being built."""
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.contexts
+        meta["browser_pool_slot"] = slot
+        meta["playwright_context"] = self.context_name(slot)
+        if self.reuse_pages:
+            meta["playwright_include_page"] = True
+        return meta
+
+    def checkout(self, meta):
+        """
+        Called when a Playwright request reaches the download handler: counts it in
+        the current context of its slot and gives it a free page if any. Retries
+        (copies of a checked out request) keep their context and count.
+        """
+        slot = meta.get("browser_pool_slot")
+        if slot is None or meta.get("browser_pool_checked_out"):
+            return meta
+        name = self.context_name(slot)
+        meta["playwright_context"] = name
+        meta["browser_pool_checked_out"] = True
+        self.in_flight[name] = self.in_flight.get(name, 0) + 1
+
+        self.navigations[slot] += 1
+        if self.recycle_after and self.navigations[slot] >= self.recycle_after:
+            self.navigations[slot] = 0
+            self.generations[slot] += 1
+            self.retiring.add(name)
+            logger.debug("Recycling browser context %s", name)
+
+        if not self.reuse_pages or meta.get("playwright_page") is not None:
+            return meta
+        free_pages = self.free_pages.get(name)
+        if free_pages:
+            meta["playwright_page"] = free_pages.pop()
+            # Page event handlers are still attached from its first request.
+            meta.pop("playwright_page_event_handlers", None)
+        else:
+            meta["browser_pool_waiting"] = True
+            self.waiting[name] = self.waiting.get(name, 0) + 1
+        return meta
+
+    def stop_waiting(self, meta):
+        name = meta.get("playwright_context")
+        if meta.pop("browser_pool_waiting", False) and name in self.waiting:
+            self.waiting[name] -= 1
+
+    def register_page(self, page, request):
+        """Page init callback part: remembers the browser context of each context name."""
+        self.browser_contexts[request.meta["playwright_context"]] = page.context
+        self.stop_waiting(request.meta)
+
+    def release(self, meta):
+        """Must be called once a Playwright response (or failure) has been handled."""
+        name = meta.get("playwright_context")
+        if not meta.pop("browser_pool_checked_out", False) or name not in self.in_flight:
+            return
+        self.in_flight[name] -= 1
+        # Failed before its page was created.
+        self.stop_waiting(meta)
+
+        page = meta.get("playwright_page")
+        if page is not None:
+            free_pages = self.free_pages.setdefault(name, [])
+            # A page kept open would hold the page slot a waiting request needs.
+            if (name in self.retiring or page.is_closed() or self.waiting.get(name)
+                    or len(free_pages) >= self.pages_per_context):
+                self._close(page)
+            else:
+                free_pages.append(page)
+
+        if name in self.retiring and self.in_flight[name] <= 0:
+            self.retire(name)
+
+    def retire(self, name):
+        """Closes a recycled context and its free pages."""
+        self.retiring.discard(name)
+        self.in_flight.pop(name, None)
+        self.waiting.pop(name, None)
+        self.free_pages.pop(name, None)
+        context = self.browser_contexts.pop(name, None)
+        if context is not None:
+            self._close(context)
+
+    def close(self):
+        """Closes every pooled page (contexts are closed by scrapy-playwright)."""
+        for pages in self.free_pages.values():
+            for page in pages:
+                self._close(page)
+        self.free_pages.clear()
+
+    def _close(self, target):
+        d = deferred_from_coro(target.close())
+        d.addErrback(lambda failure: logger.debug("Error while closing %s: %s", target, failure.value))
@@ -1,8 +1,74 @@
 import os
+import gzip
 import json
+import pickle
 import random
-from pydantic import BaseModel, HttpUrl, field_validator
-from typing import Dict, List, Optional
+import sqlite3
+import hashlib
+from fnmatch import fnmatchcase
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from w3lib.url import canonicalize_url
+from pydantic import BaseModel, HttpUrl, PrivateAttr, field_validator, model_validator
+from scrapy.utils.project import data_path
+from typing import Dict, List, Optional, Union
+
+# Query parameters removed from every URL ("*" wildcards allowed): they do not change the page.
+TRACKING_PARAMETERS = ("utm_*", "gclid", "fbclid", "msclkid", "_ga", "_gl")
+
+
+# Returns the canonical form of an URL: lower-case host, sorted query, no fragment nor tracking/dropped parameters.
+def normalize_url(url, drop_parameters=(), keep_fragments=False):
+    url = url.strip()
+    parts = urlsplit(url)
+    if parts.query:
+        patterns = TRACKING_PARAMETERS + tuple(drop_parameters)
+        parameters = parse_qsl(parts.query, keep_blank_values=True)
+        query = [(key, value) for key, value in parameters if not any(fnmatchcase(key, pattern) for pattern in patterns)]
+        if len(query) != len(parameters):
+            url = urlunsplit(parts._replace(query=urlencode(query)))
+    return canonicalize_url(url, keep_fragments=keep_fragments)
+
+
+# User-Agents picked at random for each query.
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:102.0) Gecko/20100101 Firefox/102.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/100.0.1185.39",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/537.36 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/537.36",
+    "Mozilla/5.0 (Android 11; Mobile; rv:89.0) Gecko/89.0 Firefox/89.0",
+    "Mozilla/5.0 (iPad; CPU OS 14_0 like Mac OS X) AppleWebKit/537.36 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Brave/1.36.109 Chrome/99.0.4844.51 Safari/537.36",
+]
+
+
+# Yields the URLs of a manifest file: one URL per line (.txt), JSON lines with an "url" or
+# "detail_url" field (.jsonl, urls_spider output), both optionally gzipped (.gz), or the "url"
+# column of the "urls" table of a SQLite database (.db, .sqlite).
+def read_manifest(path):
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            for (url,) in connection.execute("SELECT url FROM urls ORDER BY rowid"):
+                if url:
+                    yield url.strip()
+        finally:
+            connection.close()
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    json_lines = path.removesuffix(".gz").endswith((".jsonl", ".jl"))
+    with opener(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if json_lines:
+                value = json.loads(line)
+                line = value if isinstance(value, str) else value.get("url") or value.get("detail_url")
+                if not line:
+                    continue
+            yield line
+
 
 # Defines validation models with Pydantic
 class HeadersConfig(BaseModel):
@@ -11,17 +77,7 @@ class HeadersConfig(BaseModel):
 
     def get_random_user_agent(self):
         """Returns a random User-Agent for each query."""
-        user_agents = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:102.0) Gecko/20100101 Firefox/102.0",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/100.0.1185.39",
-            "Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/537.36 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/537.36",
-            "Mozilla/5.0 (Android 11; Mobile; rv:89.0) Gecko/89.0 Firefox/89.0",
-            "Mozilla/5.0 (iPad; CPU OS 14_0 like Mac OS X) AppleWebKit/537.36 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Brave/1.36.109 Chrome/99.0.4844.51 Safari/537.36"
-        ]
-        return random.choice(user_agents)
+        return random.choice(USER_AGENTS)
 
 class ScrollConfig(BaseModel):
     enabled: bool = False
@@ -32,9 +88,79 @@ class PaginationConfig(BaseModel):
     enabled: bool
     selector: Optional[str]
 
+class ResourceBlockingConfig(BaseModel):
+    resource_types: List[str] = ["image", "media", "font"]
+    url_patterns: List[str] = [
+        "google-analytics.com",
+        "googletagmanager.com",
+        "doubleclick.net",
+        "googlesyndication.com",
+        "facebook.net",
+        "connect.facebook",
+        "hotjar.com",
+        "criteo.",
+        "tiktok.com",
+        "pinterest.com",
+        "snapchat.com",
+        "bing.com",
+        "contentsquare.net",
+        "abtasty.com",
+    ]
+    block_third_party: bool = False
+    # URL substrings never blocked (e.g. a script the site needs to render prices).
+    allowlist: List[str] = []
+
+class BrowserPoolConfig(BaseModel):
+    contexts: int = 1
+    # Maximum number of pages rendered at the same time for this config.
+    max_pages: int = 4
+    # Replace a context by a fresh one after this many navigations (0 = never).
+    recycle_after: int = 0
+    reuse_pages: bool = False
+
 class AntiBotConfig(BaseModel):
     use_playwright: bool
     delay: int
+    # Re-fetch once with Playwright if a static response is incomplete or a bot wall.
+    playwright_fallback: bool = False
+    # Wait for the product selectors (delay and scroll.delay become upper bounds).
+    smart_wait: bool = False
+    # Abort the page sub-requests we do not need ({} to use the defaults).
+    block_resources: Optional[ResourceBlockingConfig] = None
+    # Pool of browser contexts/pages, can be overridden with spider arguments.
+    pool: Optional[BrowserPoolConfig] = None
+
+class UrlRulesConfig(BaseModel):
+    # Query parameters removed from base_urls on top of TRACKING_PARAMETERS ("*" wildcards allowed),
+    # e.g. a colour variant parameter to crawl each product once.
+    drop_parameters: List[str] = []
+    # Keep "#..." in base_urls (only if the rendered page depends on it).
+    keep_fragments: bool = False
+
+class DiscoveryConfig(BaseModel):
+    # Sitemap URLs, read from robots.txt (then /sitemap.xml) of the site if empty.
+    sitemaps: List[str] = []
+    # Regular expressions: sitemap index entries to follow and product URLs to keep (everything if empty).
+    sitemap_follow: List[str] = []
+    url_patterns: List[str] = []
+    # Listing pages scrolled with Playwright, only if the sitemaps give no product URL.
+    start_urls: List[str] = []
+    # Product links (CSS or XPath, e.g. "a.product-tile::attr(href)") and next page link of listing pages.
+    link_selector: Optional[str] = None
+    next_page_selector: Optional[str] = None
+    max_scrolls: int = 30
+    # Upper bound of the wait for new products after each scroll (ms).
+    scroll_delay: int = 3000
+
+class ApiCaptureConfig(BaseModel):
+    # Regular expressions of the XHR/fetch URLs to record (every JSON response if empty).
+    url_patterns: List[str] = []
+    content_types: List[str] = ["application/json"]
+    # Item fields filled from the recorded JSON, e.g. {"offer_price": "$.product.price.value"}.
+    fields: Dict[str, str]
+    # Number of matching responses to wait for, and upper bound of that wait (ms).
+    min_payloads: int = 1
+    timeout: int = 10000
 
 class SelectorsConfig(BaseModel):
     product_name: str
@@ -47,7 +173,8 @@ class SelectorsConfig(BaseModel):
     tags: Optional[str] = None
 
 class ScraperConfig(BaseModel):
-    base_urls: List[HttpUrl]
+    # A list of URLs, or the path (relative to the configs directory) of a manifest file read while crawling.
+    base_urls: Union[List[HttpUrl], str]
     brand_name: Optional[str] = None
     brand_url: Optional[str] = None
     vendor_name: Optional[str] = None
@@ -55,25 +182,151 @@ class ScraperConfig(BaseModel):
     currency: Optional[str] = "EUR"
     gender: Optional[str] = None
     selectors: SelectorsConfig
+    # Skips the selectors when the JSON-LD of a page fills every required field.
+    jsonld_first: bool = False
     pagination: Optional[PaginationConfig] = None
     anti_bot: Optional[AntiBotConfig] = None
     headers: Optional[HeadersConfig] = None
     scroll: Optional[ScrollConfig] = None
+    # Site specific canonicalisation of base_urls.
+    url_rules: Optional[UrlRulesConfig] = None
+    # Product URLs discovery (urls_spider, main_spider with discover=true).
+    discovery: Optional[DiscoveryConfig] = None
+    # Product data read from the JSON responses of Playwright pages.
+    api_capture: Optional[ApiCaptureConfig] = None
+
+    # Number of base_urls removed as duplicates of another URL once canonicalised
+    # (counted while the manifest is read) and of invalid manifest URLs.
+    _removed_urls: int = PrivateAttr(default=0)
+    _invalid_urls: int = PrivateAttr(default=0)
+
+    @model_validator(mode="after")
+    def canonicalize_base_urls(self):
+        """Canonicalises base_urls and drops the duplicates, keeping the first occurrence."""
+        if isinstance(self.base_urls, str):
+            if not os.path.isfile(self.manifest_path):
+                raise ValueError(f"base_urls manifest not found: {self.manifest_path}")
+            return self
+        rules = self.url_rules or UrlRulesConfig()
+        urls = dict.fromkeys(
+            normalize_url(str(url), rules.drop_parameters, rules.keep_fragments) for url in self.base_urls
+        )
+        self._removed_urls = len(self.base_urls) - len(urls)
+        self.base_urls = [HttpUrl(url) for url in urls]
+        return self
+
+    @property
+    def manifest_path(self):
+        """Absolute path of the base_urls manifest, None if base_urls is a list."""
+        if isinstance(self.base_urls, str):
+            return os.path.join(CONFIGS_DIR, self.base_urls)
+        return None
+
+    @property
+    def removed_urls(self):
+        return self._removed_urls
+
+    @property
+    def invalid_urls(self):
+        return self._invalid_urls
+
+    def iter_urls(self):
+        """Yields the canonical start URLs, a manifest is streamed and deduplicated on the fly."""
+        if not isinstance(self.base_urls, str):
+            yield from (str(url) for url in self.base_urls)
+            return
+        rules = self.url_rules or UrlRulesConfig()
+        # 8 bytes digests of the URLs already yielded, smaller than the URLs themselves.
+        seen = set()
+        self._removed_urls = self._invalid_urls = 0
+        for url in read_manifest(self.manifest_path):
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https") or not parts.netloc:
+                self._invalid_urls += 1
+                continue
+            url = normalize_url(url, rules.drop_parameters, rules.keep_fragments)
+            digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+            if digest in seen:
+                self._removed_urls += 1
+                continue
+            seen.add(digest)
+            yield url
+
+
+# Directory holding the JSON config files.
+CONFIGS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../configs"))
+
+
+# Changes of the models above invalidate the cached configs: their fields change the schema,
+# bump CACHE_VERSION when a validator changes what a config loads to.
+CACHE_VERSION = 1
+MODELS_VERSION = hashlib.sha1(
+    json.dumps([CACHE_VERSION, ScraperConfig.model_json_schema()], sort_keys=True).encode()
+).hexdigest()
 
 
 # JSON validation and load function
-def load_config(json_filename):
-    """Loads and validates a configuration JSON file."""
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../configs"))
-    json_path = os.path.join(base_dir, json_filename)
+def load_config(json_filename, use_cache=True):
+    """
+    Loads and validates a configuration JSON file. Validated configs are cached in
+    .scrapy/config_cache, keyed by the file mtime/size and content hash.
+    """
+    json_path = os.path.join(CONFIGS_DIR, json_filename)
+    cache_path = None
+    cached = None
+    try:
+        stat = os.stat(json_path)
+        key = (stat.st_mtime_ns, stat.st_size, MODELS_VERSION)
+        if use_cache:
+            cache_path = os.path.join(data_path("config_cache", createdir=True), f"{os.path.basename(json_path)}.pickle")
+            cached = read_cached_config(cache_path)
+            # Same mtime and size: the file was not touched since it was cached.
+            if cached and cached["key"] == key:
+                return cached["config"]
+    except OSError:
+        pass
 
     try:
-        with open(json_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        return ScraperConfig(**data)  # Automatic validation with Pydantic
+        with open(json_path, "rb") as file:
+            raw = file.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        # Touched but identical (e.g. a git checkout): only the key is refreshed.
+        if cached and cached["digest"] == digest:
+            config = cached["config"]
+        else:
+            config = ScraperConfig(**json.loads(raw))  # Automatic validation with Pydantic
     except Exception as e:
         raise ValueError(f"file validation error. {json_filename}: {e}")
 
+    if cache_path:
+        write_cached_config(cache_path, {"key": key, "digest": digest, "config": config})
+    return config
+
+
+# Returns a cached config entry, None if missing, unreadable or written by other models.
+def read_cached_config(cache_path):
+    try:
+        with open(cache_path, "rb") as file:
+            entry = pickle.load(file)
+    except Exception:
+        return None
+    key = entry.get("key") if isinstance(entry, dict) else None
+    if not key or key[-1] != MODELS_VERSION:
+        return None
+    return entry
+
+
+# Writes a cached config entry atomically (several processes may load the same config).
+def write_cached_config(cache_path, entry):
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
 # validation test
 # if __name__ == "__main__":
 #     try:
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import time
+from contextlib import contextmanager
+
+# Upper bounds (ms) of the stage timing histogram buckets, the last bucket is "inf".
+STAGE_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+stage_key_regex = re.compile(r"^timing/(.+)/(count|sum_ms|le_(\d+|inf))$")
+field_key_regex = re.compile(r"^fields/([^/]+)/([^/]+)$")
+incomplete_key_regex = re.compile(r"^incomplete/fields/([^/]+)$")
+
+
+# Adds a duration (ms) to the histogram of a stage, kept in the crawl stats as
+# timing/<stage>/count, timing/<stage>/sum_ms and timing/<stage>/le_<bucket> (not cumulative),
+# so the stats of several processes (scrapy shard) can simply be summed.
+def observe(stats, stage, ms):
+    bucket = next((bound for bound in STAGE_BUCKETS_MS if ms <= bound), "inf")
+    stats.inc_value(f"timing/{stage}/count")
+    stats.inc_value(f"timing/{stage}/sum_ms", round(ms, 3))
+    stats.inc_value(f"timing/{stage}/le_{bucket}")
+
+
+# Context manager adding the time spent in its block to a stage histogram.
+@contextmanager
+def timed(stats, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stats, stage, (time.perf_counter() - start) * 1000)
+
+
+# Returns the upper bound (ms) of the bucket holding the q quantile, None for the "inf" bucket.
+def bucket_quantile(buckets, count, q):
+    rank = q * count
+    seen = 0
+    for bound in STAGE_BUCKETS_MS:
+        seen += buckets.get(str(bound), 0)
+        if seen >= rank:
+            return bound
+    return None
+
+
+# Groups the stage histograms of a stats dict: {stage: {count, sum_ms, mean_ms, p50_ms, p90_ms, p99_ms, buckets}}.
+def stage_summary(stats):
+    stages = {}
+    for key, value in stats.items():
+        match = stage_key_regex.match(key)
+        if not match:
+            continue
+        stage = stages.setdefault(match.group(1), {"count": 0, "sum_ms": 0, "buckets": {}})
+        if match.group(3):
+            stage["buckets"][match.group(3)] = value
+        else:
+            stage[match.group(2)] = value
+
+    for stage in stages.values():
+        count = stage["count"]
+        stage["sum_ms"] = round(stage["sum_ms"], 3)
+        stage["mean_ms"] = round(stage["sum_ms"] / count, 3) if count else None
+        for name, q in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99)):
+            stage[name] = bucket_quantile(stage["buckets"], count, q) if count else None
+    return dict(sorted(stages.items()))
+
+
+# Returns the field sources (selector, jsonld, api, config, computed, default) and their share per field.
+def field_summary(stats):
+    fields = {}
+    for key, value in stats.items():
+        match = field_key_regex.match(key)
+        if match:
+            fields.setdefault(match.group(1), {})[match.group(2)] = value
+    summary = {}
+    for field, sources in sorted(fields.items()):
+        total = sum(sources.values())
+        summary[field] = {
+            "sources": dict(sorted(sources.items())),
+            "hit_rate": round(1 - sources.get("default", 0) / total, 4) if total else None,
+        }
+    return summary
+
+
+# Returns the incomplete (dropped) items count, their rate and the missing fields that caused them.
+def incomplete_summary(stats):
+    items = stats.get("fields/items", 0)
+    dropped = stats.get("incomplete/items", 0)
+    missing = {}
+    for key, value in stats.items():
+        match = incomplete_key_regex.match(key)
+        if match:
+            missing[match.group(1)] = value
+    return {
+        "items": dropped,
+        "drop_rate": round(dropped / items, 4) if items else None,
+        "missing_fields": {
+            field: {"items": count, "drop_rate": round(count / items, 4) if items else None}
+            for field, count in sorted(missing.items(), key=lambda entry: -entry[1])
+        },
+    }
+
+
+def metrics_report(stats, config_name):
+    """Stage timings, field hit rates and incomplete items of a crawl, from its stats."""
+    return {
+        "config": config_name,
+        "items": stats.get("item_scraped_count", 0),
+        "stages": stage_summary(stats),
+        "fields": field_summary(stats),
+        "incomplete": incomplete_summary(stats),
+    }
+
+
+# Escapes a Prometheus label value.
+def label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def prometheus_text(stats, config_name):
+    """Prometheus text exposition of the crawl stats (as read by the node_exporter textfile collector)."""
+    base = f'config="{label(config_name)}"'
+    lines = [
+        "# HELP smart_scraper_stage_seconds Time spent per request in each crawl stage.",
+        "# TYPE smart_scraper_stage_seconds histogram",
+    ]
+    for stage, summary in stage_summary(stats).items():
+        stage_labels = f'{base},stage="{label(stage)}"'
+        cumulative = 0
+        for bound in STAGE_BUCKETS_MS:
+            cumulative += summary["buckets"].get(str(bound), 0)
+            lines.append(f'smart_scraper_stage_seconds_bucket{{{stage_labels},le="{bound / 1000:g}"}} {cumulative}')
+        lines.append(f'smart_scraper_stage_seconds_bucket{{{stage_labels},le="+Inf"}} {summary["count"]}')
+        lines.append(f"smart_scraper_stage_seconds_sum{{{stage_labels}}} {summary['sum_ms'] / 1000:.10g}")
+        lines.append(f"smart_scraper_stage_seconds_count{{{stage_labels}}} {summary['count']}")
+
+    lines += [
+        "# HELP smart_scraper_field_source_total Items per field and source of its value.",
+        "# TYPE smart_scraper_field_source_total counter",
+    ]
+    for field, summary in field_summary(stats).items():
+        for source, count in summary["sources"].items():
+            lines.append(f'smart_scraper_field_source_total{{{base},field="{label(field)}",source="{label(source)}"}} {count}')
+
+    lines += [
+        "# HELP smart_scraper_incomplete_items_total Incomplete items dropped, per missing required field.",
+        "# TYPE smart_scraper_incomplete_items_total counter",
+    ]
+    for field, summary in incomplete_summary(stats)["missing_fields"].items():
+        lines.append(f'smart_scraper_incomplete_items_total{{{base},field="{label(field)}"}} {summary["items"]}')
+
+    lines += [
+        "# HELP smart_scraper_stat Other numeric Scrapy stats of the crawl.",
+        "# TYPE smart_scraper_stat gauge",
+    ]
+    for key, value in sorted(stats.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if stage_key_regex.match(key) or field_key_regex.match(key) or key.startswith("incomplete/"):
+            continue
+        lines.append(f'smart_scraper_stat{{{base},name="{label(key)}"}} {value:.10g}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(directory, stats, config_name, prometheus_only=False):
+    """Writes <config>.prom (and <config>.json) in directory, replaced atomically for scrapers."""
+    os.makedirs(directory, exist_ok=True)
+    files = [(f"{config_name}.prom", prometheus_text(stats, config_name))]
+    if not prometheus_only:
+        files.append((f"{config_name}.json", json.dumps(metrics_report(stats, config_name), indent=4)))
+    for name, text in files:
+        path = os.path.join(directory, name)
+        temporary_path = os.path.join(directory, f".{name}.tmp")
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temporary_path, path)
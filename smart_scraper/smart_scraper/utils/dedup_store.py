@@ -0,0 +1,147 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import hashlib
+from scrapy.exceptions import DropItem
+from smart_scraper.utils.config_loader import normalize_url
+
+
+# Returns the dedup key of an item: 16 bytes hashes of its normalised offer_url and of its other fields.
+def dedup_key(item):
+    data = dict(item)
+    url = normalize_url(str(data.pop("offer_url", None) or ""))
+    fields = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return (
+        hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest(),
+        hashlib.blake2b(fields.encode("utf-8"), digest_size=16).digest(),
+    )
+
+
+class DuplicateItem(DropItem):
+    """Raised by DedupPipeline for an item already emitted."""
+
+
+class BloomFilter:
+    """
+    In-memory Bloom filter of 16 bytes keys (already hashed, so bit positions are
+    taken from the key itself by double hashing). Sized for a capacity and a false
+    positive rate, about 1.8 MB for a million keys at 0.1%.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class DedupStore:
+    """
+    On-disk (SQLite) store of the last emitted version of each product: the
+    fingerprint of its fields by normalised offer_url, with the run that emitted
+    it. An item is a duplicate when its URL has this fingerprint, so a product
+    that changes back to an earlier version is emitted again. An in-memory Bloom
+    filter of the (URL, fingerprint) pairs answers most lookups of new items
+    without reading the database. Its bits are saved in the store on close; a
+    pair missing from the filter is still caught by the upsert, so an outdated
+    filter only costs reads.
+    """
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit (cheap with WAL and synchronous=NORMAL): processes sharing the store
+        # (shard workers) never wait for a transaction left open by another one.
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS offers ("
+            "url BLOB PRIMARY KEY, fingerprint BLOB, config TEXT, run TEXT, emitted_at REAL) WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS bloom (id INTEGER PRIMARY KEY, size INTEGER, hash_count INTEGER, bits BLOB)"
+        )
+        self.run = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{id(self)}"
+
+        # Capacity doubled until it leaves room for as many new keys as known ones.
+        count = self.connection.execute("SELECT COUNT(*) FROM offers").fetchone()[0]
+        while capacity < 2 * count:
+            capacity *= 2
+        self.bloom = BloomFilter(capacity, error_rate)
+        if not self.load_bloom():
+            for url, fingerprint in self.connection.execute("SELECT url, fingerprint FROM offers"):
+                self.bloom.add(self.bloom_key(url, fingerprint))
+
+    @staticmethod
+    def bloom_key(url, fingerprint):
+        return hashlib.blake2b(url + fingerprint, digest_size=16).digest()
+
+    def load_bloom(self):
+        """Loads the saved filter bits if they have the current dimensions."""
+        row = self.connection.execute("SELECT size, hash_count, bits FROM bloom WHERE id = 1").fetchone()
+        if not row or row[0] != self.bloom.size or row[1] != self.bloom.hash_count:
+            return False
+        self.bloom.bits = bytearray(row[2])
+        return True
+
+    def save_bloom(self):
+        """Saves the filter bits, merged with the ones saved meanwhile by other processes."""
+        bits = self.bloom.bits
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute("SELECT size, hash_count, bits FROM bloom WHERE id = 1").fetchone()
+            if row and row[0] == self.bloom.size and row[1] == self.bloom.hash_count:
+                merged = int.from_bytes(bits, "little") | int.from_bytes(row[2], "little")
+                bits = merged.to_bytes(len(bits), "little")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO bloom VALUES (1, ?, ?, ?)", (self.bloom.size, self.bloom.hash_count, bytes(bits))
+            )
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def check(self, key, config=None):
+        """
+        Records the version of a product, returns None for a new or changed one,
+        "run" if this run already emitted it and "previous_run" if the last
+        version emitted by an earlier run (or another process) is the same.
+        """
+        url, fingerprint = key
+        bloom_key = self.bloom_key(url, fingerprint)
+        if bloom_key in self.bloom:
+            row = self.connection.execute("SELECT fingerprint, run FROM offers WHERE url = ?", (url,)).fetchone()
+            if row and row[0] == fingerprint:
+                return "run" if row[1] == self.run else "previous_run"
+        self.bloom.add(bloom_key)
+        # The upsert leaves the row of the same version, written by another process since the store was opened.
+        changed = self.connection.execute(
+            "INSERT INTO offers VALUES (?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+            "fingerprint = excluded.fingerprint, config = excluded.config, run = excluded.run, emitted_at = excluded.emitted_at "
+            "WHERE fingerprint != excluded.fingerprint",
+            (url, fingerprint, config, self.run, time.time()),
+        ).rowcount
+        return None if changed else "previous_run"
+
+    def claim(self, key):
+        """Marks a product version emitted by an earlier run as emitted by this run."""
+        self.connection.execute("UPDATE offers SET run = ? WHERE url = ?", (self.run, key[0]))
+
+    def close(self):
+        self.save_bloom()
+        self.connection.close()
@@ -0,0 +1,80 @@
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+# Returns the wait (seconds) asked by a Retry-After header (delay or HTTP date), None if absent or invalid.
+def parse_retry_after(value):
+    if not value:
+        return None
+    value = value.decode("latin-1") if isinstance(value, bytes) else str(value)
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class DomainThrottle:
+    """
+    Concurrency and download delay of one domain (downloader slot), adapted to what
+    the site tolerates. A block (403/429/503) halves the concurrency and doubles the
+    delay (at least the Retry-After wait), once per burst of requests sent at the same
+    pace. ramp_up_after clean responses in a row add one concurrent request and halve
+    the delay back, unless the latency has doubled.
+    """
+
+    def __init__(self, concurrency, delay, max_delay=60, ramp_up_after=20, window=100):
+        # The slot settings at start-up are the ceiling and the floor.
+        self.max_concurrency = max(concurrency, 1)
+        self.min_delay = delay
+        self.max_delay = max_delay
+        self.ramp_up_after = ramp_up_after
+        self.concurrency = self.max_concurrency
+        self.delay = delay
+        self.clean_streak = 0
+        # Time of the last slow down: blocks of requests sent before it do not slow down again.
+        self.slowed_down_at = 0.0
+        # Latency (s): moving average and lowest average seen.
+        self.latency = None
+        self.best_latency = None
+        # Outcomes (True = blocked) of the last responses.
+        self.outcomes = deque(maxlen=window)
+
+    @property
+    def block_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def on_block(self, retry_after=None, sent_at=None):
+        """Slows down after a block, returns True if the concurrency or delay changed."""
+        self.outcomes.append(True)
+        self.clean_streak = 0
+        previous = (self.concurrency, self.delay)
+        if sent_at is None or sent_at >= self.slowed_down_at:
+            self.concurrency = max(self.concurrency // 2, 1)
+            self.delay = min(max(self.delay * 2, 1.0), self.max_delay)
+            self.slowed_down_at = time.time()
+        self.delay = min(max(self.delay, retry_after or 0), self.max_delay)
+        return (self.concurrency, self.delay) != previous
+
+    def on_success(self, latency=None):
+        """Ramps back up after enough clean responses, returns True if the concurrency or delay changed."""
+        self.outcomes.append(False)
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.best_latency = self.latency if self.best_latency is None else min(self.best_latency, self.latency)
+
+        self.clean_streak += 1
+        if self.clean_streak < self.ramp_up_after:
+            return False
+        self.clean_streak = 0
+        # A slower server is a warning too: hold the current pace.
+        if self.latency is not None and self.latency > 2 * self.best_latency:
+            return False
+
+        previous = (self.concurrency, self.delay)
+        self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+        self.delay = max(self.delay / 2, self.min_delay) if self.delay / 2 > 0.1 else self.min_delay
+        return (self.concurrency, self.delay) != previous
@@ -0,0 +1,174 @@
+import logging
+from lxml import etree
+from cssselect import SelectorError
+from parsel.csstranslator import css2xpath
+from itemloaders.processors import MapCompose
+from itemloaders.utils import arg_to_iter
+from smart_scraper.items import ProductItem, ProductLoader, default_if_empty
+
+logger = logging.getLogger(__name__)
+
+# Namespaces available in Scrapy selectors (EXSLT regular expressions and sets).
+XPATH_NAMESPACES = {"re": "http://exslt.org/regular-expressions", "set": "http://exslt.org/sets"}
+
+
+# Checks the selector type (css ou Xpath).
+def is_xpath(selector):
+    return selector.strip().startswith(("/", ".//", "./"))
+
+
+# Translates a CSS selector (::text and ::attr() included) if needed and compiles it.
+def compile_selector(field_name, selector):
+    try:
+        query = selector if is_xpath(selector) else css2xpath(selector)
+        return etree.XPath(query, namespaces=XPATH_NAMESPACES, smart_strings=False)
+    except (SelectorError, etree.XPathError) as e:
+        raise ValueError(f"Invalid selector for '{field_name}': {selector} ({e})")
+
+
+# Serializes an XPath result the way Selector.getall() does.
+def to_text(node):
+    if isinstance(node, str):
+        return node
+    try:
+        return etree.tostring(node, method="html", encoding="unicode", with_tail=False)
+    except (AttributeError, TypeError):
+        if node is True:
+            return "1"
+        if node is False:
+            return "0"
+        return str(node)
+
+
+# Applies a chain of MapCompose functions to a list of values (None dropped, lists flattened).
+def apply_functions(functions, values):
+    for function in functions:
+        next_values = []
+        for value in values:
+            next_values += arg_to_iter(function(value))
+        values = next_values
+    return values
+
+
+class FieldRule:
+    """
+    How one field is collected: a compiled XPath, the response URL or a fixed
+    value, followed by the field input processor fused into a single function chain.
+    """
+    __slots__ = ("name", "xpath", "from_url", "join_urls", "functions", "input_processor", "fixed")
+
+    def __init__(self, name, input_processor, xpath=None, from_url=False, join_urls=False, value=None):
+        self.name = name
+        self.xpath = xpath
+        self.from_url = from_url
+        self.join_urls = join_urls
+        # MapCompose functions are run inline, any other processor gets the whole list.
+        if isinstance(input_processor, MapCompose):
+            self.functions = list(input_processor.functions)
+            self.input_processor = None
+        else:
+            self.functions = []
+            self.input_processor = input_processor
+        # A fixed value is processed once, here.
+        self.fixed = None
+        if xpath is None and not from_url:
+            self.fixed = self.process(arg_to_iter(value)) if value is not None else []
+
+    def process(self, values):
+        values = apply_functions(self.functions, values)
+        if self.input_processor is not None:
+            values = arg_to_iter(self.input_processor(values))
+        return values
+
+    def collect(self, response, root):
+        """Returns the values collected for this field on a response."""
+        if self.fixed is not None:
+            return self.fixed
+        if self.from_url:
+            values = [response.url]
+        else:
+            result = self.xpath(root)
+            values = [to_text(node) for node in (result if isinstance(result, list) else [result])]
+        if self.join_urls:
+            values = [response.urljoin(value) for value in values]
+        return self.process(values)
+
+
+class ExtractionPlan:
+    """
+    The selectors and fixed values of a config compiled once into lxml XPath objects
+    and ProductLoader processors, so that parse() does not build an ItemLoader,
+    re-classify and re-translate every selector for each response.
+    extract() returns the same ProductItem as the ProductLoader would.
+    """
+
+    def __init__(self, config):
+        self.loader = ProductLoader(item=ProductItem())
+        self.output_processors = {field: self.loader.get_output_processor(field) for field in ProductItem.fields}
+
+        selectors = config.selectors
+        brand_name_selector = getattr(selectors, "brand_name", None)
+        gender = config.gender or (config.headers.Referer if config.headers else None)
+
+        # Same order as the former add_css/add_xpath/add_value calls of parse().
+        self.rules = []
+        if brand_name_selector:
+            self.add_selector("brand_name", brand_name_selector)
+        elif getattr(config, "brand_name", None):
+            self.add_value("brand_name", config.brand_name)
+        if selectors.discount_percentage:
+            self.add_selector("discount_percentage", selectors.discount_percentage)
+        self.add_selector("product_name", selectors.product_name)
+        self.add_selector("offer_price", selectors.offer_price)
+        self.add_selector("discount_price", selectors.discount_price)
+        self.add_selector("product_description", selectors.product_description)
+        self.add_selector("tags", selectors.tags)
+        self.add_value("brand_url", config.brand_url or None)
+        self.add_value("currency", config.currency or None)
+        self.add_value("vendor_name", config.vendor_name or None)
+        self.add_value("vendor_url", config.vendor_url or None)
+        if selectors.offer_image_url:
+            self.add_selector("offer_image_url", selectors.offer_image_url, join_urls=True)
+        else:
+            self.add_value("offer_image_url", "No image available")
+        if selectors.vendor_icon_url:
+            self.add_selector("vendor_icon_url", selectors.vendor_icon_url, join_urls=True)
+        elif config.vendor_url:
+            # If vendor_url is set, vendor_url + "/favicon.ico" is used to get favicon
+            self.add_value("vendor_icon_url", f"{config.vendor_url.rstrip('/')}/favicon.ico")
+        self.rules.append(FieldRule("offer_url", self.loader.get_input_processor("offer_url"), from_url=True))
+        self.add_value("gender", gender)
+        # Fields taken from the config or the URL, not from the page.
+        self.config_fields = {rule.name for rule in self.rules if rule.xpath is None}
+
+    def add_selector(self, field_name, selector, join_urls=False):
+        if selector:
+            xpath = compile_selector(field_name, selector)
+            self.rules.append(FieldRule(field_name, self.loader.get_input_processor(field_name), xpath=xpath, join_urls=join_urls))
+
+    def add_value(self, field_name, value):
+        self.rules.append(FieldRule(field_name, self.loader.get_input_processor(field_name), value=value))
+
+    def extract(self, response, use_selectors=True):
+        """Extracts a ProductItem from a response, default values included (fixed values only without selectors)."""
+        root = response.selector.root if use_selectors else None
+        collected = {}
+        for rule in self.rules:
+            if not use_selectors and rule.xpath is not None:
+                continue
+            values = rule.collect(response, root)
+            if values:
+                collected.setdefault(rule.name, []).extend(values)
+
+        item = ProductItem()
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for field_name, values in collected.items():
+            value = self.output_processors[field_name](values)
+            if debug:
+                logger.debug("Extracted value for %s: %s", field_name, value)
+            if value is not None:
+                item[field_name] = value
+
+        for field_name, field in item.fields.items():
+            item[field_name] = default_if_empty(item.get(field_name), field.get("default"))
+        return item
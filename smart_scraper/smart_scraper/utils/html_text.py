@@ -0,0 +1,122 @@
+from html.parser import HTMLParser
+from bs4.dammit import EntitySubstitution
+
+# Elements closed as soon as they are opened (html.parser tree builder of BeautifulSoup).
+EMPTY_ELEMENTS = frozenset((
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image",
+    "img", "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source",
+    "spacer", "track", "wbr",
+))
+
+# Elements whose text is left out of BeautifulSoup.get_text().
+HIDDEN_TEXT_ELEMENTS = frozenset(("rp", "rt", "script", "style", "template"))
+
+
+class HtmlTextParser(HTMLParser):
+    """
+    Streaming html.parser tokenizer collecting the strings BeautifulSoup(value,
+    "html.parser").get_text() would return, without building a tree: a string ends
+    at every tag, comment or declaration, and text of script, style, template and
+    ruby annotations, comments and declarations is dropped.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self.pending = []
+        self.open_tags = []
+        # Depths (in open_tags) of the open elements hiding their text.
+        self.hidden = []
+        # Empty elements whose explicit end tag, if any, must be ignored.
+        self.closed_empty = []
+
+    def end_data(self):
+        if self.pending:
+            if not self.hidden:
+                self.strings.append("".join(self.pending))
+            self.pending = []
+
+    def pop_to(self, tag):
+        """Closes the most recent open tag with this name and the tags opened after it."""
+        if tag not in self.open_tags:
+            return
+        while self.open_tags:
+            depth = len(self.open_tags)
+            name = self.open_tags.pop()
+            if self.hidden and self.hidden[-1] == depth:
+                self.hidden.pop()
+            if name == tag:
+                break
+
+    def handle_starttag(self, tag, attrs, empty_element=True):
+        self.end_data()
+        self.open_tags.append(tag)
+        if tag in HIDDEN_TEXT_ELEMENTS:
+            self.hidden.append(len(self.open_tags))
+        if empty_element and tag in EMPTY_ELEMENTS:
+            self.pop_to(tag)
+            self.closed_empty.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, empty_element=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_empty:
+            self.closed_empty.remove(tag)
+            return
+        self.end_data()
+        self.pop_to(tag)
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_charref(self, name):
+        code = int(name[1:], 16) if name[:1] in ("x", "X") else int(name)
+        data = None
+        # References below 256 are read as Windows-1252 (e.g. &#150;), like BeautifulSoup does.
+        if code < 256:
+            try:
+                data = bytearray([code]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(code)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    def handle_decl(self, data):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def unknown_decl(self, data):
+        self.end_data()
+        # CDATA sections are kept as text.
+        if data.upper().startswith("CDATA["):
+            self.strings.append(data[len("CDATA["):])
+
+    def close(self):
+        super().close()
+        self.end_data()
+
+
+# Returns the whitespace-normalised text of an HTML fragment.
+def html_to_text(value):
+    # Plain text (e.g. "::text" selectors): nothing to parse.
+    if "<" not in value and "&" not in value:
+        return " ".join(value.split())
+    parser = HtmlTextParser()
+    parser.feed(value)
+    parser.close()
+    return " ".join(" ".join(parser.strings).split())
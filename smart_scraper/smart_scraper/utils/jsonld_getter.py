@@ -1,39 +1,111 @@
 import json
-import requests
-from smart_scraper.items import clean_html_tags, clean_text
+from lxml import etree
+from smart_scraper.items import clean_html_tags, clean_text, clean_price_discount
 from urllib.parse import urljoin
-from requests.exceptions import RequestException
+
+# <script type="application/ld+json"> contents, compiled once.
+jsonld_scripts_xpath = etree.XPath('//script[@type="application/ld+json"]/text()', smart_strings=False)
+
+# JSON-LD types handled as a product.
+PRODUCT_TYPES = ("product", "productgroup")
+
+
+# Returns the lowercased schema.org types of a node ("Product", ["Product"], "schema:Product", ...).
+def jsonld_types(node):
+    types = node.get("@type")
+    if not isinstance(types, list):
+        types = [types]
+    return [t.rsplit("/", 1)[-1].rsplit(":", 1)[-1].lower() for t in types if isinstance(t, str)]
+
+
+# Returns the first product node of a JSON-LD document (top-level, list or @graph).
+def find_product(data):
+    if isinstance(data, list):
+        for node in data:
+            product = find_product(node)
+            if product:
+                return product
+    elif isinstance(data, dict):
+        if any(t in PRODUCT_TYPES for t in jsonld_types(data)):
+            return data
+        if "@graph" in data:
+            return find_product(data["@graph"])
+    return {}
 
 
 # Fetch all <script type="application/ld+json"> tags
 def extract_jsonld_data(response):
     """
     Extract Product JSON-LD data from a response.
-    It looks for <script type="application/ld+json"> tags and returns the first valid
-    JSON object (or one from a list) that represents a Product.
+    It parses the <script type="application/ld+json"> tags once and returns the first
+    Product or ProductGroup node, whether it is top-level, in a list or in a @graph.
 
     :param response: Scrapy Response object.
     :return: dict containing the Product data if found, otherwise an empty dict.
     """
-    scripts = response.css('script[type="application/ld+json"]::text').getall()
-    for script in scripts:
+    for script in jsonld_scripts_xpath(response.selector.root):
         try:
-            data = json.loads(script)
+            # strict=False: raw line breaks are common in descriptions.
+            data = json.loads(script, strict=False)
         except json.JSONDecodeError:
             continue
+        product = find_product(data)
+        if product:
+            return product
+    return {}
+
 
-        # If data is a dictionnary, checks for his type
-        if isinstance(data, dict):
-            if data.get('@type', '').lower() == 'product':
-                return data
-        # If data is a list
-        elif isinstance(data, list):
-            for item in data:
-                if isinstance(item, dict) and item.get('@type', '').lower() == 'product':
-                    return item
+# Returns the first offer holding a price (Offer, list of offers, AggregateOffer or ProductGroup variants).
+def find_offer(jsonld_data):
+    offers = jsonld_data.get("offers")
+    candidates = offers if isinstance(offers, list) else [offers]
+    for offer in candidates:
+        if not isinstance(offer, dict):
+            continue
+        if offer.get("price") is not None or offer.get("lowPrice") is not None:
+            return offer
+        nested = find_offer(offer)
+        if nested:
+            return nested
+    variants = jsonld_data.get("hasVariant")
+    if isinstance(variants, dict):
+        variants = [variants]
+    for variant in variants or []:
+        if isinstance(variant, dict):
+            offer = find_offer(variant)
+            if offer:
+                return offer
     return {}
 
 
+# Returns (regular price, sale price) of an offer, a strikethrough/list price meaning the offer is discounted.
+def offer_prices(offer):
+    price = offer.get("price")
+    if price is None:
+        price = offer.get("lowPrice")
+    price = clean_price_discount(str(price)) if price is not None else None
+
+    specifications = offer.get("priceSpecification") or []
+    if isinstance(specifications, dict):
+        specifications = [specifications]
+    for specification in specifications:
+        if not isinstance(specification, dict) or specification.get("price") is None:
+            continue
+        price_type = str(specification.get("priceType", "")).lower()
+        if "strikethrough" in price_type or "listprice" in price_type:
+            list_price = clean_price_discount(str(specification["price"]))
+            if list_price and price and list_price > price:
+                return list_price, price
+    return price, None
+
+
+# Returns the URL of an image entry (URL or ImageObject).
+def image_url(image):
+    if isinstance(image, dict):
+        image = image.get("url") or image.get("contentUrl")
+    return image if isinstance(image, str) and image else None
+
+
 # Checks for some fields, if they contain the default or a retrieved value.
 def check_for_default_value(item):
     fields = {
@@ -67,17 +139,8 @@ def check_for_default_value(item):
     return empty_fields
 
 
-# Checks that a URL returns an image.
-def is_image(url: str, timeout: int = 5) -> bool:
-    try:
-        resp = requests.head(url, timeout=timeout, allow_redirects=True)
-        return resp.status_code == 200
-    except RequestException:
-        return False
-
-
 def fetch_jsonld_data(jsonld_data, item):
-    """If the product description could not be retrieved or is empty, attempt to retrieve it from JSON-LD."""
+    """Fills the fields that could not be retrieved (default value) from JSON-LD: description, images, name, prices and currency."""
     # =================== DUPLICATE THIS BLOCK IF ANOTHER FIELD NEEDS TO BE PROCESSED ========================
     if not item.get("product_description") or item.get("product_description") == "Description not found":
         desc = jsonld_data.get("description")
@@ -91,17 +154,18 @@ def fetch_jsonld_data(jsonld_data, item):
         # Conversion to list to avoid unexpected behaviors.
         if not imgs:
             imgs_list = []
-        elif isinstance(imgs, str):
+        elif isinstance(imgs, (str, dict)):
             imgs_list = [imgs]
         else:
             imgs_list = list(imgs)
 
+        # Images are checked later by UrlVerificationPipeline.
         valid_images = []
         if imgs:
-            for raw_path in imgs_list:
+            for raw_path in filter(None, map(image_url, imgs_list)):
                 # Rebuild url if relative.
                 full_url = raw_path if raw_path.startswith(("http://", "https://")) else urljoin(item.get("brand_url",""), raw_path)
-                if is_image(full_url):
+                if full_url not in valid_images:
                     valid_images.append(full_url)
             if valid_images:
                 item["offer_image_url"] = valid_images
@@ -111,4 +175,15 @@ def fetch_jsonld_data(jsonld_data, item):
         if name:
             item["product_name"] = clean_text(clean_html_tags(name))
 
+    offer = find_offer(jsonld_data)
+    if offer:
+        regular_price, sale_price = offer_prices(offer)
+        if regular_price and (not item.get("offer_price") or item["offer_price"] == "Price not available"):
+            item["offer_price"] = regular_price
+        if sale_price and (not item.get("discount_price") or item["discount_price"] == "No discount"):
+            item["discount_price"] = sale_price
+        currency = offer.get("priceCurrency")
+        if currency and (not item.get("currency") or item["currency"] == "Unknown currency"):
+            item["currency"] = clean_text(currency)
+
     return item
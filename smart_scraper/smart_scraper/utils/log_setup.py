@@ -0,0 +1,163 @@
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+import colorlog
+from scrapy.utils.log import get_scrapy_root_handler
+
+LOG_COLORS = {
+    'DEBUG': 'cyan',
+    'INFO': 'green',
+    'WARNING': 'yellow',
+    'ERROR': 'red',
+    'CRITICAL': 'bold_red',
+}
+
+# Attributes of every LogRecord, the others come from `extra` and are written as JSON fields.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+# Handler installed on the root logger, and the background thread writing its records.
+installed = {"handler": None, "listener": None, "sampler": None, "options": None}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, `extra` fields and exception."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                # Scrapy adds the spider to the records of its loggers.
+                entry[key] = value.name if key == "spider" and hasattr(value, "name") else value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps the first record of each message type (logger and message template), then one
+    out of `rate` (`rates` overrides the rate per template or logger name, 1 keeps all).
+    Warnings and errors are always kept.
+    """
+
+    def __init__(self, rate=1, rates=None):
+        super().__init__()
+        self.rate = max(int(rate), 1)
+        self.rates = rates or {}
+        self.counts = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        template = record.msg if isinstance(record.msg, str) else type(record.msg).__name__
+        rate = self.rates.get(template, self.rates.get(record.name, self.rate))
+        if rate <= 1:
+            return True
+        key = (record.name, template)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % rate == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """Queues the records for the writer thread, which formats and writes them."""
+
+    def prepare(self, record):
+        # The message is merged here, as its arguments may change once the call returned.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def stop_listener():
+    listener = installed["listener"]
+    if listener is not None:
+        installed["listener"] = None
+        listener.stop()
+
+
+def setup_logging(mode="dev", level="DEBUG", json_file=None, sample_rate=1, sample_rates=None):
+    """
+    Replaces the handler of the root logger, unless it was set with the same options.
+    "dev": coloured console, every message. "production": JSON lines (stderr or json_file)
+    sampled per message type, formatted and written by a background thread.
+    """
+    if mode not in ("dev", "production"):
+        raise ValueError(f"Unknown LOG_MODE: {mode!r} (expected 'dev' or 'production')")
+    level = logging.getLevelName(level) if isinstance(level, str) else level
+    options = (mode, level, json_file, sample_rate, sorted((sample_rates or {}).items()))
+
+    root = logging.getLogger()
+    if installed["options"] == options and installed["handler"] in root.handlers:
+        apply_level(level)
+        return installed["handler"]
+    if installed["handler"] in root.handlers:
+        root.removeHandler(installed["handler"])
+    stop_listener()
+    installed["sampler"] = None
+
+    if mode == "dev":
+        handler = logging.StreamHandler()
+        handler.setFormatter(colorlog.ColoredFormatter(
+            "%(log_color)s[%(levelname)s]%(reset)s %(asctime)s - %(message)s",
+            log_colors=LOG_COLORS
+        ))
+        handler.setLevel(level)
+    else:
+        target = logging.FileHandler(json_file, encoding="utf-8") if json_file else logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter())
+        records = queue.SimpleQueue()
+        handler = BackgroundHandler(records)
+        handler.setLevel(level)
+        installed["sampler"] = SamplingFilter(sample_rate, sample_rates)
+        handler.addFilter(installed["sampler"])
+        installed["listener"] = logging.handlers.QueueListener(records, target)
+        installed["listener"].start()
+
+    installed["handler"] = handler
+    installed["options"] = options
+    root.addHandler(handler)
+    apply_level(level)
+    return handler
+
+
+def apply_level(level):
+    """
+    Sets the level of the root and scrapy loggers, so that lower records are not even created,
+    and removes the console handler of Scrapy (enabled again by -L; --logfile files are kept).
+    """
+    level = logging.getLevelName(level) if isinstance(level, str) else level
+    scrapy_handler = get_scrapy_root_handler()
+    if type(scrapy_handler) is logging.StreamHandler:
+        logging.getLogger().removeHandler(scrapy_handler)
+    logging.getLogger().setLevel(level)
+    logging.getLogger("scrapy").setLevel(level)
+
+
+def sampled_out():
+    """Number of records dropped by the sampling since the last setup_logging()."""
+    return installed["sampler"].dropped if installed["sampler"] else 0
+
+
+# Writes the queued records before the interpreter exits.
+atexit.register(stop_listener)
@@ -0,0 +1,194 @@
+import os
+import re
+import gzip
+import json
+import sqlite3
+
+OUTPUT_FORMATS = ("jsonl", "parquet", "sqlite")
+COMPRESSIONS = (None, "gzip", "zstd")
+
+# Typed columns of the Parquet and SQLite outputs, the other fields are strings.
+NUMBER_FIELDS = frozenset(("offer_price", "discount_price", "discount_percentage"))
+LIST_FIELDS = frozenset(("offer_image_url", "tags"))
+
+
+# Returns a file/directory-safe name for a partition value (e.g. a brand name).
+def partition_name(value):
+    name = re.sub(r"[^\w.-]+", "-", str(value or "").strip().lower()).strip("-.")
+    return name or "unknown"
+
+
+# Converts a field value to its column type: placeholders of numbers ("No discount"...) become None.
+def column_value(field_name, value):
+    if value is None:
+        return None
+    if field_name in NUMBER_FIELDS:
+        return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    if field_name in LIST_FIELDS:
+        return [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+    return value if isinstance(value, str) else str(value)
+
+
+class RotatingFileWriter:
+    """
+    Base of the file writers: rows are written to a hidden temporary file, renamed
+    to part-<run>-<number>.<extension> once max_items rows are written or on close,
+    so readers only ever see complete files.
+    """
+    extension = ""
+
+    def __init__(self, directory, run_id, fields, max_items=100000, file_number=0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.run_id = run_id
+        self.fields = fields
+        self.max_items = max_items
+        # Number of the last file written in this directory by this run (writers may be reopened).
+        self.file_number = file_number
+        self.file_items = 0
+        self.path = None
+        self.files = []
+
+    def write_batch(self, rows):
+        """Writes a list of rows (dicts), rotating files when they are full."""
+        while rows:
+            if self.path is None:
+                self.file_number += 1
+                name = f"part-{self.run_id}-{self.file_number:05d}{self.extension}"
+                self.path = os.path.join(self.directory, name)
+                self.open(os.path.join(self.directory, f".{name}.tmp"))
+            chunk = rows[:self.max_items - self.file_items]
+            rows = rows[len(chunk):]
+            self.write_rows(chunk)
+            self.file_items += len(chunk)
+            if self.file_items >= self.max_items:
+                self.finish_file()
+
+    def finish_file(self):
+        self.close_file()
+        os.replace(os.path.join(self.directory, f".{os.path.basename(self.path)}.tmp"), self.path)
+        self.files.append(self.path)
+        self.path = None
+        self.file_items = 0
+
+    def close(self):
+        if self.path is not None:
+            self.finish_file()
+
+    def open(self, path):
+        raise NotImplementedError
+
+    def write_rows(self, rows):
+        raise NotImplementedError
+
+    def close_file(self):
+        raise NotImplementedError
+
+
+class JsonLinesWriter(RotatingFileWriter):
+    """JSON lines files, optionally gzip or zstd compressed. Values are written as they are."""
+
+    def __init__(self, directory, run_id, fields, max_items=100000, file_number=0, compression=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown OUTPUT_COMPRESSION: {compression} (expected gzip or zstd)")
+        if compression == "zstd":
+            # Optional dependency, only needed for zstd outputs.
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("OUTPUT_COMPRESSION = 'zstd' requires the zstandard package (pip install zstandard)")
+            self.zstandard = zstandard
+        self.compression = compression
+        self.extension = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}[compression]
+        super().__init__(directory, run_id, fields, max_items, file_number)
+
+    def open(self, path):
+        if self.compression == "gzip":
+            self.file = gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+        elif self.compression == "zstd":
+            self.file = self.zstandard.open(path, "wt", cctx=self.zstandard.ZstdCompressor(level=3), encoding="utf-8")
+        else:
+            self.file = open(path, "w", encoding="utf-8")
+
+    def write_rows(self, rows):
+        self.file.write("".join(
+            json.dumps({field: row.get(field) for field in self.fields}, ensure_ascii=False, default=str) + "\n"
+            for row in rows
+        ))
+
+    def close_file(self):
+        self.file.close()
+
+
+class ParquetWriter(RotatingFileWriter):
+    """Parquet files (one row group per batch) with typed price and list columns."""
+    extension = ".parquet"
+
+    def __init__(self, directory, run_id, fields, max_items=100000, file_number=0):
+        # Optional dependency, only needed for Parquet outputs.
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("OUTPUT_FORMAT = 'parquet' requires the pyarrow package (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            (field, pyarrow.float64() if field in NUMBER_FIELDS
+             else pyarrow.list_(pyarrow.string()) if field in LIST_FIELDS
+             else pyarrow.string())
+            for field in fields
+        ])
+        super().__init__(directory, run_id, fields, max_items, file_number)
+
+    def open(self, path):
+        self.writer = self.pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write_rows(self, rows):
+        columns = {field: [column_value(field, row.get(field)) for row in rows] for field in self.fields}
+        self.writer.write_table(self.pyarrow.Table.from_pydict(columns, schema=self.schema))
+
+    def close_file(self):
+        self.writer.close()
+
+
+class SqliteWriter:
+    """
+    One SQLite table ("products", one row per offer_url) for the whole output,
+    committed once per batch. Lists are stored as JSON text.
+    """
+
+    def __init__(self, path, fields):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.fields = list(fields)
+        self.files = [path]
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(
+            f"{field} REAL" if field in NUMBER_FIELDS
+            else f"{field} TEXT PRIMARY KEY" if field == "offer_url"
+            else f"{field} TEXT"
+            for field in self.fields
+        )
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS products ({columns})")
+        if "brand_name" in self.fields:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS products_brand_name ON products (brand_name)")
+        self.insert = (
+            f"INSERT OR REPLACE INTO products ({', '.join(self.fields)}) "
+            f"VALUES ({', '.join('?' for _ in self.fields)})"
+        )
+
+    def write_batch(self, rows):
+        values = []
+        for row in rows:
+            record = []
+            for field in self.fields:
+                value = column_value(field, row.get(field))
+                record.append(json.dumps(value, ensure_ascii=False) if field in LIST_FIELDS and value is not None else value)
+            values.append(record)
+        with self.connection:
+            self.connection.executemany(self.insert, values)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,128 @@
+import re
+import time
+import asyncio
+import logging
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+# True once every selector matches at least one node (CSS or XPath).
+PRODUCT_READY_JS = """
+selectors => selectors.every(sel => {
+    if (sel.xpath) {
+        const result = document.evaluate(sel.query, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null);
+        return result.singleNodeValue !== null;
+    }
+    return document.querySelector(sel.query) !== null;
+})
+"""
+
+# True once document height has not changed for `quiet` ms.
+HEIGHT_STABLE_JS = """
+quiet => new Promise(resolve => {
+    let height = document.body ? document.body.scrollHeight : 0;
+    let stableSince = Date.now();
+    const timer = setInterval(() => {
+        const current = document.body ? document.body.scrollHeight : 0;
+        if (current !== height) {
+            height = current;
+            stableSince = Date.now();
+        } else if (Date.now() - stableSince >= quiet) {
+            clearInterval(timer);
+            resolve(true);
+        }
+    }, 100);
+})
+"""
+
+# Scrapy pseudo-elements, unknown to the browser.
+pseudo_element_regex = re.compile(r"::(text|attr\([^)]*\))\s*$")
+
+
+# Splits a CSS selector list on its top-level commas (not the ones in :is(), [attr] or quotes).
+def split_selector_list(selector):
+    parts, start, depth, quote = [], 0, 0, None
+    for index, char in enumerate(selector):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(selector[start:index])
+            start = index + 1
+    parts.append(selector[start:])
+    return [part.strip() for part in parts]
+
+
+# Converts Scrapy selectors (CSS with ::text/::attr, XPath) to selectors the page can evaluate.
+def to_page_selectors(selectors):
+    page_selectors = []
+    for selector in selectors:
+        if not selector or not selector.strip():
+            continue
+        sel = selector.strip()
+        if sel.startswith(("/", "./", ".//", "(")):
+            page_selectors.append({"xpath": True, "query": sel})
+        else:
+            parts = [pseudo_element_regex.sub("", part) for part in split_selector_list(sel)]
+            page_selectors.append({"xpath": False, "query": ", ".join(parts)})
+    return page_selectors
+
+
+async def wait_for_product(page, selectors, timeout, quiet=500):
+    """
+    Waits until the product selectors are present, or until the page has settled
+    (network idle, then a stable height for `quiet` ms), but no longer than `timeout` ms.
+    Returns the time actually spent waiting (ms).
+    """
+    start = time.monotonic()
+
+    async def settled():
+        await page.wait_for_load_state("networkidle", timeout=timeout)
+        await page.wait_for_function(HEIGHT_STABLE_JS, arg=quiet, timeout=timeout)
+
+    tasks = [asyncio.ensure_future(settled())]
+    if selectors:
+        tasks.append(asyncio.ensure_future(
+            page.wait_for_function(PRODUCT_READY_JS, arg=selectors, timeout=timeout, polling=100)
+        ))
+
+    pending = tasks
+    while pending:
+        remaining = timeout / 1000 - (time.monotonic() - start)
+        done, pending = await asyncio.wait(pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            break
+        # A selector the page cannot evaluate would end the wait at once: only the page settling counts then.
+        ready = tasks[1] if selectors else None
+        if done == {ready} and not isinstance(ready.exception(), (type(None), PlaywrightTimeoutError)):
+            logger.warning("Product selectors unusable in the page, waiting for it to settle: %s", ready.exception())
+            continue
+        break
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return (time.monotonic() - start) * 1000
+
+
+async def scroll_until_stable(page, times, delay):
+    """
+    Scrolls to the bottom up to `times` times, waiting up to `delay` ms after each
+    scroll for new content. Stops as soon as the page height stops growing.
+    Returns the time actually spent waiting (ms).
+    """
+    start = time.monotonic()
+    for _ in range(times):
+        height = await page.evaluate("document.body.scrollHeight")
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await page.wait_for_function("h => document.body.scrollHeight > h", arg=height, timeout=delay, polling=100)
+        except PlaywrightTimeoutError:
+            break
+    return (time.monotonic() - start) * 1000
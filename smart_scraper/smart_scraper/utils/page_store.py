@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+from scrapy.http import Headers, HtmlResponse, Request, TextResponse
+from scrapy.responsetypes import responsetypes
+from smart_scraper.utils.config_loader import CONFIGS_DIR
+
+# Page store (and parsebench baseline) of each config.
+FIXTURES_DIR = os.path.join(CONFIGS_DIR, "fixtures")
+
+
+# Rebuilds the response MainSpider.parse would have received for a record.
+def page_response(record):
+    meta = {"playwright": True} if record.get("rendered") else {}
+    return HtmlResponse(
+        record["url"],
+        status=record.get("status", 200),
+        headers=record.get("headers"),
+        body=record["body"],
+        encoding="utf-8",
+        request=Request(record["url"], meta=meta),
+    )
+
+
+# Returns the JSON-serialisable results of the page methods of a rendered page (smart waits, captured API payloads).
+def page_method_results(meta):
+    results = []
+    for pm in meta.get("playwright_page_methods") or []:
+        result = getattr(pm, "result", None)
+        try:
+            json.dumps(result)
+        except (TypeError, ValueError):
+            result = None
+        results.append(result)
+    return results
+
+
+class PageStore:
+    """
+    Pages of a config (SQLite, zlib-compressed bodies), one per requested URL and kind
+    (static or rendered): recorded with "-a pages=record", served by SmartDownloadHandler
+    with "-a pages=replay" (no browser, no network) and read by "parsebench".
+    """
+
+    def __init__(self, path, commit_every=100):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT, rendered INTEGER, response_url TEXT, status INTEGER, headers TEXT, encoding TEXT, "
+            "body BLOB, page_methods TEXT, recorded_at REAL, PRIMARY KEY (url, rendered))"
+        )
+        self.commit_every = commit_every
+        self.pending_writes = 0
+
+    def put(self, url, rendered, response_url, status, headers, body, encoding=None, page_methods=None):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                url, int(rendered), response_url, status, json.dumps(headers), encoding,
+                zlib.compress(body), json.dumps(page_methods) if page_methods else None, time.time(),
+            ),
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.commit()
+
+    def record(self, response, request, spider):
+        """response_received handler: stores the page as the spider receives it (decompressed, rendered)."""
+        headers = {
+            key.decode("latin-1"): [value.decode("latin-1") for value in values]
+            for key, values in response.headers.items()
+        }
+        headers.pop("Content-Encoding", None)
+        rendered = bool(request.meta.get("playwright"))
+        encoding = response.encoding if isinstance(response, TextResponse) else None
+        self.put(
+            request.url, rendered, response.url, response.status, headers, response.body, encoding,
+            page_method_results(request.meta) if rendered else None,
+        )
+        # The redirects followed to reach the page are replayed as such.
+        redirect_urls = request.meta.get("redirect_urls") or []
+        for source, target in zip(redirect_urls, redirect_urls[1:] + [request.url]):
+            self.put(source, rendered, source, 301, {"Location": [target]}, b"")
+        spider.crawler.stats.inc_value("page_store/recorded")
+
+    def response(self, request):
+        """Returns the stored response of a request (page method results restored), or None."""
+        rendered = bool(request.meta.get("playwright"))
+        row = self.connection.execute(
+            "SELECT response_url, status, headers, body, page_methods FROM pages WHERE url = ? AND rendered = ?",
+            (request.url, int(rendered)),
+        ).fetchone()
+        if row is None:
+            return None
+        response_url, status, headers, body, page_methods = row
+        headers = Headers(json.loads(headers))
+        body = zlib.decompress(body)
+        if page_methods:
+            for pm, result in zip(request.meta.get("playwright_page_methods") or [], json.loads(page_methods)):
+                pm.result = result
+        response_class = responsetypes.from_args(headers=headers, url=response_url, body=body)
+        return response_class(response_url, status=status, headers=headers, body=body, request=request, flags=["page_store"])
+
+    def records(self, max_pages=0):
+        """Returns the HTML pages (status 200) as parsebench records, see page_response()."""
+        records = []
+        cursor = self.connection.execute(
+            "SELECT response_url, status, rendered, headers, encoding, body FROM pages WHERE status = 200 ORDER BY recorded_at"
+        )
+        for response_url, status, rendered, headers, encoding, body in cursor:
+            headers = json.loads(headers)
+            content_type = " ".join(headers.get("Content-Type", []))
+            if content_type and "html" not in content_type:
+                continue
+            records.append({
+                "url": response_url,
+                "status": status,
+                "rendered": bool(rendered),
+                "headers": headers,
+                "body": zlib.decompress(body).decode(encoding or "utf-8", "replace"),
+            })
+            if max_pages and len(records) >= max_pages:
+                break
+        return records
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
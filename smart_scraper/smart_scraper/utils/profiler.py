@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_MODES = ("cpu", "alloc")
+# Directory holding the smart_scraper package: its files are labelled "smart_scraper/...".
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Short path of a source file: "smart_scraper/spiders/main_spider.py", "scrapy/core/scraper.py"...
+def short_path(filename):
+    if filename.startswith(PROJECT_DIR + os.sep):
+        return os.path.relpath(filename, PROJECT_DIR)
+    return os.path.join(*filename.split(os.sep)[-2:])
+
+
+# Flame graph label of a code object: "qualname (path:line)", without ";".
+def frame_label(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+# Flame graph label of a tracemalloc frame (file and line only).
+def trace_label(frame):
+    return f"{short_path(frame.filename)}:{frame.lineno}".replace(";", ",")
+
+
+# Returns the labels of a frame and its callers, outermost first.
+def stack_labels(frame):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+def is_project_label(label):
+    return label.rsplit(" (", 1)[-1].startswith("smart_scraper" + os.sep)
+
+
+class StackSampler:
+    """Records the stack of one thread every `interval` seconds, from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[stack_labels(frame)] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class Profiler:
+    """
+    Profiles a crawl: "cpu" samples the stack of the reactor thread, "alloc" traces the
+    allocations with tracemalloc. Steps (callbacks, item loader) are timed, and in
+    "alloc" mode their memory peak is recorded. Reports are written by write().
+    """
+
+    def __init__(self, mode, interval=0.005, frames=25):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode!r} (expected one of {', '.join(PROFILE_MODES)})")
+        self.mode = mode
+        self.interval = interval
+        self.frames = frames
+        self.sampler = None
+        self.started_at = None
+        self.duration = 0.0
+        self.snapshot = None
+        # name -> [calls, total seconds, highest peak (bytes)]
+        self.steps = {}
+        # Steps being run (nested): traced memory peak before the step, highest peak of its inner steps.
+        self.step_peaks = []
+
+    def start(self):
+        if self.started_at is not None:
+            return
+        self.started_at = time.perf_counter()
+        if self.mode == "cpu":
+            self.sampler = StackSampler(threading.get_ident(), self.interval)
+            self.sampler.start()
+        else:
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        if self.started_at is None or self.duration:
+            return
+        self.duration = time.perf_counter() - self.started_at
+        if self.sampler:
+            self.sampler.stop()
+        elif tracemalloc.is_tracing():
+            self.snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    @contextmanager
+    def step(self, name, call=True):
+        """
+        Times a step (and its memory peak above the memory in use when it starts, in "alloc" mode).
+        call=False adds the step to the last call (e.g. a generator resumed).
+        """
+        tracing = self.mode == "alloc" and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            self.step_peaks.append([peak, 0])
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            step = self.steps.setdefault(name, [0, 0.0, 0])
+            step[0] += call
+            step[1] += elapsed
+            if tracing and tracemalloc.is_tracing():
+                before, inner_peak = self.step_peaks.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], inner_peak)
+                step[2] = max(step[2], peak - current)
+                # reset_peak() hid the peaks seen before this step from the enclosing one.
+                if self.step_peaks:
+                    self.step_peaks[-1][1] = max(self.step_peaks[-1][1], before, peak)
+
+    def wrap(self, name, function):
+        """Runs `function` as a step."""
+        def profiled(*args, **kwargs):
+            with self.step(name):
+                return function(*args, **kwargs)
+        return profiled
+
+    def step_report(self):
+        report = {}
+        for name, (calls, total, highest_peak) in sorted(self.steps.items(), key=lambda entry: -entry[1][1]):
+            calls = max(calls, 1)
+            report[name] = {"calls": calls, "total_ms": round(total * 1000, 3), "mean_ms": round(total * 1000 / calls, 3)}
+            if self.mode == "alloc":
+                report[name]["max_peak_kb"] = round(highest_peak / 1024, 1)
+        return report
+
+    def cpu_report(self, top):
+        total = sum(self.sampler.samples.values())
+        inclusive, own = Counter(), Counter()
+        for stack, count in self.sampler.samples.items():
+            for label in set(stack):
+                inclusive[label] += count
+            if stack:
+                own[stack[-1]] += count
+
+        def table(counter, project_only):
+            rows = [(label, count) for label, count in counter.most_common() if not project_only or is_project_label(label)]
+            return [
+                {"function": label, "samples": count, "share": round(count / total, 4), "ms": round(count * self.interval * 1000, 1)}
+                for label, count in rows[:top]
+            ]
+
+        return {
+            "samples": total,
+            "interval_ms": self.interval * 1000,
+            # Callbacks, item loader, pipelines and helpers of the project, callees included.
+            "project_functions": table(inclusive, True),
+            "self_time": table(own, False),
+        }
+
+    def traces(self):
+        """Snapshot taken at close, without the tracemalloc and import machinery allocations."""
+        return self.snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+
+    def alloc_report(self, top):
+        snapshot = self.traces()
+        return {
+            "traced_kb_at_close": round(sum(trace.size for trace in snapshot.traces) / 1024, 1),
+            # Allocation sites of the memory allocated during the crawl and still in use when the spider closes.
+            "top_sites": [
+                {
+                    "site": trace_label(stat.traceback[0]),
+                    "size_kb": round(stat.size / 1024, 1),
+                    "blocks": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[:top]
+            ],
+        }
+
+    def collapsed(self):
+        """Collapsed stacks ("frame;frame;frame weight" lines) for flamegraph.pl, speedscope or inferno."""
+        if self.mode == "cpu":
+            weights = self.sampler.samples
+        else:
+            weights = Counter()
+            for stat in self.traces().statistics("traceback"):
+                # Outermost frame first; the weight is the size in KiB still allocated at close.
+                weights[tuple(trace_label(frame) for frame in reversed(stat.traceback))] += stat.size
+            weights = Counter({stack: max(size // 1024, 1) for stack, size in weights.items()})
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in weights.most_common() if stack)
+
+    def report(self, config_name, top=30):
+        report = {
+            "config": config_name,
+            "mode": self.mode,
+            "duration_s": round(self.duration, 3),
+            "steps": self.step_report(),
+        }
+        report.update(self.cpu_report(top) if self.mode == "cpu" else self.alloc_report(top))
+        return report
+
+    def write(self, directory, config_name):
+        """Writes <config>.<mode>.json (summary) and <config>.<mode>.collapsed, returns their common path prefix."""
+        self.stop()
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"{config_name}.{self.mode}")
+        with open(f"{prefix}.json", "w", encoding="utf-8") as file:
+            json.dump(self.report(config_name), file, indent=4)
+        with open(f"{prefix}.collapsed", "w", encoding="utf-8") as file:
+            file.write(self.collapsed())
+        return prefix
+
@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+
+# Returns a stable hash of the product fields of an item.
+def item_fingerprint(item):
+    data = json.dumps(dict(item), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class RecrawlStore:
+    """
+    Persistent per-offer_url store (SQLite) of the HTTP validators (ETag,
+    Last-Modified) and of the content hash of the last emitted item, used to only
+    emit new or changed products.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit with WAL, like DedupStore: shard workers sharing the store never
+        # wait for a write transaction left open by another one.
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, updated_at REAL)"
+        )
+
+    def get(self, url):
+        """Returns (etag, last_modified, content_hash) of an URL, or None."""
+        return self.connection.execute(
+            "SELECT etag, last_modified, content_hash FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+
+    def conditional_headers(self, url):
+        """Returns the If-None-Match / If-Modified-Since headers of an URL."""
+        row = self.get(url)
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def is_unchanged(self, url, fingerprint):
+        """Checks if an URL has the same content hash as the last item emitted for it."""
+        row = self.get(url)
+        return bool(row) and row[2] == fingerprint
+
+    def record(self, url, fingerprint, etag=None, last_modified=None):
+        """Saves the validators and the content hash of an emitted item."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+            (url, etag, last_modified, fingerprint, time.time()),
+        )
+
+    def close(self):
+        self.connection.close()
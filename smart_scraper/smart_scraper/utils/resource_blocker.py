@@ -0,0 +1,84 @@
+import logging
+from urllib.parse import urlparse
+from tldextract import TLDExtract
+
+logger = logging.getLogger(__name__)
+
+# Offline suffix list (no HTTP request at start-up).
+extract_domain = TLDExtract(suffix_list_urls=())
+
+# Average transfer sizes (bytes) used to estimate what an aborted request would have cost.
+ESTIMATED_SIZES = {
+    "image": 45000,
+    "media": 500000,
+    "font": 35000,
+    "script": 25000,
+    "stylesheet": 15000,
+    "xhr": 5000,
+    "fetch": 5000,
+}
+DEFAULT_ESTIMATED_SIZE = 10000
+
+
+# Returns the registered domain of a URL (e.g. "www.nobo.fr" -> "nobo.fr").
+def registered_domain(url):
+    parts = extract_domain(url)
+    return parts.registered_domain or urlparse(url).netloc
+
+
+class ResourceBlocker:
+    """
+    Aborts the sub-requests of Playwright-rendered pages that the spider does not need
+    (by resource type, URL pattern or third-party domain), and reports request counts
+    and bytes saved in the crawl stats.
+    """
+
+    def __init__(self, config, crawler):
+        self.config = config
+        self.crawler = crawler
+
+    def should_abort(self, playwright_request, site_domain):
+        """Returns the reason why a request must be aborted, None to let it through."""
+        url = playwright_request.url
+        if playwright_request.is_navigation_request():
+            return None
+        if any(allowed in url for allowed in self.config.allowlist):
+            return None
+        if playwright_request.resource_type in self.config.resource_types:
+            return playwright_request.resource_type
+        if any(pattern in url for pattern in self.config.url_patterns):
+            return "url_pattern"
+        if self.config.block_third_party and url.startswith("http") and registered_domain(url) != site_domain:
+            return "third_party"
+        return None
+
+    async def init_page(self, page, request):
+        """Page init callback: routes every sub-request of the page through the blocker."""
+        site_domain = registered_domain(request.url)
+
+        async def handle_route(route, playwright_request):
+            reason = self.should_abort(playwright_request, site_domain)
+            if reason is None:
+                # Let scrapy-playwright's own route handler process the request.
+                await route.fallback()
+                return
+            self.record_abort(playwright_request, reason)
+            await route.abort()
+
+        await page.route("**", handle_route)
+
+    def record_abort(self, playwright_request, reason):
+        stats = self.crawler.stats
+        stats.inc_value("resource_blocking/aborted")
+        stats.inc_value(f"resource_blocking/aborted/{reason}")
+        size = ESTIMATED_SIZES.get(playwright_request.resource_type, DEFAULT_ESTIMATED_SIZE)
+        stats.inc_value("resource_blocking/estimated_bytes_saved", size)
+        logger.debug("Aborted (%s): %s", reason, playwright_request.url)
+
+    def on_response(self, response):
+        """Page "response" event handler: counts what was actually downloaded."""
+        stats = self.crawler.stats
+        stats.inc_value("resource_blocking/allowed")
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            stats.inc_value("resource_blocking/bytes_received", int(length))
@@ -0,0 +1,197 @@
+import re
+import scrapy
+from urllib.parse import urlsplit
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import XmlResponse
+from scrapy.utils.gz import gunzip, gzip_magic_number
+from scrapy.utils.sitemap import Sitemap, sitemap_urls_from_robots
+from scrapy_playwright.page import PageMethod
+from smart_scraper.utils.config_loader import DiscoveryConfig, UrlRulesConfig, normalize_url
+from smart_scraper.utils.extraction_plan import is_xpath
+from smart_scraper.utils.page_actions import scroll_until_stable
+
+
+class UrlDiscovery:
+    """
+    Finds the product details URLs of a config ("discovery" block) for a spider.
+    Sitemaps are tried first (from robots.txt, then /sitemap.xml, gzipped or not,
+    indexes followed); the listing pages are only scrolled with Playwright if the
+    sitemaps give no product URL (see fallback_requests).
+
+    Each new URL is handed to on_url(url, source), whose results (an item for
+    urls_spider, a detail request for main_spider) are yielded by the callbacks.
+    """
+
+    def __init__(self, spider, config, on_url, headers, listing_meta=None):
+        self.spider = spider
+        self.config = config
+        self.discovery = config.discovery or DiscoveryConfig()
+        self.on_url = on_url
+        # Returns the headers of a request (a new User-Agent each time).
+        self.headers = headers
+        # Returns extra meta of the listing pages (browser context, page init callback...).
+        self.listing_meta = listing_meta
+        self.sitemap_follow = [re.compile(pattern) for pattern in self.discovery.sitemap_follow]
+        self.url_patterns = [re.compile(pattern) for pattern in self.discovery.url_patterns]
+        self.url_rules = config.url_rules or UrlRulesConfig()
+        self.seen_urls = set()
+        self.fallback_started = False
+
+    @property
+    def stats(self):
+        return self.spider.crawler.stats
+
+    def site_roots(self):
+        """Returns the scheme://host of the listing pages (or of brand_url/vendor_url)."""
+        urls = self.discovery.start_urls or [self.config.brand_url, self.config.vendor_url]
+        roots = []
+        for url in urls:
+            parts = urlsplit(url or "")
+            if parts.scheme in ("http", "https") and parts.netloc:
+                roots.append(f"{parts.scheme}://{parts.netloc}")
+        return list(dict.fromkeys(roots))
+
+    def start_requests(self):
+        if self.discovery.sitemaps:
+            for url in self.discovery.sitemaps:
+                yield self.sitemap_request(url)
+            return
+        for root in self.site_roots():
+            self.spider.logger.info("Looking for sitemaps in %s/robots.txt", root)
+            yield scrapy.Request(
+                f"{root}/robots.txt",
+                headers=self.headers(),
+                callback=self.parse_robots,
+                errback=self.robots_error,
+                dont_filter=True,
+                cb_kwargs={"root": root},
+            )
+
+    def sitemap_request(self, url):
+        return scrapy.Request(url, headers=self.headers(), callback=self.parse_sitemap, errback=self.handle_error)
+
+    def parse_robots(self, response, root):
+        sitemaps = list(sitemap_urls_from_robots(response.text, base_url=response.url))
+        self.spider.logger.info("%s sitemap(s) found in %s", len(sitemaps), response.url)
+        if not sitemaps:
+            sitemaps = [f"{root}/sitemap.xml"]
+        for url in sitemaps:
+            yield self.sitemap_request(url)
+
+    def robots_error(self, failure):
+        """No robots.txt: tries the usual sitemap location."""
+        root = failure.request.cb_kwargs["root"]
+        self.spider.logger.info("No robots.txt on %s, trying %s/sitemap.xml", root, root)
+        self.spider.crawler.engine.crawl(self.sitemap_request(f"{root}/sitemap.xml"))
+
+    def sitemap_body(self, response):
+        """Returns the XML of a sitemap response (gzipped or not), None if it is not a sitemap."""
+        if gzip_magic_number(response):
+            max_size = response.meta.get("download_maxsize", self.spider.settings.getint("DOWNLOAD_MAXSIZE"))
+            try:
+                return gunzip(response.body, max_size=max_size)
+            except (OSError, ValueError) as e:
+                self.spider.logger.warning("Cannot decompress sitemap %s: %s", response.url, e)
+                return None
+        head = response.body[:2000]
+        if isinstance(response, XmlResponse) or b"<urlset" in head or b"<sitemapindex" in head:
+            return response.body
+        return None
+
+    def parse_sitemap(self, response):
+        body = self.sitemap_body(response)
+        if body is None:
+            self.spider.logger.warning("Not a sitemap: %s", response.url)
+            return
+        sitemap = Sitemap(body)
+        self.stats.inc_value("discovery/sitemaps")
+
+        if sitemap.type == "sitemapindex":
+            for entry in sitemap:
+                url = entry.get("loc")
+                if url and (not self.sitemap_follow or any(p.search(url) for p in self.sitemap_follow)):
+                    yield self.sitemap_request(url)
+        elif sitemap.type == "urlset":
+            for entry in sitemap:
+                url = entry.get("loc")
+                if url and (not self.url_patterns or any(p.search(url) for p in self.url_patterns)):
+                    yield from self.detail_url(url, "sitemap")
+
+    def detail_url(self, url, source):
+        """Hands a product URL seen for the first time (once canonicalised) to on_url."""
+        url = normalize_url(url, self.url_rules.drop_parameters, self.url_rules.keep_fragments)
+        if url not in self.seen_urls:
+            self.seen_urls.add(url)
+            self.stats.inc_value(f"discovery/{source}_urls")
+            yield from self.on_url(url, source)
+
+    def fallback_requests(self):
+        """
+        Returns the listing page requests once the sitemaps are done, if they gave
+        no product URL (call it from the spider_idle handler, see spider_idle).
+        """
+        if self.seen_urls or self.fallback_started:
+            return []
+        self.fallback_started = True
+        if not self.discovery.start_urls or not self.discovery.link_selector:
+            self.spider.logger.warning(
+                f"No product URL found in sitemaps and no listing pages to scroll ({self.spider.config_file})."
+            )
+            return []
+        self.spider.logger.info("No product URL found in sitemaps, scrolling the listing pages.")
+        return [self.listing_request(url) for url in self.discovery.start_urls]
+
+    def spider_idle(self):
+        """spider_idle handler: schedules the listing pages if the sitemaps gave nothing."""
+        requests = self.fallback_requests()
+        for request in requests:
+            self.spider.crawler.engine.crawl(request)
+        if requests:
+            raise DontCloseSpider
+
+    def listing_request(self, url):
+        """Renders a listing page with Playwright, scrolling until no more products are loaded."""
+        meta = {
+            "playwright": True,
+            "playwright_page_methods": [
+                PageMethod(scroll_until_stable, self.discovery.max_scrolls, self.discovery.scroll_delay),
+            ],
+        }
+        if self.listing_meta:
+            meta.update(self.listing_meta())
+        return scrapy.Request(
+            url,
+            headers=self.headers(),
+            meta=meta,
+            callback=self.parse_listing,
+            errback=self.handle_error,
+            dont_filter=True,
+        )
+
+    def parse_listing(self, response):
+        self.spider.logger.info("Page processing: %s", response.url)
+        if response.status in [403, 429]:
+            self.spider.logger.warning("Acces denied (%s) - Anti-bot protection detected.", response.status)
+            return
+        if response.status != 200:
+            self.spider.logger.error("HTTP error %s on %s", response.status, response.url)
+            return
+
+        # Extracting product detail URLs from product cards.
+        selector = self.discovery.link_selector
+        links = response.xpath(selector) if is_xpath(selector) else response.css(selector)
+        detail_urls = [response.urljoin(url) for url in links.getall()]
+        self.spider.logger.info("%s URL(s) found on %s", len(detail_urls), response.url)
+        for url in detail_urls:
+            yield from self.detail_url(url, "listing")
+
+        # Handle pagination: if a 'next page' link is present.
+        if self.discovery.next_page_selector:
+            selector = self.discovery.next_page_selector
+            next_page = (response.xpath(selector) if is_xpath(selector) else response.css(selector)).get()
+            if next_page:
+                self.spider.logger.info("Following next page: %s", response.urljoin(next_page))
+                yield self.listing_request(response.urljoin(next_page))
+
+    def handle_error(self, failure):
+        self.spider.logger.error(repr(failure))
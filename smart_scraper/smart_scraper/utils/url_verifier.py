@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import logging
+from urllib.parse import urlparse
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList, DeferredSemaphore, succeed
+from twisted.internet.protocol import Protocol
+from twisted.web.client import Agent, BrowserLikeRedirectAgent, HTTPConnectionPool
+from twisted.web.http_headers import Headers
+
+logger = logging.getLogger(__name__)
+
+# Statuses of the hosts refusing HEAD requests: the URL is checked again with a one byte GET.
+HEAD_REFUSED = (403, 405)
+
+
+class DiscardBody(Protocol):
+    """Stops the download of a response body as soon as it starts."""
+
+    def connectionMade(self):
+        self.transport.stopProducing()
+
+
+class UrlVerifier:
+    """
+    Checks that URLs answer 200 to a HEAD request (or to a ranged GET if HEAD is
+    refused) without blocking the reactor. Checks run concurrently with a per-host
+    limit, concurrent checks of the same URL share one request, and results are kept
+    in a TTL cache (`negative_ttl` for invalid URLs) that can be saved to disk to be
+    shared across runs. Timeouts and connection errors count as invalid but are not cached.
+    """
+
+    def __init__(self, cache_path=None, ttl=86400, negative_ttl=3600, concurrency_per_host=4, timeout=5,
+                 user_agent=None, stats=None):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.concurrency_per_host = concurrency_per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.stats = stats
+
+        self.cache = {}
+        self.in_flight = {}
+        self.semaphores = {}
+
+        self.reactor = reactor
+        pool = HTTPConnectionPool(reactor, persistent=True)
+        pool.maxPersistentPerHost = concurrency_per_host
+        self.agent = BrowserLikeRedirectAgent(Agent(reactor, pool=pool))
+        self.pool = pool
+
+    def load(self):
+        """Loads the cache saved by a previous run, dropping expired entries."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as file:
+                cached = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("URL verification cache ignored (%s): %s", self.cache_path, e)
+            return
+        self.cache = {url: entry for url, entry in cached.items() if self.is_fresh(entry)}
+
+    def is_fresh(self, entry):
+        return time.time() - entry[1] < (self.ttl if entry[0] else self.negative_ttl)
+
+    def save(self):
+        """Saves the cache to disk and closes persistent connections."""
+        if self.cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            with open(self.cache_path, "w", encoding="utf-8") as file:
+                json.dump(self.cache, file)
+        return self.pool.closeCachedConnections()
+
+    def verify(self, url):
+        """Returns a Deferred firing with True if the URL answers 200."""
+        entry = self.cache.get(url)
+        if entry and self.is_fresh(entry):
+            self._inc_stat("url_verification/cache_hit")
+            return succeed(entry[0])
+
+        # Another item is already checking this URL: wait for its result.
+        if url in self.in_flight:
+            waiter = Deferred()
+            self.in_flight[url].append(waiter)
+            return waiter
+
+        self.in_flight[url] = []
+        host = urlparse(url).netloc
+        semaphore = self.semaphores.setdefault(host, DeferredSemaphore(self.concurrency_per_host))
+        d = semaphore.run(self._check, url)
+        d.addErrback(self._on_error, url)
+        d.addCallback(self._on_result, url)
+        return d
+
+    def verify_many(self, urls):
+        """Returns a Deferred firing with a {url: bool} dict, URLs are checked concurrently."""
+        urls = list(dict.fromkeys(urls))
+        d = DeferredList([self.verify(url) for url in urls])
+        d.addCallback(lambda results: {url: ok for url, (_, ok) in zip(urls, results)})
+        return d
+
+    def _request(self, method, url, headers=None):
+        headers = Headers(headers or {})
+        if self.user_agent:
+            headers.setRawHeaders(b"User-Agent", [self.user_agent.encode()])
+        self._inc_stat("url_verification/request_count")
+        d = self.agent.request(method, url.encode(), headers)
+        d.addTimeout(self.timeout, self.reactor)
+        return d
+
+    def _check(self, url):
+        """Fires with True/False from the status, fails on timeouts and connection errors."""
+        d = self._request(b"HEAD", url)
+        d.addCallback(self._on_head, url)
+        return d
+
+    def _on_head(self, response, url):
+        if response.code not in HEAD_REFUSED:
+            return response.code == 200
+        self._inc_stat("url_verification/ranged_get")
+        d = self._request(b"GET", url, {b"Range": [b"bytes=0-0"]})
+        d.addCallback(self._on_get)
+        return d
+
+    def _on_get(self, response):
+        response.deliverBody(DiscardBody())
+        return response.code in (200, 206)
+
+    def _on_error(self, failure, url):
+        self._inc_stat("url_verification/error")
+        logger.debug("URL check failed for %s: %s", url, failure.value)
+        return None
+
+    def _on_result(self, ok, url):
+        if ok is not None:
+            self.cache[url] = [ok, time.time()]
+        ok = bool(ok)
+        if not ok:
+            self._inc_stat("url_verification/invalid")
+        for waiter in self.in_flight.pop(url, []):
+            waiter.callback(ok)
+        return ok
+
+    def _inc_stat(self, key):
+        if self.stats:
+            self.stats.inc_value(key)
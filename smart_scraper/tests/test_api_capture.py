@@ -0,0 +1,143 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from smart_scraper.items import ProductItem
+from smart_scraper.utils.api_capture import ApiCapture, compile_json_path, json_path_values
+from smart_scraper.utils.config_loader import ApiCaptureConfig
+
+PAYLOAD = {
+    "product": {
+        "name": "  Robe midi  ",
+        "price": {"current": "39,99 €", "old": 59.99},
+        "images": [{"url": "/media/robe-1.jpg"}, {"url": "https://cdn.example.com/robe-2.jpg"}, {"url": "/media/robe-1.jpg"}],
+        "labels": ["Nouveauté", None, "Éco-responsable"],
+        "details": {"description": "<p>Robe <b>fluide</b></p>"},
+    },
+    "variants": [{"sku": "A", "stock": 0}, {"sku": "B", "stock": 3}],
+}
+
+
+@pytest.mark.parametrize("path, values", [
+    ("$.product.name", ["  Robe midi  "]),
+    ("$.product.price.old", [59.99]),
+    ("$.product.images[*].url", ["/media/robe-1.jpg", "https://cdn.example.com/robe-2.jpg", "/media/robe-1.jpg"]),
+    ("$.product.images[-1].url", ["/media/robe-1.jpg"]),
+    ("$..description", ["<p>Robe <b>fluide</b></p>"]),
+    ("$['variants'][1].sku", ["B"]),
+    ('$.product["labels"]', ["Nouveauté", "Éco-responsable"]),
+    ("$.product.*.current", ["39,99 €"]),
+    ("$.missing.key", []),
+    ("$.product.images[9]", []),
+])
+def test_json_path_values(path, values):
+    assert json_path_values(PAYLOAD, compile_json_path(path)) == values
+
+
+@pytest.mark.parametrize("path", ["$.product[", "$.product.", "$..", "$.a b"])
+def test_invalid_json_path(path):
+    with pytest.raises(ValueError):
+        compile_json_path(path)
+
+
+def capture(**config):
+    config = {"fields": {
+        "product_name": "$.product.name",
+        "offer_price": "$.product.price.old",
+        "discount_price": "$.product.price.current",
+        "offer_image_url": "$.product.images[*].url",
+        "product_description": "$..description",
+        "tags": "$.product.labels",
+    }, **config}
+    return ApiCapture(ApiCaptureConfig(**config), get_crawler())
+
+
+def test_unknown_field():
+    with pytest.raises(ValueError, match="Unknown api_capture field"):
+        capture(fields={"price": "$.price"})
+
+
+def test_fill_runs_the_field_processors():
+    response = HtmlResponse("https://www.example.com/robe-123.html", body=b"<html></html>")
+    item = capture().fill(ProductItem(product_name="Product name not found"), [{"other": 1}, PAYLOAD], response)
+    assert item["product_name"] == "Robe midi"
+    assert item["offer_price"] == 59.99
+    assert item["discount_price"] == 39.99
+    assert item["offer_image_url"] == ["https://www.example.com/media/robe-1.jpg", "https://cdn.example.com/robe-2.jpg"]
+    assert item["product_description"] == "Robe fluide"
+    assert item["tags"] == ["Nouveauté", "Éco-responsable"]
+
+
+def test_first_payload_holding_a_value_wins():
+    response = HtmlResponse("https://www.example.com/p", body=b"")
+    item = capture(fields={"product_name": "$..name"}).fill(ProductItem(), [{"name": "First"}, {"name": "Second"}], response)
+    assert item["product_name"] == "First"
+
+
+def page_response(url, status=200, content_type="application/json", method="GET"):
+    return SimpleNamespace(
+        url=url, status=status, headers={"content-type": content_type}, request=SimpleNamespace(method=method)
+    )
+
+
+def test_matches():
+    api = capture(url_patterns=[r"/api/products/\d+"])
+    assert api.matches(page_response("https://www.example.com/api/products/123"))
+    assert not api.matches(page_response("https://www.example.com/api/cart"))
+    assert not api.matches(page_response("https://www.example.com/api/products/123", content_type="text/html"))
+    assert not api.matches(page_response("https://www.example.com/api/products/123", status=500))
+    assert not api.matches(page_response("https://www.example.com/api/products/123", method="OPTIONS"))
+
+
+class FakePage:
+    """Page emitting its responses to the registered listeners."""
+
+    def __init__(self):
+        self.listeners = []
+
+    def on(self, event, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, event, listener):
+        self.listeners.remove(listener)
+
+    async def respond(self, payload, url="https://www.example.com/api/products/1"):
+        response = page_response(url)
+
+        async def json():
+            return payload
+
+        response.json = json
+        for listener in list(self.listeners):
+            await listener(response)
+
+
+def test_wait_for_payload_returns_as_soon_as_it_arrived():
+    api, page = capture(), FakePage()
+
+    async def render():
+        await api.init_page(page, None)
+        asyncio.get_running_loop().call_later(0.05, lambda: asyncio.ensure_future(page.respond(PAYLOAD)))
+        start = asyncio.get_running_loop().time()
+        payloads = await api.wait_for_payload(page, 5000)
+        return payloads, asyncio.get_running_loop().time() - start
+
+    payloads, waited = asyncio.run(render())
+    assert payloads == [PAYLOAD]
+    assert waited < 1
+    # The listener of the (pooled) page is removed once the payloads are read.
+    assert page.listeners == []
+    assert api.crawler.stats.get_value("api_capture/payloads") == 1
+
+
+def test_wait_for_payload_times_out():
+    api, page = capture(min_payloads=2), FakePage()
+
+    async def render():
+        await api.init_page(page, None)
+        await page.respond(PAYLOAD)
+        return await api.wait_for_payload(page, 100)
+
+    assert asyncio.run(render()) == [PAYLOAD]
+    assert asyncio.run(api.wait_for_payload(FakePage(), 100)) == []
@@ -0,0 +1,136 @@
+import math
+import asyncio
+from types import SimpleNamespace
+import pytest
+from smart_scraper.utils.browser_pool import BrowserPool
+
+
+class FakePage:
+    """Playwright page holding one page slot of its context until it is closed, like scrapy-playwright."""
+
+    def __init__(self, context, slots):
+        self.context = context
+        self.slots = slots
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            self.slots.release()
+
+
+async def crawl(pool, urls):
+    """
+    Builds every request first (the scheduler queue), then downloads them with at most
+    max_pages at a time, creating a page like scrapy-playwright when none was checked out.
+    """
+    slots = {}
+    downloads = asyncio.Semaphore(pool.max_pages)
+    metas = [pool.assign({"playwright": True}) for _ in range(urls)]
+    created = []
+
+    async def download(meta):
+        async with downloads:
+            pool.checkout(meta)
+            page = meta.get("playwright_page")
+            if page is None or page.is_closed():
+                name = meta["playwright_context"]
+                semaphore = slots.setdefault(name, asyncio.Semaphore(math.ceil(pool.max_pages / pool.contexts)))
+                await asyncio.wait_for(semaphore.acquire(), timeout=1)
+                page = FakePage(name, semaphore)
+                created.append(page)
+                pool.register_page(page, SimpleNamespace(meta=meta))
+                meta["playwright_page"] = page
+            await asyncio.sleep(0.001)
+            pool.release(meta)
+
+    await asyncio.gather(*(download(meta) for meta in metas))
+    pool.close()
+    return created
+
+
+@pytest.mark.parametrize("contexts, max_pages", [(1, 1), (1, 2), (2, 3), (3, 4)])
+def test_more_urls_than_pages(contexts, max_pages):
+    pool = BrowserPool("test", contexts=contexts, max_pages=max_pages, reuse_pages=True)
+    created = asyncio.run(crawl(pool, urls=20))
+    assert all(page.closed for page in created)
+    # Pages are reused: far fewer pages than URLs.
+    assert len(created) < 20
+    assert not any(pool.waiting.values())
+
+
+def test_pages_are_checked_out_at_download_time():
+    pool = BrowserPool("test", max_pages=1, reuse_pages=True)
+    queued = pool.assign({"playwright": True})
+    first = pool.assign({"playwright": True})
+    pool.checkout(first)
+    assert "playwright_page" not in first
+    page = FakePage("test-0-0", asyncio.Semaphore(1))
+    pool.register_page(page, SimpleNamespace(meta=first))
+    first["playwright_page"] = page
+    pool.release(first)
+
+    # The request built before the page was freed gets it once downloaded.
+    assert "playwright_page" not in queued
+    pool.checkout(queued)
+    assert queued["playwright_page"] is page
+
+
+def test_free_page_closed_while_a_request_waits():
+    pool = BrowserPool("test", max_pages=2, reuse_pages=True)
+    slots = asyncio.Semaphore(2)
+    running = [pool.assign({"playwright": True}) for _ in range(2)]
+    for meta in running:
+        pool.checkout(meta)
+        meta["playwright_page"] = FakePage("test-0-0", slots)
+        pool.register_page(meta["playwright_page"], SimpleNamespace(meta=meta))
+
+    # Both page slots are taken: the next request waits for a new page.
+    waiting = pool.checkout(pool.assign({"playwright": True}))
+    assert "playwright_page" not in waiting
+    pool.release(running[0])
+    assert running[0]["playwright_page"].closed
+    assert not pool.free_pages["test-0-0"]
+
+    # Once its page exists, released pages are kept for the next requests.
+    pool.register_page(FakePage("test-0-0", slots), SimpleNamespace(meta=waiting))
+    pool.release(running[1])
+    assert pool.free_pages["test-0-0"] == [running[1]["playwright_page"]]
+
+
+def test_dropped_requests_do_not_keep_a_context_open():
+    pool = BrowserPool("test", recycle_after=2)
+    context = SimpleNamespace(close=lambda: asyncio.sleep(0))
+    closed = []
+    pool._close = closed.append
+    metas = [pool.assign({"playwright": True}) for _ in range(4)]
+    # Only two requests are downloaded, the others are filtered before (dupefilter, dedup...).
+    for meta in metas[:2]:
+        pool.checkout(meta)
+        pool.register_page(SimpleNamespace(context=context), SimpleNamespace(meta=meta))
+    assert pool.in_flight == {"test-0-0": 2}
+    assert pool.retiring == {"test-0-0"}
+    for meta in metas[:2]:
+        pool.release(meta)
+    # The recycled context is closed once its downloaded requests are handled.
+    assert closed == [context]
+    assert pool.in_flight == {}
+    # A request built before the recycling goes to the new context.
+    assert pool.checkout(metas[2])["playwright_context"] == "test-0-1"
+
+
+def test_retries_are_counted_once():
+    pool = BrowserPool("test")
+    meta = pool.checkout(pool.assign({"playwright": True}))
+    # RetryMiddleware copies the meta of the request it retries, only the retry is handled.
+    retry_meta = pool.checkout(dict(meta))
+    assert pool.in_flight == {"test-0-0": 1}
+    pool.release(retry_meta)
+    assert pool.in_flight == {"test-0-0": 0}
+    # Requests never checked out (or already released) are not counted.
+    pool.release(retry_meta)
+    pool.release(pool.assign({"playwright": True}))
+    assert pool.in_flight == {"test-0-0": 0}
@@ -0,0 +1,38 @@
+import pickle
+import pytest
+from smart_scraper.utils import config_loader
+from smart_scraper.utils.config_loader import MODELS_VERSION, load_config
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_loader, "data_path", lambda path, createdir=False: str(tmp_path))
+    return tmp_path
+
+
+def cached_entry(cache_dir):
+    with open(cache_dir / "config_am.json.pickle", "rb") as file:
+        return pickle.load(file)
+
+
+def test_loaded_config_is_cached(cache_dir):
+    config = load_config("config_am.json")
+    entry = cached_entry(cache_dir)
+    assert entry["key"][-1] == MODELS_VERSION
+    assert entry["config"] == config
+
+
+@pytest.mark.parametrize("content", [b"not a pickle", pickle.dumps(["a", "list"]), pickle.dumps({"digest": "x"})])
+def test_unreadable_cache_is_a_miss(cache_dir, content):
+    (cache_dir / "config_am.json.pickle").write_bytes(content)
+    assert load_config("config_am.json").brand_name == "American Vintage"
+    assert cached_entry(cache_dir)["key"][-1] == MODELS_VERSION
+
+
+def test_cache_of_other_models_is_a_miss(cache_dir):
+    load_config("config_am.json")
+    entry = cached_entry(cache_dir)
+    entry["key"] = entry["key"][:-1] + ("older models",)
+    entry["config"] = "stale"
+    (cache_dir / "config_am.json.pickle").write_bytes(pickle.dumps(entry))
+    assert load_config("config_am.json") != "stale"
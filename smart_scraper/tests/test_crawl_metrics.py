@@ -0,0 +1,103 @@
+import os
+import re
+import json
+from datetime import datetime
+import pytest
+from scrapy.utils.test import get_crawler
+from smart_scraper.utils.crawl_metrics import observe, prometheus_text, stage_summary, write_metrics
+
+# One sample of the Prometheus text format: name{label="value",...} value
+SAMPLE_REGEX = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)\{((?:[a-zA-Z_]\w*="(?:[^"\\\n]|\\[\\"n])*",?)*)\} (\S+)$')
+
+
+def crawl_stats():
+    stats = get_crawler().stats
+    for ms in (0.5, 3, 3, 40, 120000):
+        observe(stats, "download", ms)
+    observe(stats, "parse/selectors", 7)
+    for key, value in {
+        "fields/items": 4,
+        "fields/offer_price/selector": 3,
+        "fields/offer_price/default": 1,
+        "fields/currency/config": 4,
+        "incomplete/items": 1,
+        "incomplete/fields/offer_price": 1,
+        "item_scraped_count": 3,
+        "response_received_count": 12,
+        "elapsed_time_seconds": 1.25,
+        "finish_reason": "finished",
+        "start_time": datetime(2026, 1, 1),
+        "httpcache/enabled": True,
+    }.items():
+        stats.set_value(key, value)
+    return stats.get_stats()
+
+
+def samples(text):
+    """Parses the samples of a Prometheus text exposition, failing on any invalid line."""
+    parsed = []
+    for line in text.splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) smart_scraper_\w+ .+$", line), line
+            continue
+        match = SAMPLE_REGEX.match(line)
+        assert match, line
+        labels = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2)))
+        parsed.append((match.group(1), labels, float(match.group(3))))
+    return parsed
+
+
+def test_stage_summary():
+    download = stage_summary(crawl_stats())["download"]
+    assert (download["count"], download["sum_ms"]) == (5, 120046.5)
+    assert download["buckets"] == {"1": 1, "5": 2, "50": 1, "inf": 1}
+    assert (download["p50_ms"], download["p90_ms"], download["p99_ms"]) == (5, None, None)
+
+
+def test_prometheus_histograms():
+    text = prometheus_text(crawl_stats(), "config_am")
+    buckets = [
+        (labels["le"], value) for name, labels, value in samples(text)
+        if name == "smart_scraper_stage_seconds_bucket" and labels["stage"] == "download"
+    ]
+    # Cumulative buckets in seconds, ending with +Inf = count.
+    assert buckets[:4] == [("0.001", 1), ("0.002", 1), ("0.005", 3), ("0.01", 3)]
+    assert buckets[-2:] == [("60", 4), ("+Inf", 5)]
+    assert [value for _, value in buckets] == sorted(value for _, value in buckets)
+    assert 'smart_scraper_stage_seconds_sum{config="config_am",stage="download"} 120.0465' in text
+    assert 'smart_scraper_stage_seconds_count{config="config_am",stage="parse/selectors"} 1' in text
+
+
+def test_prometheus_counters_and_stats():
+    parsed = samples(prometheus_text(crawl_stats(), "config_am"))
+    values = {(name, tuple(sorted(labels.items()))): value for name, labels, value in parsed}
+    assert values[("smart_scraper_field_source_total", (("config", "config_am"), ("field", "offer_price"), ("source", "default")))] == 1
+    assert values[("smart_scraper_incomplete_items_total", (("config", "config_am"), ("field", "offer_price")))] == 1
+    stats = {labels["name"]: value for name, labels, value in parsed if name == "smart_scraper_stat"}
+    # Only the other numeric stats: no strings, dates, booleans nor the keys exported above.
+    assert stats == {"elapsed_time_seconds": 1.25, "fields/items": 4, "item_scraped_count": 3, "response_received_count": 12}
+
+
+def test_prometheus_label_escaping():
+    config_name = 'config_"a"\\b\nc'
+    parsed = samples(prometheus_text({"item_scraped_count": 1}, config_name))
+    assert parsed[0][1]["config"] == 'config_\\"a\\"\\\\b\\nc'
+
+
+def test_prometheus_client_parses_the_output():
+    parser = pytest.importorskip("prometheus_client.parser")
+    families = {family.name: family for family in parser.text_string_to_metric_families(prometheus_text(crawl_stats(), "config_am"))}
+    assert families["smart_scraper_stage_seconds"].type == "histogram"
+    assert families["smart_scraper_field_source"].type == "counter"
+
+
+@pytest.mark.parametrize("prometheus_only, expected", [(False, ["config_am.json", "config_am.prom"]), (True, ["config_am.prom"])])
+def test_write_metrics(tmp_path, prometheus_only, expected):
+    stats = crawl_stats()
+    write_metrics(str(tmp_path), stats, "config_am", prometheus_only)
+    assert sorted(os.listdir(tmp_path)) == expected
+    assert (tmp_path / "config_am.prom").read_text(encoding="utf-8") == prometheus_text(stats, "config_am")
+    if not prometheus_only:
+        report = json.loads((tmp_path / "config_am.json").read_text(encoding="utf-8"))
+        assert report["fields"]["offer_price"]["hit_rate"] == 0.75
+        assert report["incomplete"]["drop_rate"] == 0.25
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+import pytest
+from scrapy.utils.test import get_crawler
+from smart_scraper.items import ProductItem
+from smart_scraper.pipelines import DedupPipeline
+from smart_scraper.spiders.main_spider import MainSpider
+from smart_scraper.utils.dedup_store import DedupStore, DuplicateItem, dedup_key
+from smart_scraper.utils.recrawl_store import RecrawlStore
+
+URL = "https://www.example.com/robe-123.html?utm_source=mail&color=blue"
+
+
+def product(price, url=URL):
+    return ProductItem(offer_url=url, product_name="Robe", offer_price=price)
+
+
+def run(path, *items):
+    """Runs DedupPipeline over the items with a new store (one crawl), returns the emitted prices."""
+    spider = SimpleNamespace(name="test", config_name="config_test", full=False)
+    pipeline = DedupPipeline(DedupStore(path), get_crawler().stats)
+    emitted = []
+    for item in items:
+        try:
+            emitted.append(pipeline.process_item(item, spider)["offer_price"])
+        except DuplicateItem:
+            pass
+    pipeline.close_spider(spider)
+    return emitted
+
+
+def test_price_changing_back_is_emitted(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    assert run(path, product(10.0)) == [10.0]
+    assert run(path, product(8.0)) == [8.0]
+    # Back to the price of the first run: changed since the last run.
+    assert run(path, product(10.0)) == [10.0]
+    assert run(path, product(10.0)) == []
+
+
+def test_duplicates_within_a_run(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    variant = product(10.0, "https://www.example.com/robe-123.html?color=blue#reviews")
+    assert run(path, product(10.0), variant, product(10.0)) == [10.0]
+
+
+def test_other_process_emitting_the_same_version(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    first, second = DedupStore(path), DedupStore(path)
+    key = dedup_key(product(10.0))
+    assert first.check(key) is None
+    # Missing from the Bloom filter of the second store, caught by the upsert.
+    assert second.check(key) == "previous_run"
+    assert second.check(dedup_key(product(9.0))) is None
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize("exception, recorded", [(DuplicateItem("duplicate"), True), (ValueError("invalid"), False)])
+def test_dropped_duplicates_keep_their_recrawl_record(tmp_path, exception, recorded):
+    store = RecrawlStore(str(tmp_path / "recrawl.db"))
+    spider = SimpleNamespace(
+        pending_records={URL: (URL, "fingerprint", '"v1"', None)},
+        recrawl_store=store,
+        crawler=SimpleNamespace(stats=get_crawler().stats),
+    )
+    MainSpider.item_dropped(spider, product(10.0), None, exception, spider)
+    assert not spider.pending_records
+    assert store.is_unchanged(URL, "fingerprint") is recorded
+    store.close()
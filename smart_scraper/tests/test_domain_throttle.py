@@ -0,0 +1,110 @@
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+import pytest
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+from smart_scraper.middlewares import SmartScraperDownloaderMiddleware
+from smart_scraper.utils.domain_throttle import DomainThrottle, parse_retry_after
+
+
+@pytest.mark.parametrize("value, expected", [(b"120", 120.0), ("7", 7.0), (b" 3 ", 3.0), (None, None), (b"", None), (b"soon", None)])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    wait = parse_retry_after(formatdate(time.time() + 120, usegmt=True).encode("latin-1"))
+    assert 115 <= wait <= 120
+    # A date in the past asks for no wait.
+    assert parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_block_slows_down_once_per_burst():
+    throttle = DomainThrottle(8, 0.5, max_delay=10)
+    assert throttle.on_block(sent_at=time.time())
+    assert (throttle.concurrency, throttle.delay) == (4, 1.0)
+    # Sent before the slow down: same burst, no second halving.
+    assert not throttle.on_block(sent_at=time.time() - 5)
+    assert (throttle.concurrency, throttle.delay) == (4, 1.0)
+    # Retry-After raises the delay, up to max_delay.
+    assert throttle.on_block(retry_after=30, sent_at=time.time() - 5)
+    assert throttle.delay == 10
+    assert throttle.block_rate == 1.0
+
+
+def test_ramp_up_after_clean_responses():
+    throttle = DomainThrottle(4, 0.5, ramp_up_after=3)
+    throttle.on_block()
+    throttle.on_block(sent_at=time.time() + 1)
+    assert (throttle.concurrency, throttle.delay) == (1, 2.0)
+    changes = [throttle.on_success(0.2) for _ in range(6)]
+    assert changes == [False, False, True, False, False, True]
+    assert (throttle.concurrency, throttle.delay) == (3, 0.5)
+    for _ in range(9):
+        throttle.on_success(0.2)
+    # Back to the slot settings, never above.
+    assert (throttle.concurrency, throttle.delay) == (4, 0.5)
+
+
+def test_no_ramp_up_when_latency_doubles():
+    throttle = DomainThrottle(4, 0.5, ramp_up_after=2)
+    throttle.on_block()
+    throttle.on_success(0.1)
+    throttle.on_success(0.1)
+    assert throttle.concurrency == 3
+    assert not any(throttle.on_success(2.0) for _ in range(4))
+    assert throttle.concurrency == 3
+
+
+def middleware(**settings):
+    crawler = get_crawler(settings_dict={
+        "SMART_THROTTLE_BLOCK_CODES": [403, 429, 503],
+        "SMART_THROTTLE_MAX_DELAY": 60,
+        "SMART_THROTTLE_RAMP_UP_AFTER": 20,
+        "SMART_THROTTLE_MAX_RETRIES": 2,
+        "SMART_THROTTLE_BACKOFF": 2,
+        **settings,
+    })
+    slot = SimpleNamespace(concurrency=8, delay=0.0)
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(get_slot_key=lambda request: "example.com", slots={"example.com": slot}))
+    spider = SimpleNamespace(logger=SimpleNamespace(info=lambda *args: None, warning=lambda *args: None, debug=lambda *args: None))
+    return SmartScraperDownloaderMiddleware(crawler), slot, spider
+
+
+def test_blocked_request_is_rescheduled_with_a_slot_delay():
+    mw, slot, spider = middleware()
+    request = Request("https://example.com/p", meta={"download_latency": 0.1})
+    retry = mw.process_response(request, Response(request.url, status=429, headers={"Retry-After": "5"}), spider)
+    # A new request for the scheduler, not a deferred holding the download slot.
+    assert isinstance(retry, Request)
+    assert retry.dont_filter and retry.meta["throttle_retries"] == 1
+    assert "download_latency" not in retry.meta
+    assert (slot.concurrency, slot.delay) == (4, 5.0)
+
+    # Exponential backoff on the next retries, then the response goes to the spider.
+    retry = mw.process_response(retry, Response(request.url, status=429), spider)
+    assert retry.meta["throttle_retries"] == 2 and slot.delay == 10.0
+    response = Response(request.url, status=429)
+    assert mw.process_response(retry, response, spider) is response
+    assert retry.meta["dont_retry"]
+    assert mw.crawler.stats.get_value("throttle/gave_up") == 1
+
+
+def test_fallback_responses_reach_the_spider():
+    mw, slot, spider = middleware()
+    request = Request("https://example.com/p", meta={"handle_httpstatus_list": [403, 429, 503]})
+    response = Response(request.url, status=403)
+    assert mw.process_response(request, response, spider) is response
+    assert slot.concurrency == 4
+
+
+def test_clean_responses_ramp_the_slot_up():
+    mw, slot, spider = middleware(SMART_THROTTLE_RAMP_UP_AFTER=2)
+    request = Request("https://example.com/p")
+    mw.process_response(request, Response(request.url, status=503), spider)
+    assert (slot.concurrency, slot.delay) == (4, 2.0)
+    for _ in range(2):
+        mw.process_response(request, Response(request.url), spider)
+    assert (slot.concurrency, slot.delay) == (5, 1.0)
+    assert mw.crawler.stats.get_value("throttle/ramp_up") == 1
@@ -0,0 +1,141 @@
+import os
+import glob
+import json
+import pytest
+from itemloaders.processors import MapCompose
+from scrapy.http import HtmlResponse
+from smart_scraper.items import ProductItem, ProductLoader
+from smart_scraper.utils.config_loader import CONFIGS_DIR, ScraperConfig
+from smart_scraper.utils.extraction_plan import ExtractionPlan, is_xpath
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), "pages")
+
+# Saved pages and the URLs they were served from (the URL feeds offer_url and gender).
+PAGES = {
+    "dress_sale.html": "https://www.example.com/femme/robes/robe-midi-imprimee-123.html?color=blue",
+    "sneakers.html": "https://shop.example.com/en/men/shoes/leather-sneakers",
+    "incomplete.html": "https://www.example.com/kids/out-of-stock",
+}
+
+BASE_CONFIG = {
+    "base_urls": ["https://www.example.com/"],
+    "brand_name": "Example",
+    "brand_url": "https://www.example.com/",
+    "vendor_name": "Example",
+    "vendor_url": "https://www.example.com/",
+    "currency": "EUR",
+    "gender": "",
+    "pagination": {"enabled": False, "selector": ""},
+    "anti_bot": {"use_playwright": False, "delay": 1},
+    "scroll": {"enabled": False, "times": 1, "delay": 1},
+    "headers": {"Accept-Language": "fr-FR,fr;q=0.9", "Referer": "https://www.example.com/femme/robes"},
+}
+
+# Selectors matching the saved pages, as CSS and as XPath.
+PAGE_SELECTORS = {
+    "css": {
+        "brand_name": "span.brand::text",
+        "product_name": "h1.product-name::text",
+        "offer_price": ".prices .price::text",
+        "discount_price": ".prices .price--sale::text",
+        "discount_percentage": "",
+        "offer_image_url": "img.gallery-img::attr(src)",
+        "product_description": ".description",
+        "vendor_icon_url": "link[rel=icon]::attr(href)",
+        "tags": ".tags .tag::text",
+    },
+    "xpath": {
+        "product_name": "//h1[@class='product-name']//text()",
+        "offer_price": "//*[contains(@class, 'prices')]//span[contains(@class, 'price')]/text()",
+        "discount_price": "//span[contains(@class, 'price--sale')]/text()",
+        "discount_percentage": "//span[@class='badge']/text()",
+        "offer_image_url": "//img[contains(@class, 'gallery-img')]/@src",
+        "product_description": "//*[contains(@class, 'description')]//text()",
+        "vendor_icon_url": "",
+        "tags": "//span[@class='tag']/text()",
+    },
+}
+
+
+def loader_item(config, response):
+    """The item built by the ProductLoader calls parse() made before the extraction plan."""
+    loader = ProductLoader(item=ProductItem(), response=response)
+    selectors = config.selectors
+
+    def add(field_name, selector, *processors):
+        if selector:
+            add_selector = loader.add_xpath if is_xpath(selector) else loader.add_css
+            add_selector(field_name, selector, *processors)
+
+    join_url = MapCompose(lambda url: response.urljoin(url))
+    if getattr(selectors, "brand_name", None):
+        add("brand_name", selectors.brand_name)
+    elif config.brand_name:
+        loader.add_value("brand_name", config.brand_name)
+    if selectors.discount_percentage:
+        add("discount_percentage", selectors.discount_percentage)
+    for field_name in ("product_name", "offer_price", "discount_price", "product_description", "tags"):
+        add(field_name, getattr(selectors, field_name))
+    loader.add_value("brand_url", config.brand_url or None)
+    loader.add_value("currency", config.currency or None)
+    loader.add_value("vendor_name", config.vendor_name or None)
+    loader.add_value("vendor_url", config.vendor_url or None)
+    if selectors.offer_image_url:
+        add("offer_image_url", selectors.offer_image_url, join_url)
+    else:
+        loader.add_value("offer_image_url", "No image available")
+    if selectors.vendor_icon_url:
+        add("vendor_icon_url", selectors.vendor_icon_url, join_url)
+    elif config.vendor_url:
+        loader.add_value("vendor_icon_url", f"{config.vendor_url.rstrip('/')}/favicon.ico")
+    loader.add_value("offer_url", response.url)
+    loader.add_value("gender", config.gender or config.headers.Referer)
+    return loader.load_item()
+
+
+def saved_responses():
+    for name, url in PAGES.items():
+        with open(os.path.join(PAGES_DIR, name), "rb") as file:
+            yield HtmlResponse(url=url, body=file.read(), encoding="utf-8")
+
+
+def shipped_configs():
+    for path in sorted(glob.glob(os.path.join(CONFIGS_DIR, "config_*.json"))):
+        with open(path, "r", encoding="utf-8") as file:
+            yield pytest.param(ScraperConfig(**json.load(file)), id=os.path.basename(path))
+
+
+def page_configs():
+    for name, selectors in PAGE_SELECTORS.items():
+        yield pytest.param(ScraperConfig(**{**BASE_CONFIG, "selectors": selectors}), id=name)
+
+
+def assert_same_items(config):
+    plan = ExtractionPlan(config)
+    for response in saved_responses():
+        expected = dict(loader_item(config, response))
+        item = plan.extract(response)
+        assert isinstance(item, ProductItem)
+        assert set(item) == set(expected), response.url
+        for field_name, value in expected.items():
+            assert item[field_name] == value, f"{field_name} differs on {response.url}"
+
+
+@pytest.mark.parametrize("config", list(page_configs()))
+def test_plan_matches_loader_on_saved_pages(config):
+    assert_same_items(config)
+
+
+@pytest.mark.parametrize("config", list(shipped_configs()))
+def test_plan_matches_loader_with_shipped_configs(config):
+    assert_same_items(config)
+
+
+def test_saved_pages_are_extracted():
+    """The page selectors do find the products, so the comparison is not between two default items."""
+    config = ScraperConfig(**{**BASE_CONFIG, "selectors": PAGE_SELECTORS["css"]})
+    items = [ExtractionPlan(config).extract(response) for response in saved_responses()]
+    assert items[0]["product_name"] == "Robe midi imprimée"
+    assert items[0]["offer_image_url"] == ["https://www.example.com/media/robe-1.jpg", "https://cdn.example.com/robe-2.jpg"]
+    assert items[1]["offer_price"] == 120.0
+    assert items[2]["product_name"] == "Product name not found"
@@ -0,0 +1,47 @@
+import pytest
+from bs4 import BeautifulSoup
+from smart_scraper.commands.parsebench import soup_clean_html_tags
+from smart_scraper.items import clean_html_tags
+from smart_scraper.utils.html_text import html_to_text
+
+# Description fragments as they come out of the selectors and JSON-LD.
+FRAGMENTS = {
+    "nested_lists": "<ul><li>Coton bio<ul><li>Tissage <b>serré</b></li><li>180 g/m²</li></ul></li><li>Lavage 30°</li></ul>",
+    "br": "Robe fluide<br>coupe évasée<br/>longueur midi<BR >doublée",
+    "entities": "Caf&eacute; &amp; cr&egrave;me &ndash; 100&nbsp;% coton &#150; &#x2014; &#8364;20 &copy; &unknown; &lt;b&gt;",
+    "escaped_html": "&lt;p&gt;Pull &lt;strong&gt;en laine&lt;/strong&gt;&lt;/p&gt;&amp;lt;br&amp;gt;Maille fine",
+    "script_style": (
+        "<p>Jean droit</p><script>var sizes = ['S', 'M'];</script>"
+        "<style>.x { color: red }</style><template><p>hidden</p></template><p>Denim brut</p>"
+    ),
+    "ruby": "<ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp></ruby>字",
+    "malformed": "<div><p>Col rond<p>Manches <i>longues</div></b> <span>Coupe <em>ajustée</p></span>",
+    "unclosed": "<p>Sans fin <b>en gras",
+    "stray_end_tags": "</p>Texte</li></ul> libre</br> fin",
+    "comments_cdata": "<!-- promo --><p>Veste</p><!DOCTYPE html><![CDATA[ brut ]]><?xml version='1.0'?>Imperméable",
+    "whitespace": "  <p>\n\tT-shirt   col\tV </p>\n\n<p>  manches courtes  </p>  ",
+    "attributes": '<img src="a.jpg" alt="Photo"><a href="/x?a=1&b=2" title="<lien>">Guide des tailles</a>',
+    "inline_words": "<p>Matière<b>:</b>lin</p><span>Made</span><span>in</span>France",
+    "plain_text": "Sneakers   en cuir\n blanc",
+    "empty_tags": "<p></p><div> </div><br><hr>",
+}
+
+
+@pytest.mark.parametrize("fragment", list(FRAGMENTS.values()), ids=list(FRAGMENTS))
+def test_same_text_as_beautifulsoup(fragment):
+    assert clean_html_tags(fragment) == soup_clean_html_tags(fragment)
+
+
+@pytest.mark.parametrize("fragment", list(FRAGMENTS.values()), ids=list(FRAGMENTS))
+def test_html_to_text_matches_get_text(fragment):
+    expected = " ".join(BeautifulSoup(fragment, "html.parser").get_text(separator=" ").split())
+    assert html_to_text(fragment) == expected
+
+
+def test_cleaned_text():
+    assert clean_html_tags(FRAGMENTS["nested_lists"]) == "Coton bio Tissage serré 180 g/m² Lavage 30°"
+    assert clean_html_tags(FRAGMENTS["script_style"]) == "Jean droit Denim brut"
+    assert clean_html_tags(FRAGMENTS["escaped_html"]) == "Pull en laine Maille fine"
+    assert clean_html_tags(FRAGMENTS["whitespace"]) == "T-shirt col V manches courtes"
+    assert clean_html_tags("") == ""
+    assert clean_html_tags(None) is None
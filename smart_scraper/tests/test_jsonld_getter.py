@@ -0,0 +1,82 @@
+import json
+import pytest
+from scrapy.http import HtmlResponse
+from smart_scraper.utils.jsonld_getter import extract_jsonld_data, fetch_jsonld_data, find_offer, find_product, offer_prices
+
+PRODUCT = {"@type": "Product", "name": "Robe"}
+
+
+@pytest.mark.parametrize("data", [
+    PRODUCT,
+    [{"@type": "BreadcrumbList"}, PRODUCT],
+    {"@context": "https://schema.org", "@graph": [{"@type": "WebPage"}, PRODUCT]},
+    [{"@graph": [{"@type": "Organization"}]}, {"@graph": [PRODUCT]}],
+    {**PRODUCT, "@type": ["Thing", "schema:Product"]},
+    {**PRODUCT, "@type": "https://schema.org/ProductGroup"},
+])
+def test_find_product(data):
+    assert find_product(data)["name"] == "Robe"
+
+
+@pytest.mark.parametrize("data", [{"@type": "WebPage"}, {"@graph": {"@type": "Organization"}}, [], "Product", {"@type": None}])
+def test_find_product_without_product(data):
+    assert find_product(data) == {}
+
+
+@pytest.mark.parametrize("offers, expected", [
+    ({"@type": "Offer", "price": "59.90"}, {"@type": "Offer", "price": "59.90"}),
+    ([{"@type": "Offer", "availability": "OutOfStock"}, {"@type": "Offer", "price": 49}], {"@type": "Offer", "price": 49}),
+    ({"@type": "AggregateOffer", "lowPrice": "39,90"}, {"@type": "AggregateOffer", "lowPrice": "39,90"}),
+    ({"@type": "AggregateOffer", "offers": [{"price": "45"}]}, {"price": "45"}),
+    ([None, "59.90"], {}),
+])
+def test_find_offer(offers, expected):
+    assert find_offer({"offers": offers}) == expected
+
+
+def test_find_offer_of_product_group_variants():
+    group = {"@type": "ProductGroup", "hasVariant": [{"@type": "Product"}, {"@type": "Product", "offers": {"price": "30"}}]}
+    assert find_offer(group) == {"price": "30"}
+
+
+def test_offer_prices():
+    assert offer_prices({"price": "59,90 €"}) == (59.9, None)
+    discounted = {"price": "40", "priceSpecification": [{"priceType": "https://schema.org/StrikethroughPrice", "price": "80"}]}
+    assert offer_prices(discounted) == (80.0, 40.0)
+    # A list price under the offer price is not a discount.
+    assert offer_prices({"price": "40", "priceSpecification": {"priceType": "ListPrice", "price": "30"}}) == (40.0, None)
+
+
+def test_extract_jsonld_data_skips_invalid_scripts():
+    graph = {"@graph": [{"@type": "WebSite"}, {"@type": ["Product"], "name": "Robe", "description": "Ligne 1\nLigne 2"}]}
+    body = (
+        '<html><head><script type="application/ld+json">{not json</script>'
+        '<script type="application/ld+json">{"@type": "Organization"}</script>'
+        # Raw line break in a string, accepted by the non-strict parser.
+        f'<script type="application/ld+json">{json.dumps(graph).replace(chr(92) + "n", chr(10))}</script>'
+        "</head><body></body></html>"
+    )
+    response = HtmlResponse("https://www.example.com/robe.html", body=body, encoding="utf-8")
+    assert extract_jsonld_data(response)["name"] == "Robe"
+
+
+def test_fetch_jsonld_data_fills_the_default_values():
+    jsonld_data = {
+        "name": "Robe <b>longue</b>",
+        "image": ["/img/1.jpg", {"@type": "ImageObject", "url": "https://cdn.example.com/2.jpg"}, "/img/1.jpg"],
+        "offers": [{"price": "80", "priceCurrency": "EUR", "priceSpecification": {"priceType": "StrikethroughPrice", "price": "100"}}],
+    }
+    item = {
+        "brand_url": "https://www.example.com/",
+        "product_name": "Product name not found",
+        "offer_image_url": "No image available",
+        "offer_price": "Price not available",
+        "discount_price": "No discount",
+        "currency": "USD",
+    }
+    fetch_jsonld_data(jsonld_data, item)
+    assert item["product_name"] == "Robe longue"
+    assert item["offer_image_url"] == ["https://www.example.com/img/1.jpg", "https://cdn.example.com/2.jpg"]
+    assert (item["offer_price"], item["discount_price"]) == (100.0, 80.0)
+    # Values found by the selectors are kept.
+    assert item["currency"] == "USD"
@@ -0,0 +1,135 @@
+import os
+import gzip
+import json
+import sqlite3
+from types import SimpleNamespace
+import pytest
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+from smart_scraper.items import ProductItem
+from smart_scraper.pipelines import SmartScraperPipeline
+from smart_scraper.utils.output_writers import JsonLinesWriter, SqliteWriter, column_value, partition_name
+
+FIELDS = ["brand_name", "offer_url", "offer_price", "discount_price", "offer_image_url"]
+
+
+def rows(count, brand="Sézane"):
+    return [
+        {"brand_name": brand, "offer_url": f"https://www.example.com/{brand}/{n}", "offer_price": 10.0 + n,
+         "discount_price": "No discount", "offer_image_url": [f"https://img.example.com/{n}.jpg"]}
+        for n in range(count)
+    ]
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+@pytest.mark.parametrize("value, expected", [("Sézane Paris", "sézane-paris"), ("../A&B", "a-b"), (None, "unknown"), ("--", "unknown")])
+def test_partition_name(value, expected):
+    assert partition_name(value) == expected
+
+
+def test_column_value():
+    assert column_value("offer_price", 12) == 12.0
+    assert column_value("discount_price", "No discount") is None
+    assert column_value("discount_percentage", True) is None
+    assert column_value("tags", "robe") == ["robe"]
+    assert column_value("offer_image_url", ("a", 1)) == ["a", "1"]
+    assert column_value("product_name", 3) == "3"
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_json_lines_rotation(tmp_path, compression):
+    writer = JsonLinesWriter(str(tmp_path), "run", FIELDS, max_items=2, compression=compression)
+    writer.write_batch(rows(3))
+    # The file being written stays hidden until it is complete.
+    assert [name.startswith(".") for name in sorted(os.listdir(tmp_path))] == [True, False]
+    writer.write_batch(rows(2)[1:])
+    writer.close()
+    extension = ".jsonl.gz" if compression else ".jsonl"
+    assert sorted(os.listdir(tmp_path)) == [f"part-run-{n:05d}{extension}" for n in (1, 2)]
+    lines = [line for path in writer.files for line in read_lines(path)]
+    assert [line["offer_price"] for line in lines] == [10.0, 11.0, 12.0, 11.0]
+    assert list(lines[0]) == FIELDS
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        JsonLinesWriter(str(tmp_path), "run", FIELDS, compression="bz2")
+
+
+def test_sqlite_schema(tmp_path):
+    path = str(tmp_path / "config_test.db")
+    writer = SqliteWriter(path, FIELDS)
+    writer.write_batch(rows(2))
+    # One row per offer_url: the last version wins.
+    writer.write_batch([{**rows(1)[0], "offer_price": 9.0}])
+    writer.close()
+
+    connection = sqlite3.connect(path)
+    columns = {name: (kind, primary_key) for _, name, kind, _, _, primary_key in connection.execute("PRAGMA table_info(products)")}
+    assert columns == {
+        "brand_name": ("TEXT", 0),
+        "offer_url": ("TEXT", 1),
+        "offer_price": ("REAL", 0),
+        "discount_price": ("REAL", 0),
+        "offer_image_url": ("TEXT", 0),
+    }
+    assert [row[1] for row in connection.execute("PRAGMA index_list(products)")].count("products_brand_name") == 1
+    products = connection.execute("SELECT offer_price, discount_price, offer_image_url FROM products ORDER BY offer_url").fetchall()
+    assert products == [(9.0, None, '["https://img.example.com/0.jpg"]'), (11.0, None, '["https://img.example.com/1.jpg"]')]
+    connection.close()
+
+
+def make_pipeline(tmp_path, **settings):
+    settings = Settings({
+        "OUTPUT_FORMAT": "jsonl", "OUTPUT_DIR": str(tmp_path), "OUTPUT_COMPRESSION": "", "OUTPUT_BATCH_SIZE": 2,
+        "OUTPUT_PARTITION_BY": "brand_name", "FEED_EXPORT_FIELDS": FIELDS, **settings,
+    })
+    pipeline = SmartScraperPipeline(settings, get_crawler().stats)
+    pipeline.open_spider(SimpleNamespace(name="main_spider", config_name="config_test"))
+    return pipeline
+
+
+def test_partitioned_outputs(tmp_path):
+    pipeline = make_pipeline(tmp_path, OUTPUT_MAX_OPEN_PARTITIONS=1)
+    # Alternating brands: each new partition closes the writer of the other one.
+    for first, second in zip(rows(3, "Sézane"), rows(3, "Rouje")):
+        pipeline.process_item(ProductItem(first), None)
+        pipeline.process_item(ProductItem(second), None)
+    pipeline.close_spider(None)
+
+    output = tmp_path / "config_test"
+    assert sorted(os.listdir(output)) == ["brand_name=rouje", "brand_name=sézane"]
+    for brand in ("rouje", "sézane"):
+        files = sorted(os.listdir(output / f"brand_name={brand}"))
+        # A reopened partition goes on with the next file number.
+        assert [name.rsplit("-", 1)[-1] for name in files] == ["00001.jsonl", "00002.jsonl"]
+        assert sum(len(read_lines(str(output / f"brand_name={brand}" / name))) for name in files) == 3
+    assert pipeline.stats.get_value("output/items") == 6
+    assert pipeline.stats.get_value("output/files") == 4
+
+
+def test_unpartitioned_sqlite_output(tmp_path):
+    pipeline = make_pipeline(tmp_path, OUTPUT_FORMAT="sqlite")
+    for row in rows(3) + rows(2, "Rouje"):
+        pipeline.process_item(ProductItem(row), None)
+    pipeline.close_spider(None)
+    connection = sqlite3.connect(str(tmp_path / "config_test.db"))
+    assert connection.execute("SELECT brand_name, COUNT(*) FROM products GROUP BY brand_name ORDER BY 1").fetchall() == [("Rouje", 2), ("Sézane", 3)]
+    connection.close()
+
+
+def test_parquet_columns(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    pipeline = make_pipeline(tmp_path, OUTPUT_FORMAT="parquet", OUTPUT_PARTITION_BY="")
+    for row in rows(3):
+        pipeline.process_item(ProductItem(row), None)
+    pipeline.close_spider(None)
+    (path,) = pipeline.files
+    table = parquet.read_table(path)
+    assert table.column("discount_price").to_pylist() == [None, None, None]
+    assert table.column("offer_image_url").to_pylist()[0] == ["https://img.example.com/0.jpg"]
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import pytest
+from playwright.async_api import Error as PlaywrightError
+from smart_scraper.utils.page_actions import PRODUCT_READY_JS, to_page_selectors, wait_for_product
+
+
+class FakePage:
+    """Page settling after `settle` s, whose product selectors match after `ready` s or raise `error`."""
+
+    def __init__(self, settle, ready=None, error=None):
+        self.settle = settle
+        self.ready = ready
+        self.error = error
+
+    async def wait_for_load_state(self, state, timeout):
+        await asyncio.sleep(self.settle)
+
+    async def wait_for_function(self, expression, arg=None, timeout=None, polling=None):
+        if expression != PRODUCT_READY_JS:
+            return True
+        if self.error:
+            raise self.error
+        await asyncio.sleep(self.ready if self.ready is not None else timeout / 1000)
+
+
+def wait(page, timeout=2000):
+    return asyncio.run(wait_for_product(page, [{"xpath": False, "query": "h1"}], timeout)) / 1000
+
+
+def test_page_selectors():
+    assert to_page_selectors(["h1.name::text", "", "  ", "//h1/text()", "(//span)[1]"]) == [
+        {"xpath": False, "query": "h1.name"},
+        {"xpath": True, "query": "//h1/text()"},
+        {"xpath": True, "query": "(//span)[1]"},
+    ]
+
+
+@pytest.mark.parametrize("selector, query", [
+    ("h1.name::text, .title::text", "h1.name, .title"),
+    ("a.next::attr(href),link[rel=next]::attr(href)", "a.next, link[rel=next]"),
+    ("span.price::text, span.sale", "span.price, span.sale"),
+    (':is(h1, h2)::text, img[alt="a, b"]::attr(src)', ':is(h1, h2), img[alt="a, b"]'),
+])
+def test_pseudo_elements_stripped_from_every_part(selector, query):
+    assert to_page_selectors([selector]) == [{"xpath": False, "query": query}]
+
+
+def test_returns_when_the_product_is_there():
+    assert wait(FakePage(settle=1.0, ready=0.05)) < 0.5
+
+
+def test_returns_when_the_page_has_settled():
+    assert wait(FakePage(settle=0.05)) < 0.5
+
+
+def test_unusable_selector_waits_for_the_page_to_settle(caplog):
+    page = FakePage(settle=0.3, error=PlaywrightError("SyntaxError: 'h1::text' is not a valid selector"))
+    with caplog.at_level(logging.WARNING, logger="smart_scraper.utils.page_actions"):
+        waited = wait(page)
+    assert 0.3 <= waited < 1.0
+    assert "Product selectors unusable" in caplog.text
+
+
+def test_gives_up_after_the_timeout():
+    assert 0.2 <= wait(FakePage(settle=5.0), timeout=200) < 0.5
@@ -0,0 +1,129 @@
+import json
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from smart_scraper.items import ProductItem
+from smart_scraper.pipelines import RecrawlPipeline
+from smart_scraper.spiders.main_spider import MainSpider
+from smart_scraper.utils import config_loader
+from smart_scraper.utils.recrawl_store import RecrawlStore, item_fingerprint
+
+URL = "https://www.example.com/robe-123.html"
+
+PAGE = b"""<html><body>
+<h1 class="name">Robe midi</h1><span class="price">59,99 EUR</span><span class="sale">39,99 EUR</span>
+<img class="pic" src="/robe.jpg"><div class="desc"><p>Robe en viscose</p></div>
+<a class="next" href="/robes?page=2">Suivant</a>
+</body></html>"""
+
+CONFIG = {
+    "base_urls": [URL],
+    "brand_name": "Example",
+    "brand_url": "https://www.example.com/",
+    "vendor_name": "Example",
+    "vendor_url": "https://www.example.com/",
+    "currency": "EUR",
+    "gender": "Femme",
+    "selectors": {
+        "product_name": "h1.name::text",
+        "offer_price": "span.price::text",
+        "discount_price": "span.sale::text",
+        "discount_percentage": "",
+        "offer_image_url": "img.pic::attr(src)",
+        "product_description": ".desc p::text",
+        "vendor_icon_url": "",
+        "tags": "",
+    },
+    "pagination": {"enabled": True, "selector": "a.next::attr(href)"},
+    "anti_bot": {"use_playwright": False, "delay": 1, "playwright_fallback": False},
+    "scroll": {"enabled": False, "times": 1, "delay": 1},
+    "headers": {"Accept-Language": "fr-FR,fr;q=0.9", "Referer": "https://www.example.com/"},
+}
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "recrawl.db")
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_loader, "data_path", lambda path, createdir=False: str(tmp_path))
+    path = tmp_path / "config_recrawl.json"
+    path.write_text(json.dumps(CONFIG))
+    return str(path)
+
+
+def open_spider(config_file, store_path, **kwargs):
+    settings = {"RECRAWL_ENABLED": True, "RECRAWL_STORE": store_path}
+    crawler = get_crawler(MainSpider, settings)
+    return MainSpider.from_crawler(crawler, config_file=config_file, **kwargs)
+
+
+def crawl_page(spider, status=200, body=PAGE):
+    """Parses the response of the product page, returns the items and the requests."""
+    request = spider.detail_request(URL)
+    response = HtmlResponse(URL, status=status, body=body, request=request)
+    output = list(spider.parse(response))
+    items = [value for value in output if isinstance(value, ProductItem)]
+    for item in items:
+        RecrawlPipeline().process_item(item, spider)
+    return items, [value for value in output if isinstance(value, Request)]
+
+
+def test_conditional_headers(store_path):
+    store = RecrawlStore(store_path)
+    assert store.conditional_headers(URL) == {}
+    store.record(URL, "fingerprint", '"v1"', "Wed, 01 Oct 2025 10:00:00 GMT")
+    assert store.conditional_headers(URL) == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Wed, 01 Oct 2025 10:00:00 GMT",
+    }
+    store.record(URL, "fingerprint")
+    assert store.conditional_headers(URL) == {}
+    assert store.is_unchanged(URL, "fingerprint")
+    assert not store.is_unchanged(URL, "other")
+    store.close()
+
+
+def test_item_fingerprint_is_stable():
+    item = ProductItem(offer_url=URL, product_name="Robe", offer_price=39.99, tags=["a", "b"])
+    same = {"tags": ["a", "b"], "offer_price": 39.99, "product_name": "Robe", "offer_url": URL}
+    assert item_fingerprint(item) == item_fingerprint(same)
+    assert item_fingerprint(item) == item_fingerprint(ProductItem(item))
+    assert item_fingerprint(item) != item_fingerprint({**same, "offer_price": 29.99})
+
+
+def test_validators_sent_on_next_run(config_file, store_path):
+    spider = open_spider(config_file, store_path)
+    spider.recrawl_store.record(URL, "fingerprint", '"v1"')
+    request = spider.detail_request(URL)
+    assert request.headers.get("If-None-Match") == b'"v1"'
+    assert 304 in request.meta["handle_httpstatus_list"]
+
+
+def test_not_modified_page(config_file, store_path):
+    spider = open_spider(config_file, store_path)
+    items, requests = crawl_page(spider, status=304, body=b"")
+    assert items == [] and requests == []
+    assert spider.crawler.stats.get_value("recrawl/not_modified") == 1
+
+
+def test_unchanged_product_still_follows_pagination(config_file, store_path):
+    items, requests = crawl_page(open_spider(config_file, store_path))
+    assert len(items) == 1 and len(requests) == 1
+
+    spider = open_spider(config_file, store_path)
+    items, requests = crawl_page(spider)
+    assert items == []
+    assert [request.url for request in requests] == ["https://www.example.com/robes?page=2"]
+    assert spider.crawler.stats.get_value("recrawl/unchanged") == 1
+
+
+def test_full_run_bypasses_the_store(config_file, store_path):
+    crawl_page(open_spider(config_file, store_path))
+    spider = open_spider(config_file, store_path, full="true")
+    spider.recrawl_store.record(URL, "fingerprint", '"v1"')
+    assert "If-None-Match" not in spider.detail_request(URL).headers
+    items, _ = crawl_page(spider)
+    assert len(items) == 1
@@ -0,0 +1,60 @@
+import gzip
+import json
+import sqlite3
+import pytest
+from smart_scraper.utils import config_loader
+from smart_scraper.utils.config_loader import load_config, normalize_url, read_manifest
+
+URLS = ["https://www.example.com/robe-1.html", "https://www.example.com/robe-2.html?color=blue"]
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://WWW.Example.com/robe.html?utm_source=mail&utm_medium=email", "https://www.example.com/robe.html"),
+    ("https://www.example.com/robe.html?size=M&gclid=abc&color=blue&fbclid=x", "https://www.example.com/robe.html?color=blue&size=M"),
+    ("  https://www.example.com/robe.html?_ga=1&_gl=2&msclkid=3  ", "https://www.example.com/robe.html"),
+    ("https://www.example.com/robe.html#reviews", "https://www.example.com/robe.html"),
+    ("https://www.example.com/robe.html?page=&sort=asc", "https://www.example.com/robe.html?page=&sort=asc"),
+])
+def test_tracking_parameters_and_fragments_are_removed(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_dropped_parameters_and_kept_fragments():
+    url = "https://www.example.com/robe.html?dwvar_123_color=RED&colorDisplayCode=04&size=M#black"
+    assert normalize_url(url, ["dwvar_*_color", "colorDisplayCode"]) == "https://www.example.com/robe.html?size=M"
+    assert normalize_url(url, ["dwvar_*_color"], keep_fragments=True).endswith("?colorDisplayCode=04&size=M#black")
+
+
+def test_config_colour_variants_are_crawled_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_loader, "data_path", lambda path, createdir=False: str(tmp_path))
+    config = load_config("config_northface.json")
+    assert config.removed_urls > 0
+    assert not any("color=" in str(url) for url in config.base_urls)
+
+
+def write_manifest(path, urls):
+    if path.suffix == ".db":
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE urls (url TEXT)")
+        connection.executemany("INSERT INTO urls VALUES (?)", [(url,) for url in urls + [None]])
+        connection.commit()
+        connection.close()
+        return
+    if ".jsonl" in path.suffixes:
+        # urls_spider output ("detail_url"), plain strings and "url" objects are all accepted.
+        lines = [json.dumps({"detail_url": urls[0]}), "", json.dumps(urls[1]), json.dumps({"name": "no url"})]
+    else:
+        lines = ["# product pages", urls[0], "", f"  {urls[1]}  "]
+    content = "\n".join(lines) + "\n"
+    if path.suffix == ".gz":
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.write(content)
+    else:
+        path.write_text(content, encoding="utf-8")
+
+
+@pytest.mark.parametrize("name", ["urls.txt", "urls.txt.gz", "urls.jsonl", "urls.jsonl.gz", "urls.db"])
+def test_read_manifest(tmp_path, name):
+    path = tmp_path / name
+    write_manifest(path, URLS)
+    assert list(read_manifest(str(path))) == URLS
@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+import pytest
+from scrapy.exceptions import DropItem
+from scrapy.utils.test import get_crawler
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from smart_scraper.items import ProductItem
+from smart_scraper.pipelines import UrlVerificationPipeline
+from smart_scraper.utils import url_verifier
+from smart_scraper.utils.url_verifier import UrlVerifier
+
+
+class FakeAgent:
+    """Records the requests, each one answered by firing its Deferred."""
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, uri, headers=None):
+        d = Deferred()
+        self.requests.append((method, uri.decode(), headers, d))
+        return d
+
+    def answer(self, index, code):
+        self.requests[index][3].callback(SimpleNamespace(code=code, deliverBody=lambda protocol: None))
+
+
+def make_verifier(**kwargs):
+    verifier = UrlVerifier(stats=get_crawler().stats, **kwargs)
+    verifier.agent = FakeAgent()
+    verifier.reactor = Clock()
+    return verifier
+
+
+def result(d):
+    results = []
+    d.addCallback(results.append)
+    return results[0] if results else "pending"
+
+
+def test_refused_head_is_checked_with_a_ranged_get():
+    verifier = make_verifier()
+    d = verifier.verify("https://img.example.com/1.jpg")
+    verifier.agent.answer(0, 405)
+    method, uri, headers, _ = verifier.agent.requests[1]
+    assert (method, uri) == (b"GET", "https://img.example.com/1.jpg")
+    assert headers.getRawHeaders(b"Range") == [b"bytes=0-0"]
+    verifier.agent.answer(1, 206)
+    assert result(d) is True
+    assert verifier.stats.get_value("url_verification/ranged_get") == 1
+
+
+def test_cache_ttl_and_negative_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(url_verifier.time, "time", lambda: now[0])
+    verifier = make_verifier(ttl=100, negative_ttl=10)
+    valid, invalid = "https://img.example.com/valid.jpg", "https://img.example.com/invalid.jpg"
+    checks = [verifier.verify(valid), verifier.verify(invalid)]
+    verifier.agent.answer(0, 200)
+    verifier.agent.answer(1, 404)
+    assert [result(d) for d in checks] == [True, False]
+
+    now[0] += 50
+    assert [result(verifier.verify(url)) for url in (valid, invalid)] == [True, "pending"]
+    # Only the invalid URL expired (negative_ttl) and is checked again.
+    assert [request[1] for request in verifier.agent.requests[2:]] == [invalid]
+    verifier.agent.answer(2, 200)
+    assert verifier.cache[invalid][0] is True
+    assert verifier.stats.get_value("url_verification/cache_hit") == 1
+
+
+def test_timeouts_are_not_cached():
+    verifier = make_verifier(timeout=5)
+    url = "https://img.example.com/slow.jpg"
+    d = verifier.verify(url)
+    verifier.reactor.advance(5)
+    assert result(d) is False
+    assert url not in verifier.cache
+    assert verifier.stats.get_value("url_verification/error") == 1
+    verifier.verify(url)
+    assert len(verifier.agent.requests) == 2
+
+
+def test_concurrency_per_host():
+    verifier = make_verifier(concurrency_per_host=2)
+    checks = [verifier.verify(f"https://img.example.com/{n}.jpg") for n in range(3)]
+    checks.append(verifier.verify("https://cdn.example.com/0.jpg"))
+    # The same URL checked by another item shares its request.
+    checks.append(verifier.verify("https://img.example.com/0.jpg"))
+    started = lambda: [request[1] for request in verifier.agent.requests]
+    assert started() == ["https://img.example.com/0.jpg", "https://img.example.com/1.jpg", "https://cdn.example.com/0.jpg"]
+    verifier.agent.answer(0, 200)
+    assert started()[-1] == "https://img.example.com/2.jpg"
+    assert result(checks[0]) is True and result(checks[4]) is True
+
+
+@pytest.mark.parametrize("keep_unverified_images", [False, True])
+def test_items_without_a_valid_jsonld_image(keep_unverified_images):
+    images = ["https://img.example.com/1.jpg", "https://img.example.com/2.jpg"]
+    item = ProductItem(offer_url="https://www.example.com/robe.html", offer_image_url=list(images))
+    spider = SimpleNamespace(jsonld_image_items={item["offer_url"]})
+    verifier = SimpleNamespace(verify_many=lambda urls: succeed(dict.fromkeys(urls, False)))
+    stats = get_crawler().stats
+    pipeline = UrlVerificationPipeline(verifier, stats, keep_unverified_images)
+
+    failures = []
+    d = pipeline.process_item(item, spider)
+    d.addErrback(lambda failure: failures.append(failure.check(DropItem)))
+    if keep_unverified_images:
+        assert not failures and item["offer_image_url"] == images
+        assert stats.get_value("url_verification/unverified_items") == 1
+    else:
+        assert failures == [DropItem]
+        assert stats.get_value("incomplete/fields/offer_image_url") == 1
+
+
+def test_invalid_images_are_removed():
+    item = ProductItem(
+        offer_url="https://www.example.com/robe.html",
+        offer_image_url=["https://img.example.com/1.jpg", "https://img.example.com/2.jpg"],
+        vendor_icon_url="https://www.example.com/favicon.ico",
+    )
+    spider = SimpleNamespace(jsonld_image_items={item["offer_url"]})
+    verifier = SimpleNamespace(verify_many=lambda urls: succeed({url: "1.jpg" in url for url in urls}))
+    pipeline = UrlVerificationPipeline(verifier)
+    assert result(pipeline.process_item(item, spider)) is item
+    assert item["offer_image_url"] == ["https://img.example.com/1.jpg"]
+    assert item["vendor_icon_url"] is None